@@ -0,0 +1,241 @@
+"""
+Micro-benchmarks for the per-turn overhead the agent adds on top of model latency.
+
+Runs offline against a stub model, measuring prompt building, memory eviction,
+retrieval over indexed turns, tool-call parsing, tool dispatch and transcript
+writing at increasing sizes.
+Results are saved as JSON and compared against a stored baseline. Every run also
+times a fixed calibration workload, and results are compared relative to it, so
+a slower or busier machine does not read as a regression.
+
+Usage (from the project root):
+    python benchmarks/bench_agent.py                      # run and compare with the baseline
+    python benchmarks/bench_agent.py --update-baseline    # run and store the results as the new baseline
+    python benchmarks/bench_agent.py --sizes 10 100 --output results.json
+"""
+from typing import Any, Callable, Dict, List
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from src.agent import Agent
+from src.config import Config
+from src.retrieval import RetrievalMemory
+from src.tools import Tool
+
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "baseline.json")
+DEFAULT_SIZES = [10, 100, 1000]
+# a benchmark regresses when its fastest sample, relative to the calibration
+# workload, is this many times the baseline's
+DEFAULT_TOLERANCE = 1.5
+# used by the calibration workload
+CALIBRATION_PATTERN = re.compile(r"(\w+)\((.*)\)")
+# shortest sample, so timer resolution and scheduling jitter stay small beside it
+MIN_SAMPLE_US = 2000
+
+class StubModel:
+    """Model that answers instantly, so only the agent's own work is timed."""
+    async def chat_completion(self, messages, **kwargs):
+        return "Stub response."
+
+    async def aclose(self):
+        pass
+
+def echo_tool(arg: str = "") -> str:
+    return f"Echo: {arg}"
+
+def make_agent(size: int, layout: str = "legacy", transcript_file: str = None) -> Agent:
+    """Agent whose short-term memory holds `size` messages and whose budgets never trim them."""
+    tools = [Tool(f"Tool{i}", echo_tool, f"Echoes its argument. Usage: return 'Tool{i}(text)'", mode="inline") for i in range(8)]
+    agent = Agent(tools, "You are a benchmark agent.", model=StubModel(), transcript_file=transcript_file, config=Config({}))
+    agent._prompt_layout = layout
+    agent._disable_long_memory = True
+    agent._max_short_memory = size
+    agent._max_short_memory_tokens = size * 64
+    agent._max_long_memory = size * 16
+    agent.long_memory = "Summary of earlier turns. " * size
+    for i in range(size // 2):
+        agent._remember(f"Question number {i} about the project?", f"Answer number {i}, with a few more words of detail.")
+    return agent
+
+def time_calls(func: Callable[[], Any], number: int) -> float:
+    """Microseconds per call of `number` calls."""
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1e6
+
+def calibration_workload() -> int:
+    """Fixed mix of the work the agent does per turn: dicts, string joins and regex matching."""
+    messages = [{"role": "user", "content": f"Question number {i}?", "tokens": i} for i in range(50)]
+    text = "\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in messages)
+    calls = [CALIBRATION_PATTERN.match(f"Tool{i}(argument {i})") for i in range(50)]
+    return len(text) + sum(message["tokens"] for message in messages) + len(calls)
+
+def autorange(func: Callable[[], Any]) -> int:
+    """Calls per sample needed for a sample to take at least MIN_SAMPLE_US."""
+    number = 1
+    while time_calls(func, number) * number < MIN_SAMPLE_US:
+        number *= 2
+    return number
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """
+    Time `func` `repeat` times, each sample long enough to be stable, and report microseconds per call.
+
+    Each sample is preceded by a sample of the calibration workload, and `relative`
+    is the fastest sample over the fastest calibration sample: the machine's speed
+    at that moment cancels out, so it can be compared across runs and machines.
+    """
+    number = autorange(func)
+    calibration_number = autorange(calibration_workload)
+    samples = []
+    calibration = []
+    for _ in range(repeat):
+        calibration.append(time_calls(calibration_workload, calibration_number))
+        samples.append(time_calls(func, number))
+    return {
+        "median_us": statistics.median(samples),
+        "min_us": min(samples),
+        "max_us": max(samples),
+        "relative": min(samples) / min(calibration),
+    }
+
+# # # # benchmarks # # # #
+
+def bench_build_prompt(size: int, layout: str) -> Callable[[], Any]:
+    agent = make_agent(size, layout)
+    return lambda: agent._build_prompt("What changed since the last turn?")
+
+def bench_handle_memory(size: int, layout: str) -> Callable[[], Any]:
+    # memory stays full, so every turn evicts
+    agent = make_agent(size, layout)
+    return lambda: agent._handle_memory("One more question?", "One more answer.")
+
+def bench_retrieve(size: int) -> Callable[[], Any]:
+    # ten indexed turns per message of short-term memory, so the largest size searches 10k turns
+    agent = make_agent(size)
+    agent.retrieval_memory = RetrievalMemory()
+    topics = ["deploy", "database", "billing", "login", "search", "cache", "email", "export"]
+    for i in range(size * 10):
+        topic = topics[i % len(topics)]
+        agent.retrieval_memory.add(f"How is the {topic} step {i} going?", f"The {topic} step {i} is done.", 32)
+    return lambda: agent._build_prompt("Did the billing export finish?")
+
+def bench_parse_response(size: int) -> Callable[[], Any]:
+    # plain prose that is not a tool call
+    agent = make_agent(0)
+    response = "\n".join(f"Line {i} of a long answer (with parentheses) that is not a tool call." for i in range(size))
+    return lambda: agent._parse_tool_calls(response)
+
+def bench_parse_batch(size: int) -> Callable[[], Any]:
+    # one tool call per line
+    agent = make_agent(0)
+    response = "\n".join(f"Tool{i % 8}(argument {i})" for i in range(size))
+    return lambda: agent._parse_tool_calls(response)
+
+def bench_dispatch_tools(size: int) -> Callable[[], Any]:
+    agent = make_agent(0)
+    tool_calls = [(f"Tool{i % 8}", f"argument {i}") for i in range(size)]
+    loop = asyncio.new_event_loop()
+    return lambda: loop.run_until_complete(agent._run_tools(tool_calls))
+
+def bench_write_transcript(size: int, directory: str) -> Callable[[], Any]:
+    agent = make_agent(0, transcript_file=os.path.join(directory, f"transcript_{size}.txt"))
+    agent.start_transcript()
+    user_input = "A question of ordinary length? " * (size // 10 + 1)
+    result = "An answer of ordinary length. " * (size // 10 + 1)
+    return lambda: agent.log_interaction(user_input, result)
+
+def run_benchmarks(sizes: List[int], repeat: int) -> Dict[str, Dict[str, float]]:
+    """Run every benchmark at every size."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            cases = {
+                f"build_prompt[legacy,{size}]": bench_build_prompt(size, "legacy"),
+                f"build_prompt[prefix_cache,{size}]": bench_build_prompt(size, "prefix_cache"),
+                f"handle_memory[legacy,{size}]": bench_handle_memory(size, "legacy"),
+                f"handle_memory[prefix_cache,{size}]": bench_handle_memory(size, "prefix_cache"),
+                f"build_prompt[retrieval,{size}]": bench_retrieve(size),
+                f"parse_response[{size}]": bench_parse_response(size),
+                f"parse_batch[{size}]": bench_parse_batch(size),
+                f"dispatch_tools[{size}]": bench_dispatch_tools(size),
+                f"write_transcript[{size}]": bench_write_transcript(size, directory),
+            }
+            for name, func in cases.items():
+                results[name] = measure(func, repeat)
+                print(f"{name:<40} {results[name]['median_us']:>12.1f} us {results[name]['relative']:>10.3f}")
+    return results
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """
+    Benchmarks whose time relative to the calibration workload grew past `tolerance` times the baseline's.
+
+    Benchmarks missing from the baseline are reported too, so a new or renamed one
+    cannot pass unchecked.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            regressions.append(f"{name}: not in the baseline, run with --update-baseline to add it")
+            continue
+        ratio = result["relative"] / max(baseline[name]["relative"], 1e-9)
+        if ratio > tolerance:
+            regressions.append(
+                f"{name}: {baseline[name]['relative']:.2f} -> {result['relative']:.2f} calibration units ({ratio:.2f}x)"
+            )
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the agent's per-turn overhead.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="memory/response sizes to run")
+    parser.add_argument("--repeat", type=int, default=15, help="samples per benchmark")
+    parser.add_argument("--output", help="where to save the results as JSON")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown relative to the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": run_benchmarks(args.sizes, args.repeat),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --update-baseline to create one.")
+        return 0
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(report["results"], baseline, args.tolerance)
+    if regressions:
+        print("Regressions or missing entries against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("No regressions against the baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
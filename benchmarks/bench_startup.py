@@ -0,0 +1,103 @@
+"""
+Cold-start benchmark: time to import the agent and build a model interface in a fresh interpreter.
+
+Each case runs in its own Python process, so nothing is already imported. The
+"eager providers" case imports every provider module the way the model interface
+used to, as a reference for what lazy provider imports save.
+
+Usage (from the project root):
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 10 --output startup.json
+"""
+from typing import Any, Dict, List
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+PROVIDERS = ["ollama", "lmstudio", "nexa", "anythingllm"]
+# third party packages whose import dominates start-up
+HEAVY_MODULES = ["openai", "httpx", "yaml"]
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": [name for name in {modules!r} if name in sys.modules]}}))
+"""
+
+def model_code(provider: str) -> str:
+    """Build a model interface for one provider, with everything that touches disk turned off."""
+    config = {
+        "MODEL_PROVIDER": provider,
+        "CACHE_ENABLED": False,
+        "TELEMETRY": "none",
+        "NEXA_API_KEY": "nexa",
+        "ANYTHINGLLM_API_KEY": "stub",
+    }
+    return (
+        "from src.agent import Agent\n"
+        "from src.config import Config\n"
+        "from src.model import ModelInterface\n"
+        f"ModelInterface(Config({config!r}))"
+    )
+
+def cases() -> Dict[str, str]:
+    """Benchmark name -> code timed in a fresh interpreter."""
+    eager = "\n".join(f"import src.servers.{provider}" for provider in PROVIDERS)
+    return {
+        "import agent": "import src.agent",
+        "import agent + eager providers": f"import src.agent\n{eager}",
+        **{f"agent + model[{provider}]": model_code(provider) for provider in PROVIDERS},
+    }
+
+def run_case(code: str) -> Dict[str, Any]:
+    """Run one case in a new interpreter and return its timing and loaded heavy modules."""
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(code=code, modules=HEAVY_MODULES)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def run_benchmarks(repeat: int) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for name, code in cases().items():
+        samples: List[float] = []
+        modules: List[str] = []
+        for _ in range(repeat):
+            result = run_case(code)
+            samples.append(result["seconds"] * 1000)
+            modules = result["modules"]
+        results[name] = {"median_ms": statistics.median(samples), "min_ms": min(samples), "modules": modules}
+        print(f"{name:<34} {results[name]['median_ms']:>9.1f} ms   {', '.join(modules) or '-'}")
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark agent cold start.")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per case")
+    parser.add_argument("--output", help="where to save the results as JSON")
+    args = parser.parse_args()
+
+    print(f"{'case':<34} {'median':>12}   heavy modules loaded")
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": run_benchmarks(args.repeat),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+End-to-end load test of the agent against the bundled stub model server.
+
+For each provider client, starts a stub server, points the client at it and
+drives N concurrent agent sessions through `Agent.chat_completion`, reporting
+p50/p95/p99 turn latency, throughput and failure rate.
+
+Usage (from the project root):
+    python benchmarks/load_test.py --sessions 32 --turns 5 --ttft 0.05 --token-delay 0.005
+    python benchmarks/load_test.py --providers ollama nexa --stream --error-rate 0.05 --output load.json
+    python benchmarks/load_test.py --providers ollama --backends 2 --error-rate 0.1
+"""
+from typing import Any, Dict, List
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stub_server import StubModelServer
+from src.agent import Agent
+from src.config import Config, load_config
+from src.model import ModelInterface
+
+PROVIDERS = ["ollama", "lmstudio", "nexa", "anythingllm"]
+
+def stub_urls(url: str) -> Dict[str, str]:
+    """Provider URL settings pointing every client at one stub server."""
+    return {
+        "OLLAMA_URL": f"{url}/v1",
+        "LM_STUDIO_URL": f"{url}/v1",
+        "NEXA_URL": f"{url}/v1/chat/completions",
+        "ANYTHINGLLM_URL": f"{url}/api/v1",
+    }
+
+def provider_config(base: Dict[str, Any], provider: str, urls: List[str]) -> Config:
+    """
+    Copy of the configuration routing `provider` across the stub servers.
+
+    The response cache and request coalescing are off: every session asks the same
+    questions, and a turn answered without reaching a backend would measure neither.
+    """
+    config = dict(base)
+    config.update({"MODEL_PROVIDER": provider, "CACHE_ENABLED": False, "COALESCE_REQUESTS": False, **stub_urls(urls[0])})
+    config["BACKENDS"] = [{"NAME": f"stub-{i}", **stub_urls(url)} for i, url in enumerate(urls)] if len(urls) > 1 else None
+    for key, placeholder in (("OLLAMA_API_KEY", "ollama"), ("LM_STUDIO_API_KEY", "lm-studio"),
+                             ("NEXA_API_KEY", "nexa"), ("ANYTHINGLLM_API_KEY", "stub")):
+        config.setdefault(key, placeholder)
+    return Config(config)
+
+def is_failure(result: str) -> bool:
+    """Provider clients report some failures as the response text, or as an empty stream."""
+    return not result.strip() or result.startswith(("Chat request failed", "Response is not valid JSON"))
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+async def run_session(agent: Agent, turns: int, latencies: List[float], failures: List[str]) -> None:
+    """Drive one session through its turns, recording each turn's latency or failure."""
+    for turn in range(turns):
+        start = time.perf_counter()
+        try:
+            result = await agent.chat_completion(f"Load test question {turn}?")
+        except Exception as e:
+            failures.append(f"{type(e).__name__}: {e}")
+            continue
+        if is_failure(result):
+            failures.append(result)
+        else:
+            latencies.append(time.perf_counter() - start)
+
+async def load_test_provider(provider: str, base_config: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the load test for one provider client and summarize it."""
+    servers = [
+        StubModelServer(ttft=args.ttft, token_delay=args.token_delay, error_rate=args.error_rate, seed=args.seed + i)
+        for i in range(args.backends)
+    ]
+    for server in servers:
+        await server.start()
+    config = provider_config(base_config, provider, [server.url for server in servers])
+    model = ModelInterface(config)
+    agents = []
+    for _ in range(args.sessions):
+        agent = Agent([], "You are a load test agent.", model=model, transcript_file=os.devnull, config=config)
+        agent._stream = args.stream
+        agents.append(agent)
+
+    latencies: List[float] = []
+    failures: List[str] = []
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_session(agent, args.turns, latencies, failures) for agent in agents))
+        elapsed = time.perf_counter() - start
+    finally:
+        await model.aclose()
+        for server in servers:
+            await server.aclose()
+
+    total = args.sessions * args.turns
+    requests = sum(server.stats["requests"] for server in servers)
+    errors = sum(server.stats["errors"] for server in servers)
+    # every turn reaches a backend once, plus one request per retried error (and per hedge)
+    answered = requests - errors
+    if requests < total or (answered < len(latencies) if config.get("HEDGE_PERCENTILE") else answered != len(latencies)):
+        raise RuntimeError(
+            f"{provider}: the stub servers saw {requests} requests ({errors} failed) for {total} turns "
+            f"({len(latencies)} answered), so turns were not measured against the backends"
+        )
+    return {
+        "turns": total,
+        "failures": len(failures),
+        "failure_rate": len(failures) / total if total else 0.0,
+        "throughput_turns_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "server_requests": requests,
+        "server_errors": errors,
+        "backends": model.backend_stats(),
+        "coalesced": model.coalesce_stats(),
+        "sample_failures": sorted(set(failures))[:3],
+    }
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the agent against the stub model server.")
+    parser.add_argument("--providers", nargs="+", choices=PROVIDERS, default=PROVIDERS)
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent agent sessions")
+    parser.add_argument("--turns", type=int, default=5, help="turns per session")
+    parser.add_argument("--stream", action="store_true", help="stream responses token by token")
+    parser.add_argument("--backends", type=int, default=1, help="stub servers to route each provider across")
+    parser.add_argument("--ttft", type=float, default=0.05, help="stub seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="stub seconds between tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub requests failed with a 500")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the error injection")
+    parser.add_argument("--output", help="where to save the report as JSON")
+    parser.add_argument("--config", help="settings file to start from, e.g. config.yaml; defaults when omitted")
+    args = parser.parse_args()
+
+    # explicit settings, so a local config.yaml never changes what is measured
+    base_config = load_config(args.config) if args.config else {}
+
+    report = {"settings": vars(args), "providers": {}}
+    print(f"{'provider':<12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'turns/s':>9} {'failures':>9}")
+    for provider in args.providers:
+        summary = await load_test_provider(provider, base_config, args)
+        report["providers"][provider] = summary
+        print(
+            f"{provider:<12} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} "
+            f"{summary['throughput_turns_per_sec']:>9.1f} {summary['failure_rate']:>8.1%}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,258 @@
+"""
+Local stub of the model servers the provider clients talk to.
+
+Serves the OpenAI chat-completions API (used by the Ollama, LM Studio and Nexa
+clients), Ollama's model loading route and AnythingLLM's workspace chat routes,
+answering with canned text at a configurable time-to-first-token and per-token
+delay. A share of requests can be failed on purpose to exercise error handling.
+
+Usage (from the project root):
+    python benchmarks/stub_server.py --port 1234 --ttft 0.2 --token-delay 0.02 --error-rate 0.01
+"""
+from typing import Any, Dict, List, Optional
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from src.service import HTTPError, STATUS_TEXT, read_request, write_response
+
+DEFAULT_RESPONSE = "This is a canned response from the stub model server, streamed one word at a time."
+
+class StubModelServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ttft: float = 0.0,
+        token_delay: float = 0.0,
+        error_rate: float = 0.0,
+        response: str = DEFAULT_RESPONSE,
+        seed: Optional[int] = None
+    ):
+        """
+        Args:
+            host (str): Interface to listen on.
+            port (int): Port to listen on, 0 to pick a free one.
+            ttft (float): Seconds before the first token.
+            token_delay (float): Seconds between tokens after the first.
+            error_rate (float): Share of requests answered with a 500 error.
+            response (str): Text returned for every request, split into word tokens.
+            seed (int, optional): Seed for the error injection, for repeatable runs.
+        """
+        self.host = host
+        self.port = port
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.tokens = [word + " " for word in response.split()]
+        self.tokens[-1] = self.tokens[-1].rstrip()
+        self._random = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.stats = {"requests": 0, "errors": 0}
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        """Start listening, resolving port 0 to the port actually bound."""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def aclose(self) -> None:
+        """Stop listening and close open connections."""
+        if self._server is not None:
+            self._server.close()
+            if hasattr(self._server, "close_clients"):
+                self._server.close_clients()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve keep-alive requests on one connection until the client closes it."""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    await write_response(writer, e.status, {"error": e.message})
+                    return
+                if request is None:
+                    return
+                method, path, _, body = request
+                await self._route(writer, method, path.split("?", 1)[0], body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes) -> None:
+        """Dispatch a request to the OpenAI or AnythingLLM handler."""
+        if method == "GET" and path.endswith("/models"):
+            await write_response(writer, 200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+            return
+        if method == "GET" and path.endswith("/auth"):
+            await write_response(writer, 200, {"authenticated": True})
+            return
+        if method != "POST":
+            await write_response(writer, 405, {"error": "Method not allowed"})
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            await write_response(writer, 400, {"error": "Body must be JSON"})
+            return
+
+        self.stats["requests"] += 1
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            await write_response(writer, 500, {"error": {"message": "Injected stub server error"}})
+            return
+
+        if path.endswith("/chat/completions"):
+            await self._openai_chat(writer, payload)
+        elif path.endswith("/api/generate"):
+            await self._ollama_load(writer, payload)
+        elif "/workspace/" in path and path.endswith("/stream-chat"):
+            await self._anythingllm_stream_chat(writer)
+        elif "/workspace/" in path and path.endswith("/chat"):
+            await self._anythingllm_chat(writer)
+        else:
+            await write_response(writer, 404, {"error": "Not found"})
+
+    # # # # OpenAI chat completions # # # #
+
+    async def _openai_chat(self, writer: asyncio.StreamWriter, payload: Dict[str, Any]) -> None:
+        prompt_tokens = self._prompt_tokens(payload.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(self.tokens),
+            "total_tokens": prompt_tokens + len(self.tokens),
+        }
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": payload.get("model", "stub")}
+
+        if not payload.get("stream"):
+            await self._generate()
+            await write_response(writer, 200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(self.tokens)}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        await self._start_stream(writer)
+        chunk = {**base, "object": "chat.completion.chunk"}
+        async for token in self._stream_tokens():
+            await self._send_event(writer, {**chunk, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+        await self._send_event(writer, {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            await self._send_event(writer, {**chunk, "choices": [], "usage": usage})
+        await self._send_event(writer, "[DONE]")
+        await self._end_stream(writer)
+
+    # # # # Ollama native API # # # #
+
+    async def _ollama_load(self, writer: asyncio.StreamWriter, payload: Dict[str, Any]) -> None:
+        """A generate request without a prompt only loads the model."""
+        await asyncio.sleep(self.ttft)
+        await write_response(writer, 200, {
+            "model": payload.get("model", "stub"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "response": "",
+            "done": True,
+            "done_reason": "load",
+        })
+
+    # # # # AnythingLLM workspace chat # # # #
+
+    async def _anythingllm_chat(self, writer: asyncio.StreamWriter) -> None:
+        await self._generate()
+        await write_response(writer, 200, {
+            "id": str(uuid.uuid4()),
+            "type": "textResponse",
+            "textResponse": "".join(self.tokens),
+            "sources": [],
+            "close": True,
+            "error": None,
+            "metrics": {"completion_tokens": len(self.tokens)},
+        })
+
+    async def _anythingllm_stream_chat(self, writer: asyncio.StreamWriter) -> None:
+        chunk_id = str(uuid.uuid4())
+        await self._start_stream(writer)
+        async for token in self._stream_tokens():
+            await self._send_event(writer, {"uuid": chunk_id, "type": "textResponseChunk", "textResponse": token, "sources": [], "close": False, "error": False})
+        await self._send_event(writer, {"uuid": chunk_id, "type": "textResponseChunk", "textResponse": "", "sources": [], "close": True, "error": False})
+        await self._end_stream(writer)
+
+    # # # # generation and streaming helpers # # # #
+
+    async def _generate(self) -> None:
+        """Wait as long as generating the whole response would take."""
+        await asyncio.sleep(self.ttft + self.token_delay * (len(self.tokens) - 1))
+
+    async def _stream_tokens(self):
+        """Yield the response tokens at the configured pace."""
+        await asyncio.sleep(self.ttft)
+        for i, token in enumerate(self.tokens):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield token
+
+    def _prompt_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        return sum(len(str(message.get("content", "")).split()) for message in messages)
+
+    async def _start_stream(self, writer: asyncio.StreamWriter) -> None:
+        head = (
+            f"HTTP/1.1 200 {STATUS_TEXT[200]}\r\n"
+            "Content-Type: text/event-stream\r\n"
+            "Cache-Control: no-cache\r\n"
+            "Transfer-Encoding: chunked\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1"))
+        await writer.drain()
+
+    async def _send_event(self, writer: asyncio.StreamWriter, payload: Any) -> None:
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        event = f"data: {data}\n\n".encode("utf-8")
+        writer.write(f"{len(event):x}\r\n".encode("latin-1") + event + b"\r\n")
+        await writer.drain()
+
+    async def _end_stream(self, writer: asyncio.StreamWriter) -> None:
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible, Nexa and AnythingLLM model server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--ttft", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failed with a 500")
+    args = parser.parse_args()
+
+    server = StubModelServer(args.host, args.port, args.ttft, args.token_delay, args.error_rate)
+    await server.start()
+    print(f"Stub model server listening on {server.url}")
+    print(f"  OpenAI/Ollama/LM Studio: {server.url}/v1   Nexa: {server.url}/v1/chat/completions")
+    print(f"  AnythingLLM: {server.url}/api/v1")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.aclose()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Goodbye!")
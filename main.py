@@ -1,7 +1,9 @@
+import argparse
 import asyncio
 
 from src.agent import Agent
-from src.tools import tools, tool_descriptions
+from src.config import load_config
+from src.tools import tool_cache, tools, tool_descriptions
 
 def agent_identity() -> str:
     """Build the agent identity with system prompt and instructions."""
@@ -14,15 +16,28 @@ def agent_identity() -> str:
         "When you decide to use a tool, respond with the format:"
         "'ToolName(arg)' where ToolName is the name of the tool and arg is the argument to pass to the tool."
         "If the tool does not require an argument, use 'ToolName()'.\n"
-        "Only use one tool per response.\n"
+        "To use several tools at once, put each tool call on its own line and nothing else in the response.\n"
     )
     return system_prompt + instructions
 
 def main():
+    parser = argparse.ArgumentParser(description="Chat with the local agent.")
+    parser.add_argument("--session", help="session to resume from SESSION_STORE (default: SESSION_ID)")
+    parser.add_argument("--load-transcript", metavar="PATH", help="replay a transcript into memory before chatting")
+    args = parser.parse_args()
+
+    config = load_config()
+    # the tool result cache is shared by the whole process, so it is sized once here
+    tool_cache.resize(config.get("TOOL_CACHE_SIZE", 512))
     agent = Agent(
         tools=tools,
-        identity=agent_identity()
+        identity=agent_identity(),
+        config=config,
+        session_id=args.session
     )
+    if args.load_transcript:
+        turns = agent.load_transcript(args.load_transcript)
+        print(f"Loaded {turns} interactions from {args.load_transcript}.")
     agent.run()
 
 if __name__ == "__main__":
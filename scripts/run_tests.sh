@@ -38,15 +38,13 @@ done
 tests=()
 if $a_flag || (! $a_flag && ! $c_flag && ! $l_flag && ! $o_flag); then tests+=("tests/test_anythingllm.py"); fi
 if $c_flag || (! $a_flag && ! $c_flag && ! $l_flag && ! $o_flag); then
-  tests+=("tests/core/test_agent.py")
-  tests+=("tests/core/test_model.py")
-  tests+=("tests/core/test_tools.py")
+  tests+=("tests/core")
 fi
 if $l_flag || (! $a_flag && ! $c_flag && ! $l_flag && ! $o_flag); then tests+=("tests/test_lmstudio.py"); fi
 if $o_flag || (! $a_flag && ! $c_flag && ! $l_flag && ! $o_flag); then tests+=("tests/test_ollama.py"); fi
 
 if [ ${#tests[@]} -eq 0 ]; then
-  tests=("tests/test_anythingllm.py" "tests/test_lmstudio.py" "tests/test_ollama.py" "tests/core/test_agent.py" "tests/core/test_model.py" "tests/core/test_tools.py")
+  tests=("tests/test_anythingllm.py" "tests/test_lmstudio.py" "tests/test_ollama.py" "tests/core")
 fi
 
 echo "Running pytest for: ${tests[*]}"
@@ -0,0 +1,14 @@
+import asyncio
+
+from main import agent_identity
+from src.service import serve
+from src.tools import tools
+
+def main():
+    try:
+        asyncio.run(serve(tools, agent_identity()))
+    except KeyboardInterrupt:
+        print("Goodbye!")
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,150 @@
 import asyncio
+import inspect
 import os
 import re
-import yaml
+import time
 
-from typing import List
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from src.compaction import MemoryCompactor
+from src.config import Config, load_config
 from src.model import ModelInterface
+from src.retrieval import RetrievalMemory
+from src.sandbox import get_process_pool, shutdown_process_pool
+from src.servers.base import Completion, DeadlineExceeded, remaining
+from src.session_store import MEMORY, TURN, SessionStore
+from src.telemetry import configure_tracer, get_tracer
+from src.tokens import load_token_counter
 from src.tools import Tool
+from src.transcript import TranscriptWriter, read_transcript
+
+# the start of a tool call after any whitespace, e.g. "Tim" or "Search(que"
+TOOL_CALL_PREFIX_PATTERN = re.compile(r"\s*(\w*)(\()?")
+# a tool name and its opening parenthesis, after any whitespace
+TOOL_CALL_START_PATTERN = re.compile(r"\s*(\w+)\(")
+# a whole call whose argument holds no parentheses, e.g. "Search(query)"
+SIMPLE_TOOL_CALL_PATTERN = re.compile(r"\s*(\w+)\(([^()]*)\)")
+# the same on the line after an earlier call
+BATCHED_TOOL_CALL_PATTERN = re.compile(r"[ \t\r]*\n\s*(\w+)\(([^()]*)\)")
+# parentheses counted to find the end of any other argument
+PAREN_PATTERN = re.compile(r"[()]")
+# the rest of a tool call's line, after which the next call of a batch may start
+LINE_END_PATTERN = re.compile(r"[ \t\r]*\n")
+# nothing but whitespace yet after the last call
+BLANK_PATTERN = re.compile(r"\s*")
+# receives streamed response text; a coroutine callback is awaited, so a slow consumer slows the stream
+TokenCallback = Callable[[str], Optional[Awaitable[None]]]
+# tokens spent on role markers and separators around each prompt message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TRANSCRIPT_HEADER = "Agent Transcript\n================\n\n"
+TRANSCRIPT_FOOTER = "================\n\n"
+# one logged interaction, as written by `log_interaction()`
+TRANSCRIPT_ENTRY_PATTERN = re.compile(r"You: (.*?)\n\nAgent: (.*?)\n\n(?=You: |\Z)", re.DOTALL)
+
+def scan_tool_call(text: str, start: int = 0) -> Optional[Tuple[str, str, int]]:
+    """
+    Parse the tool call at `text[start:]` as soon as its parentheses balance.
+
+    Returns the tool name, its argument and the offset just past the closing
+    parenthesis, or None while the call is incomplete or the text is not a call.
+    """
+    # most arguments hold no parentheses, and need no counting
+    match = SIMPLE_TOOL_CALL_PATTERN.match(text, start)
+    if match is not None:
+        return match.group(1), match.group(2), match.end()
+    match = TOOL_CALL_START_PATTERN.match(text, start)
+    if match is None:
+        return None
+    depth = 1
+    for paren in PAREN_PATTERN.finditer(text, match.end()):
+        depth += 1 if paren.group() == "(" else -1
+        if depth == 0:
+            return match.group(1), text[match.end():paren.start()], paren.end()
+    return None
 
 class Agent:
     def __init__(
         self,
         tools: List[Tool],
-        identity: str
+        identity: str,
+        model: Optional[ModelInterface] = None,
+        transcript_file: Optional[str] = None,
+        config: Optional[Config] = None,
+        session_id: Optional[str] = None,
+        session_store: Optional[SessionStore] = None
     ):
-        # temporarily read in the configuration for the agent
-        # TODO: scope the configuration to only read the agent vars into a dict
-        with open("config.yaml", "r") as f:
-            config = yaml.safe_load(f)
+        """
+        Args:
+            tools (List[Tool]): Tools the agent may call.
+            identity (str): System instructions for the agent.
+            model (ModelInterface, optional): Model to use, e.g. one shared by many sessions.
+                A new one is created from config.yaml when omitted.
+            transcript_file (str, optional): Where to write the transcript, timestamped by default.
+            config (Config, optional): Settings shared with the model, read from config.yaml when omitted.
+            session_id (str, optional): Session to persist and resume, SESSION_ID by default.
+            session_store (SessionStore, optional): Store shared by many sessions. One is opened
+                at SESSION_STORE when omitted, and sessions are not persisted if neither is set.
+        """
+        # read the configuration once; a model created here reuses it
+        if config is None:
+            config = load_config()
 
         # # # # core agent configuration # # # #
         # model used by the agent
-        self.model = ModelInterface()
+        self.model = model or ModelInterface(config)
 
         # tools available to the agent
         self.tools = {tool.name: tool for tool in tools}
+        self._tool_timeout = config.get("TOOL_TIMEOUT", 30) # seconds
+
+        # warm the sandboxed worker pool up front if any tool needs it
+        if any(tool.mode == "process" for tool in tools):
+            get_process_pool(
+                config.get("TOOL_PROCESS_WORKERS", 2),
+                config.get("TOOL_MEMORY_LIMIT_MB", 512)
+            )
+
+        # spans and metrics, a no-op unless TELEMETRY is set
+        configure_tracer(config)
+
+        # counts tokens for the prompt budgets below
+        self.token_counter = load_token_counter(config.get("TOKENIZER", "estimate"))
+
+        # system instructions for the agent, trimmed to its budget once up front
+        self._max_identity_tokens = config.get("IDENTITY_TOKENS", 2048) # tokens
+        self.core_identity = self.token_counter.truncate(identity, self._max_identity_tokens)
+
+        # stream tokens from the model as they are generated
+        self._stream = config.get("STREAM", False)
+        # while streaming, start each tool call once its closing parenthesis arrives and
+        # stop generating as soon as the rest of the response cannot add another call
+        self._speculative_tools = config.get("SPECULATIVE_TOOLS", True)
 
-        # system instructions for the agent
-        self.core_identity = identity
+        # output budgets per call type, so no call decodes more than it can use:
+        # responses (a tool call or the final answer) stop at RESPONSE_MAX_TOKENS or a
+        # RESPONSE_STOP sequence, summaries at the compactor's chunk size
+        self._response_generation = {
+            name: value for name, value in {
+                "max_tokens": config.get("RESPONSE_MAX_TOKENS", 1024),
+                "stop": config.get("RESPONSE_STOP", None),
+            }.items() if value is not None
+        }
+        # a smaller, faster model can write the summaries
+        self._summary_model = config.get("SUMMARY_MODEL", None)
+
+        # seconds a whole turn may take (model calls and tools), None for no limit
+        self._turn_timeout = config.get("TURN_TIMEOUT", None)
+
+        # load the model before the first turn instead of during it
+        self._warmup = config.get("WARMUP", False)
+        # and keep it loaded while idle, with or without the warm-up
+        self._keep_warm = bool(config.get("KEEP_WARM_INTERVAL", None))
+
+        # "legacy" flattens history into system messages, "prefix_cache" keeps the
+        # prompt prefix byte-stable so servers can reuse their cached prefix state
+        self._prompt_layout = config.get("PROMPT_LAYOUT", "legacy")
+        if self._prompt_layout not in {"legacy", "prefix_cache"}:
+            raise ValueError(f"Unsupported PROMPT_LAYOUT: {self._prompt_layout}")
         # # # # # # # # # # # # # # # # # # # #
 
         # # # # agent memory management # # # #
@@ -35,90 +153,391 @@ class Agent:
         self._disable_long_memory = config.get("DISABLE_LONG_MEMORY", True)
 
         self.short_memory = []
+        # running total of the messages' token counts, kept in step by `_remember()`
+        self._short_memory_tokens = 0
         self._max_short_memory = config.get("SHORT_MEMORY_SIZE", 20) # messages
+        self._max_short_memory_tokens = config.get("SHORT_MEMORY_TOKENS", 2048) # tokens
+        self._max_user_input_tokens = config.get("USER_INPUT_TOKENS", 1024) # tokens
         self._disable_short_memory = config.get("DISABLE_SHORT_MEMORY", False)
+
+        # every past turn indexed for relevance, so prompts carry the earlier turns
+        # that matter to the current input rather than only the newest ones
+        self.retrieval_memory: Optional[RetrievalMemory] = None
+        if config.get("RETRIEVAL_MEMORY", False):
+            self.retrieval_memory = RetrievalMemory(max_turns=config.get("RETRIEVAL_MAX_TURNS", None))
+        self._retrieval_top_k = config.get("RETRIEVAL_TOP_K", 4) # turns
+        self._max_retrieval_tokens = config.get("RETRIEVAL_TOKENS", 1024) # tokens
+
+        # long-term memory as levels of bounded chunk summaries rolled up like a tree
+        self.compactor = MemoryCompactor(
+            self._summarize,
+            self.token_counter,
+            self._max_long_memory,
+            chunk_tokens=config.get("COMPACTION_CHUNK_TOKENS", 256),
+            fanout=config.get("COMPACTION_FANOUT", 4)
+        )
+        self._compaction_chunk_messages = config.get("COMPACTION_CHUNK_MESSAGES", 10) # messages
+
+        # evicted messages waiting to be summarized in the background
+        self._pending_evictions = []
+        self._summary_task: Optional[asyncio.Task] = None
+        # # # # # # # # # # # # # # # # # # # #
+
+        # # # # durable session state # # # #
+        # turns remembered so far, numbering each turn in memory and in the session log
+        self._turn_count = 0
+        self.session_id = session_id or config.get("SESSION_ID", "default")
+        self.session_store = session_store
+        if self.session_store is None and config.get("SESSION_STORE"):
+            self.session_store = SessionStore(config["SESSION_STORE"])
+        self._snapshot_interval = config.get("SESSION_SNAPSHOT_INTERVAL", 50) # turns
+        self._turns_since_snapshot = 0
+        # memory is restored from the log here, so the first prompt already has it
+        self.restored_turns = self.restore_session() if self.session_store is not None else 0
         # # # # # # # # # # # # # # # # # # # #
 
         # conversation transcripts for debugging/analysis/oversight
-        self.transcript_file = f"transcripts/transcript_{self._get_timestamp()}.txt"
+        self.transcript_file = transcript_file or f"transcripts/transcript_{self._get_timestamp()}.txt"
+        # written through one buffered handle by a background writer, and rotated when large or old
+        self._transcript_settings = {
+            "flush_interval": config.get("TRANSCRIPT_FLUSH_INTERVAL", 1.0), # seconds
+            "flush_bytes": config.get("TRANSCRIPT_FLUSH_BYTES", 64 * 1024),
+            "rotate_bytes": config.get("TRANSCRIPT_ROTATE_BYTES", None),
+            "rotate_seconds": config.get("TRANSCRIPT_ROTATE_SECONDS", None),
+            "compress": config.get("TRANSCRIPT_COMPRESS", False),
+        }
+        self._transcript: Optional[TranscriptWriter] = None
+
+        # per-turn stats: time-to-first-token, tokens/sec, total time and the
+        # prompt tokens the server reused from its prefix cache
+        self.turn_stats: List[Dict[str, Optional[float]]] = []
 
     def run(self) -> None:
-        """Run the agent loop."""
-        print("Type 'exit' or 'quit' to end the chat.")
+        """Run the agent loop on a single long-lived event loop."""
+        asyncio.run(self._run())
 
-        file_header = "Agent Transcript\n================\n\n"
-        file_footer = "================\n\n"
+    async def _run(self) -> None:
+        """
+        Interactive loop driven by one event loop for the whole session.
 
-        # setup the transcript file
-        with open(self.transcript_file, "w") as f:
-            f.write(file_header)
+        Blocking console reads are pushed to the default executor so model calls,
+        tool calls and memory updates scheduled on the loop keep making progress.
+        """
+        if self._warmup:
+            print("Loading the model...")
+            warmup = await self.model.warm_up()
+            ready = [seconds for seconds in warmup.values() if seconds is not None]
+            print(f"Model ready in {max(ready):.1f}s." if ready else "Model warm-up failed, the first turn may be slow.")
+        if self._keep_warm:
+            self.model.keep_warm()
+        if self.restored_turns:
+            print(f"Resumed session '{self.session_id}' ({self.restored_turns} earlier turns).")
+        print("Type 'exit' or 'quit' to end the chat.")
+        loop = asyncio.get_running_loop()
+
+        self.start_transcript()
         
         # interaction loop
         while True:
-            user_input = input("You: ").strip()
+            user_input = (await loop.run_in_executor(None, input, "You: ")).strip()
             if user_input.lower() in {"exit", "quit"}:
                 print("Goodbye!")
                 break
-            result = asyncio.run(self.chat_completion(user_input))
-            print(f"Agent: {result}")
-
-            # log the interaction to the transcript file
-            with open(self.transcript_file, "a") as f:
-                f.write(f"You: {user_input}\n\n")
-                f.write(f"Agent: {result}\n\n")
-
-        # close the transcript file, deleting if empty
-        with open(self.transcript_file, "r") as f:
-            content = f.read()
-        if content == file_header:
-            os.remove(self.transcript_file)
-        else:
-            with open(self.transcript_file, "a") as f:
-                f.write(file_footer)
+            if self._stream:
+                # render tokens as they arrive, falling back to the result for tool calls
+                print("Agent: ", end="", flush=True)
+                rendered = []
+                def render(token: str) -> None:
+                    rendered.append(token)
+                    print(token, end="", flush=True)
+                result = await self.chat_completion(user_input, on_token=render)
+                if not rendered:
+                    print(result)
+                elif result != "".join(rendered).strip():
+                    # the stream failed partway through
+                    print(f"\n{result}")
+                else:
+                    print()
+            else:
+                result = await self.chat_completion(user_input)
+                print(f"Agent: {result}")
+
+            self.log_interaction(user_input, result)
+
+        self.end_transcript()
+
+        # finish pending summaries and release pooled provider connections
+        # while the loop is still alive
+        await self.flush_memory()
+        await self.model.aclose()
+        if self.session_store is not None:
+            self.session_store.close()
+        # stop the sandboxed tool workers rather than leaving them to interpreter teardown
+        shutdown_process_pool()
+        get_tracer().close()
+
+    def start_transcript(self) -> None:
+        """Create the transcript file with its header and start its background writer."""
+        self._transcript = TranscriptWriter(
+            self.transcript_file, TRANSCRIPT_HEADER, TRANSCRIPT_FOOTER, **self._transcript_settings
+        )
+
+    def log_interaction(self, user_input: str, result: str) -> None:
+        """Queue one interaction for the transcript file."""
+        with get_tracer().span("agent.transcript"):
+            self._transcript.write(f"You: {user_input}\n\nAgent: {result}\n\n")
+
+    def end_transcript(self) -> None:
+        """Flush and close the transcript file, deleting it if no interaction was logged."""
+        if self._transcript is not None:
+            self._transcript.close()
 
     async def chat_completion(
         self,
         user_input: str,
+        on_token: Optional[TokenCallback] = None,
     ) -> str:
         """
         Process a user input, potentially invoking tools, and manage memory.
 
         Args:
             user_input (str): The current input from the user.
+            on_token (TokenCallback, optional): Called with response text as it streams in,
+                and awaited if it returns an awaitable. Text that may still turn out to be a
+                tool call is held back.
         """
-        messages = self._build_prompt(user_input)
+        tracer = get_tracer()
+        # every model request and tool call in the turn shares one deadline
+        deadline = time.monotonic() + self._turn_timeout if self._turn_timeout else None
+        with tracer.span("agent.turn", stream=self._stream) as span:
+            with tracer.span("agent.build_prompt"):
+                messages = self._build_prompt(user_input)
 
-        tool_call_pattern = re.compile(r"^(\w+)\((.*)\)$", re.DOTALL)
+            # call the model with the initial request and check for tool calls
+            try:
+                response, started = await self._generate(messages, on_token, deadline)
+            except DeadlineExceeded:
+                # a timed out turn is reported but kept out of memory
+                span.fail("deadline exceeded")
+                return f"The model did not respond within {self._turn_timeout} seconds."
+            except Exception as e:
+                # streams raise on provider errors that blocking requests report as text;
+                # either way the turn ends with the same message and stays out of memory
+                span.fail(f"{type(e).__name__}: {e}")
+                return f"Chat request failed. Error: {e}"
+            # calls started while streaming are already running
+            tool_calls = [(name, arg) for name, arg, _ in started] or self._parse_tool_calls(response)
+            span.set(tool_calls=len(tool_calls), speculative_tool_calls=len(started))
 
-        # call the model with the initial request and check for tool calls
-        response = self.model.chat_completion(messages)
-        match = tool_call_pattern.match(response.strip())
-        
-        # process the response
-        result = ""
-        if match:
-            # call tool if a tool call is found
-            name, arg = match.groups()
-            tool = self.tools.get(name)
-            if tool:
-                result = tool.run(arg) if arg else tool.run("")
+            # process the response
+            if started:
+                with tracer.span("agent.tools", calls=len(started), speculative=True):
+                    result = self._merge_tool_results(await asyncio.gather(*(task for _, _, task in started)))
+            elif tool_calls:
+                # run every requested tool concurrently
+                with tracer.span("agent.tools", calls=len(tool_calls)):
+                    result = await self._run_tools(tool_calls, deadline)
+            else:
+                result = response
+            result = result.strip()
+
+            # update memory with the interaction
+            with tracer.span("agent.memory"):
+                self._handle_memory(user_input, result)
+
+            return result
+
+    async def _generate(
+        self,
+        messages: List[dict],
+        on_token: Optional[TokenCallback] = None,
+        deadline: Optional[float] = None,
+    ) -> Tuple[str, List[Tuple[str, str, asyncio.Task]]]:
+        """
+        Get the model's response, streaming it when enabled, and record the turn's latency stats.
+
+        When streaming with SPECULATIVE_TOOLS, each registered tool call is started as
+        soon as its closing parenthesis arrives, and generation stops once the rest of
+        the response can no longer be another call on its own line.
+
+        Args:
+            messages (List[dict]): The prompt to send to the model.
+            on_token (TokenCallback, optional): Receives streamed text as it becomes safe to render.
+            deadline (float, optional): `time.monotonic()` time the response must arrive by.
+
+        Returns:
+            The response text and the tool calls already started, as (name, arg, task).
+        """
+        start = time.perf_counter()
+        first_token_time = None
+        token_count = 0
+        options = {"deadline": deadline} if deadline is not None else {}
+        options.update(self._response_generation)
+        started: List[Tuple[str, str, asyncio.Task]] = []
+
+        if self._stream:
+            text = ""
+            rendering = False
+            usage = {}
+            speculating = self._speculative_tools
+            # end of the last tool call started
+            scanned = 0
+            stream = self.model.stream_completion(messages, **options)
+            try:
+                async for token in stream:
+                    # usage arrives on an empty trailing chunk
+                    usage = getattr(token, "usage", None) or usage
+                    if not token:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter()
+                    token_count += 1
+                    text += token
+                    if speculating:
+                        call = self._next_tool_call(text, scanned, bool(started))
+                        while call is not None:
+                            name, arg, scanned = call
+                            started.append((name, arg, asyncio.ensure_future(self._run_tool(name, arg, deadline))))
+                            get_tracer().count("speculative_tool_calls_total", tool=name)
+                            call = self._next_tool_call(text, scanned, True)
+                        if not self._could_continue_tool_calls(text, scanned, bool(started)):
+                            if started:
+                                # nothing after the calls can change them, so stop decoding
+                                break
+                            speculating = False
+                    if on_token is None:
+                        continue
+                    if rendering:
+                        await self._emit(on_token, token)
+                    elif not self._could_be_tool_call(text):
+                        # flush the held back text once it cannot be a tool call
+                        rendering = True
+                        await self._emit(on_token, text)
+            except BaseException:
+                for _, _, task in started:
+                    task.cancel()
+                raise
+            finally:
+                # closes the provider stream, so the server stops generating too
+                await stream.aclose()
+            response = text
         else:
-            result = response
-        result = result.strip()
-        
-        # update memory with the interaction
-        self._handle_memory(user_input, result)
+            response = await self.model.chat_completion(messages, **options)
+            usage = getattr(response, "usage", None) or {}
+
+        end = time.perf_counter()
+        if first_token_time is None:
+            first_token_time = end
+        decode_time = end - first_token_time
+        self.turn_stats.append({
+            "time_to_first_token": first_token_time - start,
+            "tokens_per_sec": (token_count - 1) / decode_time if token_count > 1 and decode_time > 0 else None,
+            "total_time": end - start,
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "cached_prompt_tokens": usage.get("cached_tokens"),
+        })
+        return response, started
+
+    async def _emit(self, on_token: TokenCallback, text: str) -> None:
+        """Pass streamed text to the token callback, waiting for it when it is asynchronous."""
+        result = on_token(text)
+        if inspect.isawaitable(result):
+            await result
+
+    def _parse_tool_calls(self, response: str) -> List[Tuple[str, str]]:
+        """
+        Parse the tool calls in a response, in the order they were requested.
 
-        return result
+        These are the calls speculative dispatch starts while streaming: a response that
+        opens with a call to a registered tool, followed by more calls each on its own
+        line. Arguments may span lines and end at their balancing `)`, and text after
+        the last call is ignored.
+        """
+        calls = []
+        call = self._next_tool_call(response, 0, False)
+        while call is not None:
+            name, arg, end = call
+            calls.append((name, arg))
+            call = self._next_tool_call(response, end, True)
+        return calls
+
+    def _next_tool_call(self, text: str, start: int, after_call: bool) -> Optional[Tuple[str, str, int]]:
+        """The registered tool call at `text[start:]`, on a new line after an earlier call, as `scan_tool_call` returns it."""
+        if after_call:
+            # a call with a plain argument on the next line is matched in one go
+            match = BATCHED_TOOL_CALL_PATTERN.match(text, start)
+            if match is not None:
+                return (match.group(1), match.group(2), match.end()) if match.group(1) in self.tools else None
+            line_end = LINE_END_PATTERN.match(text, start)
+            if line_end is None:
+                return None
+            start = line_end.end()
+        call = scan_tool_call(text, start)
+        return call if call is not None and call[0] in self.tools else None
+
+    async def _run_tools(self, tool_calls: List[Tuple[str, str]], deadline: Optional[float] = None) -> str:
+        """Run tool calls concurrently and merge their results in the order they were requested."""
+        results = await asyncio.gather(*(self._run_tool(name, arg, deadline) for name, arg in tool_calls))
+        return self._merge_tool_results(results)
+
+    def _merge_tool_results(self, results: List[str]) -> str:
+        """Join tool results in the order the tools were requested, skipping empty ones."""
+        return "\n".join(result.strip() for result in results if result.strip())
+
+    async def _run_tool(self, name: str, arg: str, deadline: Optional[float] = None) -> str:
+        """Run a single tool call with its timeout (cut short by the turn's deadline), reporting failures as the tool's result."""
+        tool = self.tools.get(name)
+        if not tool:
+            return ""
+        timeout = tool.timeout if tool.timeout is not None else self._tool_timeout
+        left = remaining(deadline)
+        if left is not None and left < timeout:
+            timeout = round(left, 3)
+        try:
+            return await asyncio.wait_for(tool.arun(arg), timeout)
+        except (asyncio.TimeoutError, TimeoutError):
+            return f"Tool {name} timed out after {timeout} seconds."
+        except Exception as e:
+            return f"Tool {name} failed. Error: {e}"
+
+    def _could_be_tool_call(self, text: str, start: int = 0) -> bool:
+        """Check whether partially streamed text, from `start`, could still become a registered tool call."""
+        match = TOOL_CALL_PREFIX_PATTERN.match(text, start)
+        name, paren = match.groups()
+        if paren:
+            return name in self.tools
+        # a bare word is ambiguous until it stops being a prefix of a tool name
+        return match.end() == len(text) and any(tool.startswith(name) for tool in self.tools)
+
+    def _could_continue_tool_calls(self, text: str, start: int, after_call: bool) -> bool:
+        """
+        Check whether streamed text could still be (or add) a tool call.
+
+        Before any call `start` is 0; after one it is past the last closing parenthesis,
+        and the text from there can only continue a batch on a new line.
+        """
+        if not after_call:
+            return self._could_be_tool_call(text, start)
+        if BLANK_PATTERN.fullmatch(text, start):
+            return True
+        line_end = LINE_END_PATTERN.match(text, start)
+        return line_end is not None and self._could_be_tool_call(text, line_end.end())
 
     def _build_prompt(self, user_input: str) -> List[dict]:
         """
         Build a prompt for the model, including identity, memory, and recent interactions.
         
         1. The core identity/instructions of the agent
-        2. The long-term memory of the agent, summarized as a page that is regularly updated as messages drop off the short-term history
-        3. The recent short-term history of interactions
-        4. The current user input
+        2. The long-term memory of the agent, summaries of the messages that dropped off the short-term history, rolled up into coarser summaries as they age
+        3. Earlier turns most relevant to the user input (if retrieval memory is enabled)
+        4. The recent short-term history of interactions
+        5. The current user input
+
+        Each section is held to its token budget. Identity and long-term memory are
+        trimmed when they are set, history keeps the newest whole turns that fit using
+        the token counts cached when they entered memory, and only the user input is
+        counted here. Under the prefix_cache layout the relevant turns go after the
+        history instead, since they change every turn and would break the cached prefix.
 
         Args:
             user_input (str): The current input from the user.
@@ -132,21 +551,141 @@ class Agent:
         if not self._disable_long_memory and self.long_memory:
             messages.append({"role": "system", "content": f"Long-Term Memory:\n{self.long_memory}"})
 
-        # next, include the short-term memory for recent events
-        if self.short_memory:
+        # next, include the newest whole turns of short-term memory that fit the history
+        # budget, so a response is never shown without the input it answered
+        budget = self._max_short_memory_tokens
+        memory = self.short_memory
+        start = len(memory)
+        while start > 0:
+            # the turn ending at `start` begins at its user message
+            turn_start = start - 1
+            tokens = memory[turn_start]["tokens"]
+            while turn_start > 0 and memory[turn_start]["role"] != "user":
+                turn_start -= 1
+                tokens += memory[turn_start]["tokens"]
+            budget -= tokens
+            if budget < 0 or memory[turn_start]["role"] != "user":
+                break
+            start = turn_start
+        history = memory[start:]
+        relevant = self._relevant_turns(user_input, history)
+        if relevant and self._prompt_layout != "prefix_cache":
+            messages.append(relevant)
+        if history and self._prompt_layout == "prefix_cache":
+            # real roles and no per-turn header, so earlier turns stay byte-identical
+            messages.extend({"role": message["role"], "content": message["content"]} for message in history)
+        elif history:
             messages.append({"role": "system", "content": "Recent Interactions:"})
-            for message in self.short_memory:
+            for message in history:
                 role = message["role"]
                 content = message["content"]
                 messages.append({"role": "system", "content": f"{role.capitalize()}: {content}"})
+        if relevant and self._prompt_layout == "prefix_cache":
+            messages.append(relevant)
         
         # finally, add the current user input
+        user_input = self.token_counter.truncate(user_input, self._max_user_input_tokens)
         messages.append({"role": "user", "content": user_input})
         return messages
+
+    def load_transcript(self, path: str) -> int:
+        """
+        Replay the interactions of a transcript file into memory, without calling the model.
+
+        The turns are also appended to the session log when a session store is set, so
+        a session can be rebuilt from an old transcript once and resumed from the store
+        afterwards. Messages evicted while replaying are not summarized into long-term memory.
+
+        Args:
+            path (str): Transcript written by this agent, optionally gzipped.
+
+        Returns:
+            int: Interactions loaded.
+        """
+        text = read_transcript(path, TRANSCRIPT_HEADER, TRANSCRIPT_FOOTER)
+        turns = TRANSCRIPT_ENTRY_PATTERN.findall(text)
+        with get_tracer().span("agent.load_transcript", turns=len(turns)):
+            for user_input, result in turns:
+                self._remember(user_input, result)
+        return len(turns)
+
+    def restore_session(self) -> int:
+        """
+        Rebuild memory from the session store, without calling the model.
+
+        Loads the latest snapshot and replays the turns and long-term memory updates
+        logged after it. Retrieval memory, when enabled, is reindexed from every logged turn.
+
+        Returns:
+            int: Turns in the restored session.
+        """
+        with get_tracer().span("agent.restore_session") as span:
+            state, events = self.session_store.load(self.session_id)
+            if state is not None:
+                self.long_memory = state["long_memory"]
+                self.compactor.load(state.get("levels"), self.long_memory)
+                self._turn_count = state["turns"]
+                self.short_memory = []
+                for entry in state["short_memory"]:
+                    message = self._memory_message(entry["role"], entry["content"])
+                    message["turn"] = entry["turn"]
+                    self.short_memory.append(message)
+                self._short_memory_tokens = sum(message["tokens"] for message in self.short_memory)
+            for kind, data in events:
+                if kind == TURN:
+                    self._remember(data["user"], data["assistant"], replay=True)
+                    self._turns_since_snapshot += 1
+                elif kind == MEMORY:
+                    self.long_memory = data["long_memory"]
+                    self.compactor.load(data.get("levels"), self.long_memory)
+            if self.retrieval_memory is not None:
+                for turn_id, data in enumerate(self.session_store.turns(self.session_id)):
+                    self.retrieval_memory.add(data["user"], data["assistant"], data["tokens"], turn_id)
+            span.set(turns=self._turn_count, replayed=len(events))
+        return self._turn_count
+
+    def snapshot_session(self) -> None:
+        """Store the whole memory state, so restoring needs no replay of earlier events."""
+        state = {
+            "turns": self._turn_count,
+            "long_memory": self.long_memory,
+            "levels": self.compactor.state(),
+            "short_memory": [
+                {"role": message["role"], "content": message["content"], "turn": message["turn"]}
+                for message in self.short_memory
+            ],
+        }
+        with get_tracer().span("agent.snapshot_session"):
+            self.session_store.snapshot(self.session_id, state)
+        self._turns_since_snapshot = 0
+
+    def _relevant_turns(self, user_input: str, history: List[dict]) -> Optional[dict]:
+        """
+        System message with the earlier turns most relevant to the user input, or None.
+
+        Turns already in the prompt's history are skipped, and the best scoring turns
+        are kept while they fit the retrieval budget, oldest first.
+        """
+        if self.retrieval_memory is None:
+            return None
+        in_history = {message["turn"] for message in history if "turn" in message}
+        budget = self._max_retrieval_tokens
+        turns = []
+        for _, turn in self.retrieval_memory.search(user_input, self._retrieval_top_k, exclude=in_history):
+            if turn.tokens > budget:
+                continue
+            budget -= turn.tokens
+            turns.append(turn)
+        if not turns:
+            return None
+        turns.sort(key=lambda turn: turn.id)
+        lines = "\n".join(f"User: {turn.user}\nAssistant: {turn.assistant}" for turn in turns)
+        return {"role": "system", "content": f"Relevant Earlier Interactions:\n{lines}"}
     
     def _handle_memory(self, user_input: str, assistant_response: str) -> None:
         """
-        Update the agent's short-term and long-term memory based on the latest interaction.
+        Update the agent's short-term memory based on the latest interaction and
+        schedule a background long-term memory update for evicted messages.
 
         Args:
             user_input (str): The latest input from the user.
@@ -155,41 +694,142 @@ class Agent:
         if self._disable_short_memory:
             pass
 
-        self.short_memory.append({"role": "user", "content": user_input})
-        self.short_memory.append({"role": "assistant", "content": assistant_response})
-
-        popped_messages = []
-        while len(self.short_memory) > self._max_short_memory:
-            popped_messages.append(self.short_memory.pop(0))
+        popped_messages = self._remember(user_input, assistant_response)
 
-        # handle long memory update
+        # hand evicted messages to the background summarizer (if enabled)
         if popped_messages and not self._disable_long_memory:
-            # Flatten messages for readability
-            popped_messages_text = "\n".join(
-                f"{msg['role'].capitalize()}: {msg['content']}" for msg in popped_messages
-            )
-            short_memory_text = "\n".join(
-                f"{msg['role'].capitalize()}: {msg['content']}" for msg in self.short_memory
-            )
+            self._pending_evictions.extend(popped_messages)
+            if self._summary_task is None or self._summary_task.done():
+                self._summary_task = asyncio.create_task(self._summarize_evictions())
 
-            instruction_content = (
-                "Update the long-term memory summary for this agent.\n"
-                "Previous summary:\n"
-                f"{self.long_memory}\n\n"
-                "Messages that just dropped off short-term memory:\n"
-                f"{popped_messages_text}\n\n"
-                "Current short-term memory:\n"
-                f"{short_memory_text}\n\n"
-                "Please write a concise English summary that includes important context from all of the above, "
-                "without duplicating short-term memory. Respond in English only."
-            )
+    def _remember(self, user_input: str, assistant_response: str, replay: bool = False) -> List[dict]:
+        """
+        Add one turn to short-term memory and return the evicted messages.
+
+        A new turn is also indexed for retrieval and appended to the session log;
+        a turn replayed from the log is already in both.
+
+        Args:
+            user_input (str): The user input of the turn.
+            assistant_response (str): The agent's response.
+            replay (bool): The turn is being restored from the session log.
+        """
+        user_message = self._memory_message("user", user_input)
+        assistant_message = self._memory_message("assistant", assistant_response)
+        # both messages carry the turn number, so retrieval can skip turns still in history
+        user_message["turn"] = assistant_message["turn"] = self._turn_count
+        tokens = user_message["tokens"] + assistant_message["tokens"]
+        if not replay and self.retrieval_memory is not None:
+            self.retrieval_memory.add(user_input, assistant_response, tokens, self._turn_count)
+        self._turn_count += 1
+        self.short_memory.append(user_message)
+        self.short_memory.append(assistant_message)
+        self._short_memory_tokens += tokens
+
+        evict = 0
+        if self._prompt_layout == "prefix_cache":
+            # evict in blocks down to half of each limit, so the history prefix stays
+            # byte-stable (and cached by the server) for several turns in a row
+            if self._over_short_memory_limits(1):
+                evict = self._evict_count(2)
+        else:
+            evict = max(0, len(self.short_memory) - self._max_short_memory)
+        # slice off the oldest messages in one step rather than shifting the list per message
+        popped_messages = self.short_memory[:evict]
+        del self.short_memory[:evict]
+        self._short_memory_tokens -= sum(message["tokens"] for message in popped_messages)
+        # logged once memory is updated, so a snapshot taken here includes the turn
+        if not replay:
+            self._log_turn(user_input, assistant_response, tokens)
+        return popped_messages
+
+    def _log_turn(self, user_input: str, assistant_response: str, tokens: int) -> None:
+        """Append a turn to the session log (if persisted), snapshotting every SESSION_SNAPSHOT_INTERVAL turns."""
+        if self.session_store is None:
+            return
+        # the token count is logged too, so reindexing on restore never recounts
+        data = {"user": user_input, "assistant": assistant_response, "tokens": tokens}
+        self.session_store.append(self.session_id, TURN, data)
+        self._turns_since_snapshot += 1
+        if self._turns_since_snapshot >= self._snapshot_interval:
+            self.snapshot_session()
+
+    def _over_short_memory_limits(self, divisor: int) -> bool:
+        """Check short-term memory against its message and token limits, scaled down by `divisor`."""
+        return (
+            len(self.short_memory) > self._max_short_memory // divisor
+            or self._short_memory_tokens > self._max_short_memory_tokens // divisor
+        )
+
+    def _evict_count(self, divisor: int) -> int:
+        """Number of oldest messages to evict to get within the short-term limits scaled down by `divisor`."""
+        max_messages = self._max_short_memory // divisor
+        max_tokens = self._max_short_memory_tokens // divisor
+        remaining = len(self.short_memory)
+        tokens = self._short_memory_tokens
+        evict = 0
+        while remaining and (remaining > max_messages or tokens > max_tokens):
+            tokens -= self.short_memory[evict]["tokens"]
+            evict += 1
+            remaining -= 1
+        return evict
+
+    def _memory_message(self, role: str, content: str) -> dict:
+        """Create a memory entry, caching its token count so later turns never recount it."""
+        tokens = self.token_counter.count(content) + MESSAGE_OVERHEAD_TOKENS
+        return {"role": role, "content": content, "tokens": tokens}
+
+    async def _summarize_evictions(self) -> None:
+        """
+        Fold evicted messages into long-term memory off the response critical path.
+
+        Evictions that arrive while a summary is in flight are queued and summarized
+        after it, at most COMPACTION_CHUNK_MESSAGES per call. Each call sees only its
+        chunk of evicted messages (or a few earlier summaries when rolling up), never
+        the whole memory, so its cost stays bounded however long the session runs.
+        """
+        while self._pending_evictions:
+            chunk = self._pending_evictions[:self._compaction_chunk_messages]
+            del self._pending_evictions[:len(chunk)]
+            try:
+                with get_tracer().span("agent.summarize", messages=len(chunk)):
+                    await self.compactor.add(chunk)
+            except Exception as e:
+                # keep the messages so the next eviction retries them
+                self._pending_evictions[:0] = chunk
+                print(f"Long-term memory update failed. Error: {e}")
+                return
+            try:
+                with get_tracer().span("agent.compact_memory"):
+                    await self.compactor.roll_up()
+            except Exception as e:
+                # the chunk is kept, and rolling up is retried after the next one
+                print(f"Long-term memory compaction failed. Error: {e}")
+            self.long_memory = self.compactor.render()
+            if self.session_store is not None:
+                data = {"long_memory": self.long_memory, "levels": self.compactor.state()}
+                self.session_store.append(self.session_id, MEMORY, data)
+
+    async def _summarize(self, prompt: List[dict]) -> str:
+        """Summarization call used by the compactor, limited to the length of one summary."""
+        options = {"max_tokens": self.compactor.chunk_tokens}
+        if self._summary_model:
+            options["model"] = self._summary_model
+        # identical inputs (e.g. replays after a restart) may reuse a cached summary
+        response = await self.model.chat_completion(prompt, deterministic=True, **options)
+        # clients report failures as plain strings, raised so the chunk is retried
+        # rather than kept as its summary
+        if not isinstance(response, Completion):
+            raise RuntimeError(response)
+        return response
+
+    async def flush_memory(self) -> None:
+        """Wait for pending long-term memory summaries to finish, e.g. before shutdown, and snapshot the session."""
+        while self._summary_task is not None and not self._summary_task.done():
+            await self._summary_task
+        if self.session_store is not None and self._turns_since_snapshot:
+            self.snapshot_session()
 
-            summary_prompt = [
-                {"role": "system", "content": instruction_content},
-            ]
-            summary = self.model.chat_completion(summary_prompt)
-            self.long_memory = summary.strip()
-        
     def _get_timestamp(self) -> str:
         """Get a timestamp string for filenames."""
         from datetime import datetime
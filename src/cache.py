@@ -0,0 +1,245 @@
+"""Response cache placed in front of the model interface."""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# sentinel asking the disk writer thread to finish
+_CLOSE = object()
+
+def normalize_messages(messages: List[Dict[str, str]]) -> List[Tuple[str, str]]:
+    """Reduce messages to (role, content) pairs with whitespace collapsed, so trivial edits still hit."""
+    return [
+        (message.get("role", ""), " ".join(message.get("content", "").split()))
+        for message in messages
+    ]
+
+def cache_key(
+    provider: str,
+    model: Optional[str],
+    temperature: float,
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]] = None
+) -> str:
+    """Stable hash identifying a chat request, including generation options such as `max_tokens` when set."""
+    # requests without options keep the keys they had before options existed
+    extra = [options] if options else []
+    payload = json.dumps(
+        [provider, model, temperature, normalize_messages(messages), *extra],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: int = 4 * 1024 * 1024,
+        ttl: Optional[float] = 24 * 60 * 60,
+        path: Optional[str] = None,
+        max_disk_entries: int = 10000
+    ):
+        """
+        Two tier cache of model responses.
+
+        The memory tier is an LRU bounded by entry count and total size. The optional
+        disk tier is a SQLite table that survives restarts and is read through on a
+        memory miss. Entries older than `ttl` seconds are ignored and dropped.
+
+        Disk writes are queued to a background thread that commits them in batches,
+        and `aget()` reads the disk on a worker thread, so a slow disk never blocks
+        the event loop.
+
+        Args:
+            max_entries (int): Maximum responses kept in memory.
+            max_bytes (int): Maximum total size of the responses kept in memory.
+            ttl (float, optional): Seconds an entry stays valid, None to never expire.
+            path (str, optional): SQLite file for the disk tier, None to keep the cache in memory only.
+            max_disk_entries (int): Maximum responses kept on disk.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+
+        # key -> (response, stored at, size in bytes)
+        self._memory: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # shared by disk reads and the writer thread, one at a time
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._lock = threading.Lock()
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._writes: queue.Queue = queue.Queue()
+            self._writer = threading.Thread(target=self._write_forever, name="cache-writer", daemon=True)
+            self._writer.start()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a response, promoting disk hits into the memory tier."""
+        response = self._memory_get(key)
+        if response is None and self._db is not None:
+            response = self._promote(key, self._disk_get(key))
+        if response is None:
+            self.stats["misses"] += 1
+        return response
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Look up a response from the event loop, reading the disk tier on a worker thread."""
+        response = self._memory_get(key)
+        if response is None and self._db is not None:
+            response = self._promote(key, await asyncio.to_thread(self._disk_get, key))
+        if response is None:
+            self.stats["misses"] += 1
+        return response
+
+    def put(self, key: str, response: str) -> None:
+        """Store a response in memory and queue it for the disk tier."""
+        stored_at = time.time()
+        self._remember(key, response, stored_at)
+        if self._db is not None:
+            self._writes.put((key, str(response), stored_at))
+
+    def flush(self) -> None:
+        """Wait until every queued disk write is committed."""
+        if self._db is not None:
+            self._writes.join()
+
+    def clear(self) -> None:
+        """Drop every cached response from both tiers."""
+        self._memory.clear()
+        self._memory_bytes = 0
+        if self._db is not None:
+            self.flush()
+            with self._lock:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def close(self) -> None:
+        """Commit queued writes and close the disk tier."""
+        if self._db is not None:
+            self._writes.put(_CLOSE)
+            self._writer.join()
+            self._db.close()
+            self._db = None
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        """Look up the memory tier, dropping an expired entry."""
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        response, stored_at, _ = entry
+        if self._expired(stored_at, time.time()):
+            self._drop(key)
+            self.stats["expirations"] += 1
+            return None
+        self._memory.move_to_end(key)
+        self.stats["hits"] += 1
+        return response
+
+    def _disk_get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Read a (response, stored at) row from the disk tier, deleting it if expired."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self._expired(row[1], time.time()):
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                self.stats["expirations"] += 1
+                return None
+        return row
+
+    def _promote(self, key: str, row: Optional[Tuple[str, float]]) -> Optional[str]:
+        """Copy a disk hit into the memory tier and return its response."""
+        if row is None:
+            return None
+        response, stored_at = row
+        self._remember(key, response, stored_at)
+        self.stats["hits"] += 1
+        self.stats["disk_hits"] += 1
+        return response
+
+    def _write_forever(self) -> None:
+        """Commit queued writes, everything queued at once in one transaction, until `close()` is called."""
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [item for item in batch if item is not _CLOSE]
+            if rows:
+                self._write_rows(rows)
+            for _ in batch:
+                self._writes.task_done()
+            if len(rows) < len(batch):
+                return
+
+    def _write_rows(self, rows: List[Tuple[str, str, float]]) -> None:
+        """Insert rows and trim the oldest once the table outgrows its bound, in one commit."""
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO responses (key, response, stored_at) VALUES (?, ?, ?)", rows
+            )
+            overflow = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_disk_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY stored_at LIMIT ?)",
+                    (overflow,),
+                )
+                self.stats["evictions"] += overflow
+            self._db.commit()
+
+    def _remember(self, key: str, response: str, stored_at: float) -> None:
+        """Insert into the memory tier, evicting least recently used entries to stay in bounds."""
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._memory:
+            self._drop(key)
+        self._memory[key] = (response, stored_at, size)
+        self._memory_bytes += size
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            self._drop(next(iter(self._memory)))
+            self.stats["evictions"] += 1
+
+    def _drop(self, key: str) -> None:
+        """Remove a key from the memory tier."""
+        _, _, size = self._memory.pop(key)
+        self._memory_bytes -= size
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+def load_response_cache(config: Dict[str, Any]) -> Optional[ResponseCache]:
+    """Build the response cache described by the CACHE_* config values, or None when disabled."""
+    if not config.get("CACHE_ENABLED", True):
+        return None
+    return ResponseCache(
+        max_entries=config.get("CACHE_MAX_ENTRIES", 256),
+        max_bytes=config.get("CACHE_MAX_BYTES", 4 * 1024 * 1024),
+        ttl=config.get("CACHE_TTL", 24 * 60 * 60),
+        path=config.get("CACHE_PATH", None),
+        max_disk_entries=config.get("CACHE_MAX_DISK_ENTRIES", 10000),
+    )
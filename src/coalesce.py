@@ -0,0 +1,131 @@
+"""Single-flight coalescing of identical model requests that are in flight at the same time."""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import asyncio
+
+from src.telemetry import get_tracer
+
+class _Flight:
+    """A shared chat request and the number of callers waiting on it."""
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+class StreamBroadcast:
+    def __init__(self, stream: AsyncIterator[Any]):
+        """
+        Fan one provider stream out to any number of subscribers.
+
+        Tokens are buffered, so a subscriber that attaches late first replays what was
+        already generated. The provider stream is closed once it ends or the last
+        subscriber stops reading.
+        """
+        self.chunks: List[Any] = []
+        self.done = False
+        self.closed = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._task = asyncio.ensure_future(self._pump(stream))
+
+    def subscribe(self) -> AsyncIterator[Any]:
+        """Attach a subscriber, counted right away so the stream stays open until it has read it."""
+        self.subscribers += 1
+        return self._read()
+
+    async def _read(self) -> AsyncIterator[Any]:
+        """Yield every token of the stream from the start, raising the stream's error if it fails."""
+        i = 0
+        try:
+            while True:
+                while i < len(self.chunks):
+                    yield self.chunks[i]
+                    i += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                changed = self._changed
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.closed = True
+                self._task.cancel()
+
+    async def _pump(self, stream: AsyncIterator[Any]) -> None:
+        """Read the provider stream into the buffer, waking subscribers after every token."""
+        try:
+            async for token in stream:
+                self.chunks.append(token)
+                self._wake()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._wake()
+            await stream.aclose()
+
+    def _wake(self) -> None:
+        # swap in a fresh event so subscribers that wake up wait for the next token
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+class RequestCoalescer:
+    def __init__(self):
+        """
+        Share one model request between callers that send an identical request while it is in flight.
+
+        The first caller for a key (the leader) starts the request; later callers attach
+        to it instead of sending their own. The shared request is cancelled only once
+        every caller has stopped waiting for it.
+        """
+        self._flights: Dict[str, _Flight] = {}
+        self._streams: Dict[str, StreamBroadcast] = {}
+        self.stats = {"leaders": 0, "attached": 0}
+
+    async def call(self, key: Optional[str], request: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `request()`, or the identical request already in flight for `key`."""
+        if key is None:
+            return await request()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(request()))
+            flight.task.add_done_callback(lambda _: self._forget(self._flights, key, flight))
+            self._count("chat", "leader")
+        else:
+            self._count("chat", "attached")
+
+        flight.waiters += 1
+        try:
+            # a caller that gives up must not cancel the request for the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._forget(self._flights, key, flight)
+
+    def stream(self, key: Optional[str], request: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Iterate `request()`, or subscribe to the identical stream already in flight for `key`."""
+        if key is None:
+            return request()
+        broadcast = self._streams.get(key)
+        if broadcast is None or broadcast.done or broadcast.closed:
+            broadcast = self._streams[key] = StreamBroadcast(request())
+            broadcast._task.add_done_callback(lambda _: self._forget(self._streams, key, broadcast))
+            self._count("stream", "leader")
+        else:
+            self._count("stream", "attached")
+        return broadcast.subscribe()
+
+    def _count(self, kind: str, role: str) -> None:
+        self.stats["leaders" if role == "leader" else "attached"] += 1
+        get_tracer().count("coalesced_requests_total", kind=kind, role=role)
+
+    def _forget(self, flights: Dict[str, Any], key: str, flight: Any) -> None:
+        """Drop a finished request, unless a newer one has already taken its key."""
+        if flights.get(key) is flight:
+            del flights[key]
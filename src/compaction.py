@@ -0,0 +1,132 @@
+"""Hierarchical long-term memory: chunk summaries rolled up into a tree of coarser summaries."""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.tokens import TokenCounter
+
+# rough words per token, to ask the model for a summary that fits its cap
+WORDS_PER_TOKEN = 0.75
+
+class MemoryCompactor:
+    def __init__(
+        self,
+        summarize: Callable[[List[dict]], Awaitable[str]],
+        token_counter: TokenCounter,
+        max_tokens: int,
+        chunk_tokens: int = 256,
+        fanout: int = 4
+    ):
+        """
+        Long-term memory kept as levels of summaries instead of one rewritten page.
+
+        Evicted messages are summarized on their own into a level 0 chunk of at most
+        `chunk_tokens`. Once a level holds `fanout` summaries they are rolled into one
+        summary on the level above, and while the whole memory is over `max_tokens`
+        the oldest summaries are rolled together as well. Every model call therefore
+        reads at most one chunk of messages or `fanout` summaries, however long the
+        session runs, and older context is kept at coarser detail.
+
+        Args:
+            summarize (Callable): Sends a prompt to the model and returns its text.
+            token_counter (TokenCounter): Counts and trims summaries to their caps.
+            max_tokens (int): Token budget of the whole long-term memory.
+            chunk_tokens (int): Token cap of each summary.
+            fanout (int): Summaries on one level rolled into one on the level above.
+        """
+        self.summarize = summarize
+        self.token_counter = token_counter
+        self.max_tokens = max_tokens
+        self.chunk_tokens = chunk_tokens
+        self.fanout = max(2, fanout)
+        # levels[0] holds the newest, finest summaries; each level is oldest first
+        self.levels: List[List[str]] = []
+        self.stats = {"chunks": 0, "rollups": 0}
+
+    def render(self) -> str:
+        """The long-term memory text, coarsest and oldest summaries first, within `max_tokens`."""
+        entries = [entry for level in reversed(self.levels) for entry in level]
+        return self.token_counter.truncate("\n".join(entries), self.max_tokens)
+
+    def load(self, levels: Optional[List[List[str]]], long_memory: str = "") -> None:
+        """Restore saved levels, or start from a flat summary written before compaction existed."""
+        if levels is not None:
+            self.levels = [list(level) for level in levels]
+        else:
+            self.levels = [[long_memory]] if long_memory else []
+
+    async def add(self, messages: List[dict]) -> None:
+        """Summarize messages that dropped off short-term memory into a new level 0 chunk."""
+        text = "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages)
+        prompt = (
+            "Summarize these messages, which just dropped off the agent's short-term memory.\n"
+            f"{text}\n\n"
+            "Keep the facts, names, decisions and open questions that may matter later in the conversation. "
+            f"Write at most {self._words()} words of concise English. Respond in English only."
+        )
+        summary = await self.summarize([{"role": "system", "content": prompt}])
+        self._level(0).append(self._cap(summary))
+        self.stats["chunks"] += 1
+
+    async def roll_up(self) -> None:
+        """Roll full levels into the level above, then the oldest summaries together until within budget."""
+        level = 0
+        while level < len(self.levels):
+            while len(self.levels[level]) >= self.fanout:
+                group = self.levels[level][:self.fanout]
+                summary = await self._combine(group)
+                del self.levels[level][:self.fanout]
+                self._level(level + 1).append(summary)
+            level += 1
+
+        while self._tokens() > self.max_tokens and self._entries() > 1:
+            top = max(index for index, level in enumerate(self.levels) if level)
+            if len(self.levels[top]) > 1:
+                # the oldest level moves up a level as one summary
+                group, target = self.levels[top][:self.fanout], top + 1
+                summary = await self._combine(group)
+                del self.levels[top][:len(group)]
+            else:
+                # a lone top summary absorbs the oldest summaries of the next level down
+                below = max(index for index in range(top) if self.levels[index])
+                group, target = self.levels[top] + self.levels[below][:self.fanout - 1], top
+                summary = await self._combine(group)
+                del self.levels[top][:1]
+                del self.levels[below][:len(group) - 1]
+            self._level(target).insert(0, summary)
+
+    def state(self) -> List[List[str]]:
+        """Levels to save and later pass to `load()`."""
+        return [list(level) for level in self.levels]
+
+    def summary_stats(self) -> Dict[str, Any]:
+        """Summaries per level and model calls made so far."""
+        return {"levels": [len(level) for level in self.levels], **self.stats}
+
+    async def _combine(self, summaries: List[str]) -> str:
+        """Summarize consecutive summaries, oldest first, into one."""
+        text = "\n\n".join(f"Part {index}:\n{summary}" for index, summary in enumerate(summaries, 1))
+        prompt = (
+            "Combine these summaries of consecutive parts of an earlier conversation, oldest first, into one summary.\n"
+            f"{text}\n\n"
+            "Keep what may still matter later and drop details that were superseded. "
+            f"Write at most {self._words()} words of concise English. Respond in English only."
+        )
+        summary = await self.summarize([{"role": "system", "content": prompt}])
+        self.stats["rollups"] += 1
+        return self._cap(summary)
+
+    def _cap(self, summary: str) -> str:
+        return self.token_counter.truncate(summary.strip(), self.chunk_tokens)
+
+    def _words(self) -> int:
+        return max(1, int(self.chunk_tokens * WORDS_PER_TOKEN))
+
+    def _level(self, index: int) -> List[str]:
+        while len(self.levels) <= index:
+            self.levels.append([])
+        return self.levels[index]
+
+    def _tokens(self) -> int:
+        return self.token_counter.count("\n".join(entry for level in self.levels for entry in level))
+
+    def _entries(self) -> int:
+        return sum(len(level) for level in self.levels)
@@ -0,0 +1,136 @@
+"""Configuration loaded once from config.yaml and passed to every component."""
+from typing import Any, Dict, Optional, Tuple, Union
+
+import yaml
+
+CONFIG_PATH = "config.yaml"
+
+Number = (int, float)
+
+# expected type of every known setting; None is always allowed and means "use the default"
+CONFIG_TYPES: Dict[str, Union[type, Tuple[type, ...]]] = {
+    # general
+    "MODEL_PROVIDER": str,
+    "MAX_TOKENS": int,
+    "STREAM": bool,
+    "STREAM_TIMEOUT": Number,
+    "SPECULATIVE_TOOLS": bool,
+    "RESPONSE_MAX_TOKENS": int,
+    "RESPONSE_STOP": list,
+    "TURN_TIMEOUT": Number,
+    "WARMUP": bool,
+    "WARMUP_TIMEOUT": Number,
+    "KEEP_ALIVE": (str, int),
+    "KEEP_WARM_INTERVAL": Number,
+    # backends
+    "BACKENDS": list,
+    "BACKEND_MAX_IN_FLIGHT": int,
+    "BACKEND_HEALTH_INTERVAL": Number,
+    "BACKEND_HEALTH_TIMEOUT": Number,
+    "HEDGE_PERCENTILE": Number,
+    "HEDGE_WINDOW": int,
+    # HTTP
+    "HTTP_POOL_SIZE": int,
+    "HTTP_KEEPALIVE_EXPIRY": Number,
+    "HTTP_CONNECT_TIMEOUT": Number,
+    "HTTP_READ_TIMEOUT": Number,
+    "HTTP_MAX_RETRIES": int,
+    "HTTP_RETRY_BACKOFF": Number,
+    # tools
+    "TOOL_TIMEOUT": Number,
+    "TOOL_PROCESS_WORKERS": int,
+    "TOOL_MEMORY_LIMIT_MB": int,
+    "TOOL_CACHE_SIZE": int,
+    # response cache
+    "CACHE_ENABLED": bool,
+    "CACHE_MAX_ENTRIES": int,
+    "CACHE_MAX_BYTES": int,
+    "CACHE_TTL": Number,
+    "CACHE_PATH": str,
+    "CACHE_MAX_DISK_ENTRIES": int,
+    "COALESCE_REQUESTS": bool,
+    # telemetry
+    "TELEMETRY": str,
+    "TELEMETRY_PATH": str,
+    # transcripts
+    "TRANSCRIPT_FLUSH_INTERVAL": Number,
+    "TRANSCRIPT_FLUSH_BYTES": int,
+    "TRANSCRIPT_ROTATE_BYTES": int,
+    "TRANSCRIPT_ROTATE_SECONDS": Number,
+    "TRANSCRIPT_COMPRESS": bool,
+    # memory
+    "SHORT_MEMORY_SIZE": int,
+    "SHORT_MEMORY_TOKENS": int,
+    "LONG_MEMORY_SIZE": int,
+    "IDENTITY_TOKENS": int,
+    "USER_INPUT_TOKENS": int,
+    "TOKENIZER": str,
+    "PROMPT_LAYOUT": str,
+    "DISABLE_SHORT_MEMORY": bool,
+    "DISABLE_LONG_MEMORY": bool,
+    "COMPACTION_CHUNK_MESSAGES": int,
+    "COMPACTION_CHUNK_TOKENS": int,
+    "COMPACTION_FANOUT": int,
+    "SUMMARY_MODEL": str,
+    "RETRIEVAL_MEMORY": bool,
+    "RETRIEVAL_TOP_K": int,
+    "RETRIEVAL_TOKENS": int,
+    "RETRIEVAL_MAX_TURNS": int,
+    # durable sessions
+    "SESSION_STORE": str,
+    "SESSION_ID": str,
+    "SESSION_SNAPSHOT_INTERVAL": int,
+    # providers
+    "ANYTHINGLLM_API_KEY": str,
+    "ANYTHINGLLM_WORKSPACE": str,
+    "ANYTHINGLLM_URL": str,
+    "LM_STUDIO_API_KEY": str,
+    "LM_STUDIO_MODEL": str,
+    "LM_STUDIO_URL": str,
+    "NEXA_API_KEY": str,
+    "NEXA_MODEL": str,
+    "NEXA_URL": str,
+    "OLLAMA_API_KEY": str,
+    "OLLAMA_MODEL": str,
+    "OLLAMA_URL": str,
+    # multi-session server
+    "SERVER_HOST": str,
+    "SERVER_PORT": int,
+    "SERVER_MAX_SESSIONS": int,
+    "SERVER_MAX_CONCURRENT_TURNS": int,
+    "SESSION_MAX_CONCURRENT_TURNS": int,
+    "SESSION_IDLE_TIMEOUT": Number,
+}
+
+class Config(dict):
+    """
+    Settings read from config.yaml.
+
+    A plain dict underneath, so components keep reading settings with
+    `config.get(KEY, default)` and backends override them with `{**config, **entry}`.
+    Known settings are type checked when the config is created.
+    """
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        super().__init__(settings or {})
+        validate_config(self)
+
+def validate_config(config: Dict[str, Any]) -> None:
+    """Raise ValueError for a known setting with a value of the wrong type."""
+    for key, value in config.items():
+        expected = CONFIG_TYPES.get(key)
+        if value is None or expected is None:
+            continue
+        # YAML booleans are ints to Python, but never a valid count or duration
+        wrong_bool = isinstance(value, bool) and expected is not bool
+        if wrong_bool or not isinstance(value, expected):
+            names = " or ".join(t.__name__ for t in (expected if isinstance(expected, tuple) else (expected,)))
+            raise ValueError(f"{key} must be {names}, got {value!r}")
+    for entry in config.get("BACKENDS") or []:
+        if not isinstance(entry, dict):
+            raise ValueError(f"BACKENDS entries must be mappings, got {entry!r}")
+        validate_config(entry)
+
+def load_config(path: str = CONFIG_PATH) -> Config:
+    """Read and check the configuration file."""
+    with open(path, "r") as f:
+        return Config(yaml.safe_load(f))
@@ -1,65 +1,522 @@
-import yaml
-from typing import List, Dict, Any
-# from openai import OpenAI
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, List, Dict, Any, Optional
 
-from src.servers.anythingllm import setup_anythingllm_client # , anythingllm_chat_completion
-from src.servers.lmstudio import setup_lm_studio_client # , lmstudio_chat_completion
-from src.servers.nexa import setup_nexa_client # , nexa_chat_completion
-from src.servers.ollama import setup_ollama_client
+from src.cache import cache_key, load_response_cache
+from src.coalesce import RequestCoalescer
+from src.config import load_config
+from src.routing import Backend, BackendRouter
+from src.servers import provider_setup
+from src.servers.base import Completion, DeadlineExceeded, remaining
+from src.telemetry import configure_tracer, get_tracer
 
 # A message is a dictionary with a role and content
 Message = Dict[str, str]
 
+# latencies observed before hedging kicks in, so the percentile means something
+HEDGE_MIN_SAMPLES = 20
+# smallest request that makes a server load its model
+WARMUP_MESSAGES = [{"role": "user", "content": "Hi"}]
+
 class ModelInterface:
-    def __init__(self):
-        """Initialize the model interface."""
-        # read the configuration file
-        with open("config.yaml", "r") as f:
-            config = yaml.safe_load(f)
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Initialize the model interface.
+
+        Args:
+            config (Dict[str, Any], optional): Configuration to use, read from config.yaml when omitted.
+        """
+        # read the configuration file unless the caller already loaded it
+        if config is None:
+            config = load_config()
         self.model_provider = config.get("MODEL_PROVIDER", None)
-        self.client = self._setup_client(config)
 
-    def _setup_client(self, config: Dict[str, Any]):
-        """Setup the model client based on the provider."""
+        # one backend per BACKENDS entry (each overriding the top-level settings),
+        # or just the top-level provider; `client` is the first backend's client
+        self.backends = self._setup_backends(config)
+        self.client = self.backends[0].client
+        # any backend may serve a request, so cached and coalesced responses are keyed
+        # on every backend's model: one name when they all agree, else the sorted names
+        models = {getattr(backend.client, "model", None) for backend in self.backends}
+        self._models = models.pop() if len(models) == 1 else sorted(models, key=str)
+        self.router = BackendRouter(
+            self.backends,
+            health_interval=config.get("BACKEND_HEALTH_INTERVAL", 10),
+            health_timeout=config.get("BACKEND_HEALTH_TIMEOUT", 2),
+        )
+
+        # a request still running past this percentile of recent latencies is
+        # duplicated on another backend and the first answer wins (None disables)
+        self._hedge_percentile = config.get("HEDGE_PERCENTILE", None)
+        self._latencies = deque(maxlen=config.get("HEDGE_WINDOW", 200))
+
+        # cache for reproducible requests (temperature 0 or flagged deterministic)
+        self.cache = load_response_cache(config)
+
+        # output budget for requests that do not set their own, None for the server default
+        self._max_tokens = config.get("MAX_TOKENS", None)
+
+        # identical requests in flight at the same time share one generation
+        self.coalescer = RequestCoalescer() if config.get("COALESCE_REQUESTS", True) else None
+
+        # warm-up loads the model before the first turn; idle backends are re-touched
+        # every keep-warm interval so the server does not unload the model
+        self._warmup_timeout = config.get("WARMUP_TIMEOUT", 120) # seconds
+        self._keep_alive = config.get("KEEP_ALIVE", None)
+        self._keep_warm_interval = config.get("KEEP_WARM_INTERVAL", None) # seconds
+        self._keep_warm_task: Optional[asyncio.Task] = None
+        # backend name -> seconds its last warm-up took, None if it failed
+        self.warmup_stats: Dict[str, Optional[float]] = {}
+
+        # spans and metrics, a no-op unless TELEMETRY is set
+        configure_tracer(config)
+
+    def _setup_backends(self, config: Dict[str, Any]) -> List[Backend]:
+        """Create a client for every configured backend."""
+        backends = []
+        for i, entry in enumerate(config.get("BACKENDS") or [{}]):
+            backend_config = {**config, **entry}
+            provider = backend_config.get("MODEL_PROVIDER", None)
+            client = self._setup_client(backend_config)
+            backends.append(Backend(
+                backend_config.get("NAME", f"{provider}-{i}"),
+                provider,
+                client,
+                max_in_flight=backend_config.get("BACKEND_MAX_IN_FLIGHT", None),
+            ))
         if not self.model_provider:
+            self.model_provider = backends[0].provider
+        return backends
+
+    def _setup_client(self, config: Dict[str, Any]):
+        """Setup the model client based on the provider, importing only that provider's module."""
+        provider = config.get("MODEL_PROVIDER", None)
+        if not provider:
             raise ValueError("MODEL_PROVIDER is not set in config.yaml")
-        
-        if self.model_provider.lower() == "anythingllm":
-            return setup_anythingllm_client(config)
-        elif self.model_provider.lower() == "lmstudio":
-            return setup_lm_studio_client(config)
-        elif self.model_provider.lower() == "nexa":
-            return setup_nexa_client(config)
-        elif self.model_provider.lower() == "ollama":
-            return setup_ollama_client(config)
-        else:
-            raise ValueError(f"Unsupported MODEL_PROVIDER: {self.model_provider}")
-
-    def chat_completion(
+        return provider_setup(provider)(config)
+
+    async def chat_completion(
         self,
         messages: List[Message],
         temperature: float = 0.7,
-        stream: bool = False
+        stream: bool = False,
+        deterministic: bool = False,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
     ) -> Any:
-        """Send messages to the language model and get a response."""
+        """
+        Send messages to the language model and await the response without blocking the event loop.
+
+        Responses are served from the response cache when the request is reproducible,
+        i.e. `temperature` is 0 or the caller flags it as `deterministic`.
+        With `stream=True` the awaited value is the async token iterator from `stream_completion`.
+        A request still running at `deadline` (a `time.monotonic()` time) is cancelled
+        and raises `DeadlineExceeded`.
+
+        `max_tokens` (MAX_TOKENS by default) and `stop` sequences end generation early,
+        and `model` picks another model on the same server (the workspace, for AnythingLLM).
+        """
         if not self.model_provider:
             raise ValueError("MODEL_PROVIDER is not set in config.yaml")
-        
-        if self.model_provider.lower() == "anythingllm":
-            if stream:
-                raise NotImplementedError("AnythingLLM streaming chat is not implemented yet.")
-            return self.client.chat(messages)
-        elif self.model_provider.lower() == "lmstudio":
-            if stream:
-                raise NotImplementedError("LM Studio streaming chat is not implemented yet.")
-            return self.client.chat(messages, temperature=temperature)
-        elif self.model_provider.lower() == "nexa":
-            if stream:
-                raise NotImplementedError("Nexa streaming chat is not implemented yet.")
-            return self.client.chat(messages, temperature=temperature)
-        elif self.model_provider.lower() == "ollama":
-            if stream:
-                return self.client.streaming_chat(messages, temperature=temperature)
-            return self.client.chat(messages, temperature=temperature)
-        else:
-            raise ValueError(f"Unsupported MODEL_PROVIDER: {self.model_provider}")
\ No newline at end of file
+
+        if stream:
+            return self.stream_completion(
+                messages, temperature=temperature, deterministic=deterministic, deadline=deadline,
+                max_tokens=max_tokens, stop=stop, model=model
+            )
+
+        tracer = get_tracer()
+        generation = self._generation(max_tokens, stop, model)
+        with tracer.span("model.chat", provider=self.model_provider, **generation) as span:
+            key = self._cache_key(messages, temperature, deterministic, generation)
+            cached = await self._cache_get(key, span)
+            if cached is not None:
+                return Completion(cached)
+
+            async def request() -> Any:
+                response = await self._achat(messages, temperature, deadline, generation)
+                # clients report failures as plain strings, only real completions are cached
+                if isinstance(response, Completion):
+                    tracer.record_usage(response.usage)
+                    if key is not None:
+                        self.cache.put(key, response)
+                return response
+
+            response = await self._until_deadline(self._coalesce(messages, temperature, generation, request), deadline)
+            if not isinstance(response, Completion):
+                span.fail(response)
+            return response
+
+    async def stream_completion(
+        self,
+        messages: List[Message],
+        temperature: float = 0.7,
+        deterministic: bool = False,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Send messages to the language model and yield response text as tokens arrive.
+
+        A cached response is yielded as a single chunk; a fully consumed stream is cached.
+        A stream still running at `deadline` is closed and raises `DeadlineExceeded`.
+        Generation controls are the same as `chat_completion`'s.
+        """
+        if not self.model_provider:
+            raise ValueError("MODEL_PROVIDER is not set in config.yaml")
+
+        # the span is never made current: the caller runs between chunks
+        tracer = get_tracer()
+        generation = self._generation(max_tokens, stop, model)
+        span = tracer.span("model.stream", provider=self.model_provider, **generation)
+        try:
+            key = self._cache_key(messages, temperature, deterministic, generation)
+            cached = await self._cache_get(key, span)
+            if cached is not None:
+                yield Completion(cached)
+                return
+
+            async def request() -> AsyncIterator[str]:
+                stream = self._astream(messages, temperature, deadline, generation)
+                chunks = []
+                try:
+                    async for token in stream:
+                        chunks.append(token)
+                        if getattr(token, "usage", None):
+                            tracer.record_usage(token.usage)
+                        yield token
+                finally:
+                    await stream.aclose()
+                if key is not None:
+                    self.cache.put(key, "".join(chunks))
+
+            stream = self._coalesce_stream(messages, temperature, generation, request)
+            # close the provider stream (and its connection) even if the caller stops early
+            try:
+                async for token in self._iter_until_deadline(stream, deadline):
+                    yield token
+            finally:
+                await stream.aclose()
+        except Exception as e:
+            span.fail(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.finish()
+
+    async def _cache_get(self, key: Optional[str], span: Any) -> Optional[str]:
+        """Look up a cached response, recording the hit or miss."""
+        if key is None:
+            return None
+        cached = await self.cache.aget(key)
+        result = "miss" if cached is None else "hit"
+        span.set(cache=result)
+        get_tracer().count("response_cache_requests_total", result=result)
+        return cached
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Hit, miss, eviction and expiration counters of the response cache."""
+        return dict(self.cache.stats) if self.cache else {}
+
+    def coalesce_stats(self) -> Dict[str, int]:
+        """Requests that started a generation (leaders) and requests that attached to one in flight."""
+        return dict(self.coalescer.stats) if self.coalescer else {}
+
+    def backend_stats(self) -> List[Dict[str, Any]]:
+        """Health, load and latency of every backend."""
+        return self.router.stats()
+
+    def _generation(self, max_tokens: Optional[int], stop: Optional[List[str]], model: Optional[str]) -> Dict[str, Any]:
+        """Generation controls sent with a request, leaving out the ones not set."""
+        controls = {
+            "max_tokens": self._max_tokens if max_tokens is None else max_tokens,
+            "stop": list(stop) if stop else None,
+            "model": model,
+        }
+        return {name: value for name, value in controls.items() if value is not None}
+
+    def _request_key(self, messages: List[Message], temperature: float, generation: Dict[str, Any]) -> str:
+        """Hash of everything that decides a response: provider, model(s), temperature, messages and output limits."""
+        model = generation.get("model") or self._models
+        options = {name: value for name, value in generation.items() if name != "model"}
+        return cache_key(self.model_provider.lower(), model, temperature, messages, options)
+
+    def _flight_key(self, messages: List[Message], temperature: float, generation: Dict[str, Any]) -> str:
+        """Key identifying identical requests in flight."""
+        return self._request_key(messages, temperature, generation)
+
+    async def _coalesce(self, messages: List[Message], temperature: float, generation: Dict[str, Any], request: Any) -> Any:
+        """Run a chat request, or attach to the identical one already in flight."""
+        if self.coalescer is None:
+            return await request()
+        return await self.coalescer.call(self._flight_key(messages, temperature, generation), request)
+
+    def _coalesce_stream(
+        self,
+        messages: List[Message],
+        temperature: float,
+        generation: Dict[str, Any],
+        request: Any
+    ) -> AsyncIterator[str]:
+        """Open a stream, or subscribe to the identical one already in flight."""
+        if self.coalescer is None:
+            return request()
+        return self.coalescer.stream(self._flight_key(messages, temperature, generation), request)
+
+    async def _until_deadline(self, request: Any, deadline: Optional[float]) -> Any:
+        """Await a request, cancelling it if the deadline passes first."""
+        if deadline is None:
+            return await request
+        try:
+            return await asyncio.wait_for(request, remaining(deadline))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("The model did not respond before the deadline")
+
+    async def _iter_until_deadline(self, stream: AsyncIterator[str], deadline: Optional[float]) -> AsyncIterator[str]:
+        """Iterate a stream, cancelling it if the deadline passes first."""
+        if deadline is None:
+            async for token in stream:
+                yield token
+            return
+        while True:
+            try:
+                token = await self._until_deadline(stream.__anext__(), deadline)
+            except StopAsyncIteration:
+                return
+            yield token
+
+    async def _achat(
+        self,
+        messages: List[Message],
+        temperature: float,
+        deadline: Optional[float] = None,
+        generation: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """Send a chat request, hedging it on a second backend when it runs unusually long."""
+        generation = generation or {}
+        delay = self._hedge_delay()
+        if delay is None:
+            return await self._failover_chat(messages, temperature, deadline, [], generation)
+
+        tracer = get_tracer()
+        tried = []
+        primary = asyncio.ensure_future(self._failover_chat(messages, temperature, deadline, tried, generation))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            # hedge only onto an idle slot elsewhere, so hedging never queues behind other requests
+            if not done and self.router.has_capacity(exclude=tried):
+                tracer.count("hedged_requests_total")
+                pending.add(asyncio.ensure_future(self._failover_chat(messages, temperature, deadline, list(tried), generation)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and isinstance(task.result(), Completion):
+                        if task is not primary:
+                            tracer.count("hedge_wins_total")
+                        return task.result()
+            # neither produced a completion: report the primary's outcome
+            return primary.result()
+        finally:
+            # the losing request (or both, if the caller gave up) is cancelled
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def _hedge_delay(self) -> Optional[float]:
+        """The configured percentile of recent latencies, None when hedging is off or not yet calibrated."""
+        if self._hedge_percentile is None or len(self.backends) < 2 or len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self._hedge_percentile / 100))]
+
+    async def _failover_chat(
+        self,
+        messages: List[Message],
+        temperature: float,
+        deadline: Optional[float],
+        tried: List[Backend],
+        generation: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """Send a chat request to the best backend not in `tried`, failing over to the next one when it errors."""
+        while True:
+            backend = await self.router.acquire(exclude=tried)
+            tried.append(backend)
+            last = len(tried) == len(self.backends)
+            start = time.perf_counter()
+            ok = None
+            try:
+                response = await self._backend_chat(backend, messages, temperature, deadline, generation)
+                # clients report failures as plain strings
+                ok = isinstance(response, Completion)
+                if ok:
+                    self._latencies.append(time.perf_counter() - start)
+            except Exception:
+                ok = False
+                if last:
+                    raise
+                continue
+            finally:
+                await self.router.release(backend, time.perf_counter() - start, ok)
+                get_tracer().count("backend_requests_total", backend=backend.name, result=self._outcome(ok))
+            if ok or last:
+                return response
+
+    async def _astream(
+        self,
+        messages: List[Message],
+        temperature: float,
+        deadline: Optional[float] = None,
+        generation: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """Stream from the best backend, failing over to the next one if it errors before the first token."""
+        tried = []
+        while True:
+            backend = await self.router.acquire(exclude=tried)
+            tried.append(backend)
+            last = len(tried) == len(self.backends)
+            start = time.perf_counter()
+            ok = None
+            started = False
+            stream = self._open_stream(backend, messages, temperature, deadline, generation)
+            try:
+                async for token in stream:
+                    started = True
+                    yield token
+                ok = True
+            except Exception:
+                ok = False
+                if started or last:
+                    raise
+                continue
+            finally:
+                await stream.aclose()
+                await self.router.release(backend, time.perf_counter() - start, ok)
+                get_tracer().count("backend_requests_total", backend=backend.name, result=self._outcome(ok))
+            return
+
+    def _outcome(self, ok: Optional[bool]) -> str:
+        return "cancelled" if ok is None else "ok" if ok else "error"
+
+    async def _backend_chat(
+        self,
+        backend: Backend,
+        messages: List[Message],
+        temperature: float,
+        deadline: Optional[float] = None,
+        generation: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """Send a chat request to one backend's provider client."""
+        options = self._client_options(deadline, generation)
+        # AnythingLLM's workspace chat takes no temperature
+        if backend.provider.lower() == "anythingllm":
+            return await backend.client.achat(messages, **options)
+        return await backend.client.achat(messages, temperature=temperature, **options)
+
+    def _open_stream(
+        self,
+        backend: Backend,
+        messages: List[Message],
+        temperature: float,
+        deadline: Optional[float] = None,
+        generation: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """Open a streaming chat request to one backend's provider client."""
+        options = self._client_options(deadline, generation)
+        # AnythingLLM's workspace chat takes no temperature
+        if backend.provider.lower() == "anythingllm":
+            return backend.client.streaming_chat(messages, **options)
+        return backend.client.streaming_chat(messages, temperature=temperature, **options)
+
+    def _client_options(self, deadline: Optional[float], generation: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Keyword arguments for a client call, only those set, so clients without them keep working."""
+        options = {"deadline": deadline} if deadline is not None else {}
+        options.update(generation or {})
+        return options
+
+    def _cache_key(
+        self,
+        messages: List[Message],
+        temperature: float,
+        deterministic: bool,
+        generation: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """Cache key for reproducible requests, None when the response should not be cached."""
+        if self.cache is None or not (deterministic or temperature == 0):
+            return None
+        return self._request_key(messages, temperature, generation or {})
+
+    async def warm_up(self) -> Dict[str, Optional[float]]:
+        """
+        Load the model on every backend before the first turn, then start `keep_warm()`.
+
+        Returns the seconds each backend took, None for backends that failed, so
+        loading time is reported apart from turn latency.
+        """
+        await asyncio.gather(*(self._warm_backend(backend) for backend in self.backends))
+        self.keep_warm()
+        return dict(self.warmup_stats)
+
+    def keep_warm(self) -> None:
+        """
+        Start re-touching idle backends every KEEP_WARM_INTERVAL seconds, with or without a warm-up.
+
+        Does nothing when KEEP_WARM_INTERVAL is unset or the task is already running.
+        Must be called from the event loop.
+        """
+        if self._keep_warm_interval and (self._keep_warm_task is None or self._keep_warm_task.done()):
+            self._keep_warm_task = asyncio.create_task(self._keep_warm_forever())
+
+    async def _warm_backend(self, backend: Backend) -> None:
+        """Preload one backend's model, with Ollama's keep-alive where supported."""
+        with get_tracer().span("model.warm_up", backend=backend.name) as span:
+            start = time.perf_counter()
+            try:
+                warm_up = getattr(backend.client, "awarm_up", None)
+                if warm_up is not None:
+                    request = warm_up(self._keep_alive)
+                else:
+                    # one token is enough to load the model
+                    request = self._backend_chat(backend, WARMUP_MESSAGES, 0.0, generation={"max_tokens": 1})
+                response = await asyncio.wait_for(request, self._warmup_timeout)
+                # clients report failures as plain strings
+                ok = response is True or isinstance(response, Completion)
+                if not ok:
+                    span.fail(response)
+            except Exception as e:
+                ok = False
+                span.fail(f"{type(e).__name__}: {e}")
+            self.warmup_stats[backend.name] = time.perf_counter() - start if ok else None
+            # a warm-up counts as use for the keep-warm interval
+            backend.last_used = time.monotonic()
+
+    async def _keep_warm_forever(self) -> None:
+        """Re-touch every backend that has been idle for a keep-warm interval."""
+        interval = self._keep_warm_interval
+        while True:
+            now = time.monotonic()
+            due = [backend for backend in self.backends if backend.in_flight == 0 and now - backend.last_used >= interval]
+            await asyncio.gather(*(self._warm_backend(backend) for backend in due))
+            # sleep until the next idle backend is due, or a full interval while all are busy
+            waits = [backend.last_used + interval - time.monotonic() for backend in self.backends if backend.in_flight == 0]
+            await asyncio.sleep(max(0.0, min(waits, default=interval)))
+
+    async def aclose(self) -> None:
+        """Stop the health checks and keep-warm requests, and close every backend's connection pool and the response cache."""
+        if self._keep_warm_task is not None:
+            self._keep_warm_task.cancel()
+            try:
+                await self._keep_warm_task
+            except asyncio.CancelledError:
+                pass
+            self._keep_warm_task = None
+        await self.router.aclose()
+        for backend in self.backends:
+            await backend.client.aclose()
+        if self.cache:
+            self.cache.close()
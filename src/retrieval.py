@@ -0,0 +1,101 @@
+"""Retrieval memory: a BM25 index over past turns, so prompts carry only the relevant ones."""
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import heapq
+import math
+import re
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# words too common to tell turns apart
+STOPWORDS = frozenset(
+    "a an and are as at be but by can could did do does for from had has have he her his how i if in "
+    "is it its me my no not of on or our she so that the their them then there these they this to "
+    "us was we were what when where which who why will with would you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words and numbers, without stopwords."""
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+class Turn:
+    __slots__ = ("id", "user", "assistant", "tokens", "terms", "length")
+
+    def __init__(self, turn_id: int, user: str, assistant: str, tokens: int, terms: Dict[str, int]):
+        """One indexed exchange: the user input, the agent's response and their prompt token cost."""
+        self.id = turn_id
+        self.user = user
+        self.assistant = assistant
+        self.tokens = tokens
+        self.terms = terms
+        self.length = sum(terms.values())
+
+class RetrievalMemory:
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_turns: Optional[int] = None):
+        """
+        Index of every past turn, scored against the current input with BM25.
+
+        The index is inverted (term -> turns containing it), so a search only touches
+        the turns that share a word with the query; it stays fast with tens of
+        thousands of turns and needs nothing beyond the standard library.
+
+        Args:
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 document length normalization.
+            max_turns (int, optional): Turns kept before the oldest are dropped, None to keep all.
+        """
+        self.k1 = k1
+        self.b = b
+        self.max_turns = max_turns
+        self.turns: "OrderedDict[int, Turn]" = OrderedDict()
+        # term -> {turn id: occurrences}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._total_length = 0
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def add(self, user: str, assistant: str, tokens: int, turn_id: Optional[int] = None) -> int:
+        """Index one turn and return its id, the next in sequence unless `turn_id` is given."""
+        terms = Counter(tokenize(f"{user} {assistant}"))
+        turn = Turn(self._next_id if turn_id is None else turn_id, user, assistant, tokens, terms)
+        self._next_id = turn.id + 1
+        self.turns[turn.id] = turn
+        for term, count in terms.items():
+            self._postings.setdefault(term, {})[turn.id] = count
+        self._total_length += turn.length
+        if self.max_turns is not None:
+            while len(self.turns) > self.max_turns:
+                self._remove(next(iter(self.turns)))
+        return turn.id
+
+    def search(self, query: str, k: int, exclude: Iterable[int] = ()) -> List[Tuple[float, Turn]]:
+        """The `k` best scoring turns for the query, best first, skipping the ids in `exclude`."""
+        if not self.turns or k <= 0:
+            return []
+        excluded = set(exclude)
+        count = len(self.turns)
+        average_length = self._total_length / count or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for turn_id, frequency in postings.items():
+                if turn_id in excluded:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.turns[turn_id].length / average_length)
+                scores[turn_id] = scores.get(turn_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], item[0]))
+        return [(score, self.turns[turn_id]) for turn_id, score in best]
+
+    def _remove(self, turn_id: int) -> None:
+        turn = self.turns.pop(turn_id)
+        for term in turn.terms:
+            postings = self._postings[term]
+            del postings[turn_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= turn.length
@@ -0,0 +1,182 @@
+"""Routing of model requests across several backend servers."""
+from typing import Any, Dict, List, Optional, Sequence
+
+import asyncio
+import time
+
+# weight of the newest sample in each backend's rolling latency estimate
+LATENCY_EWMA_ALPHA = 0.2
+
+class Backend:
+    def __init__(self, name: str, provider: str, client: Any, max_in_flight: Optional[int] = None):
+        """
+        One model server and its routing state.
+
+        Args:
+            name (str): Identifier used in stats and metrics.
+            provider (str): MODEL_PROVIDER of the server.
+            client (Any): Provider client from `src/servers/`.
+            max_in_flight (int, optional): Concurrent requests allowed, None for no limit.
+        """
+        self.name = name
+        self.provider = provider
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.healthy = True
+        self.latency: Optional[float] = None  # seconds, rolling average
+        self.requests = 0
+        self.failures = 0
+        self.last_used = time.monotonic()  # when the last request started or finished
+
+    def has_capacity(self) -> bool:
+        return self.max_in_flight is None or self.in_flight < self.max_in_flight
+
+    def expected_wait(self) -> float:
+        """Rough time a new request would take here: its latency scaled by the queue ahead of it."""
+        return (self.latency or 0.0) * (self.in_flight + 1)
+
+class BackendRouter:
+    def __init__(
+        self,
+        backends: List[Backend],
+        health_interval: float = 10.0,
+        health_timeout: float = 2.0
+    ):
+        """
+        Send each request to the least-loaded healthy backend.
+
+        Backends are ranked by their rolling latency times the requests already in
+        flight. A backend that fails a request is marked unhealthy until a background
+        health check succeeds; when every backend is unhealthy they are all tried anyway.
+
+        Args:
+            backends (List[Backend]): Servers to route across.
+            health_interval (float): Seconds between background health checks.
+            health_timeout (float): Seconds to wait for each health check.
+        """
+        self.backends = backends
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._slot_freed: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def acquire(self, exclude: Sequence[Backend] = ()) -> Backend:
+        """Reserve a slot on the best backend not in `exclude`, waiting while all of them are full."""
+        self._ensure_health_checks()
+        condition = self._condition()
+        async with condition:
+            while True:
+                backend = self._select(exclude)
+                if backend is not None:
+                    backend.in_flight += 1
+                    backend.requests += 1
+                    backend.last_used = time.monotonic()
+                    return backend
+                await condition.wait()
+
+    def has_capacity(self, exclude: Sequence[Backend] = ()) -> bool:
+        """Whether a backend not in `exclude` could take a request right now."""
+        return self._select(exclude) is not None
+
+    async def release(self, backend: Backend, latency: Optional[float], ok: Optional[bool]) -> None:
+        """
+        Free a backend's slot and record the outcome.
+
+        Args:
+            backend (Backend): Backend returned by `acquire`.
+            latency (float, optional): Duration of a successful request.
+            ok (bool, optional): Whether the request succeeded, None if it was cancelled.
+        """
+        backend.in_flight -= 1
+        backend.last_used = time.monotonic()
+        if ok:
+            backend.healthy = True
+            if latency is not None:
+                backend.latency = latency if backend.latency is None else (
+                    LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * backend.latency
+                )
+        elif ok is False:
+            backend.failures += 1
+            backend.healthy = False
+        await self._notify()
+
+    async def check_health(self) -> None:
+        """Probe every backend once and update its health."""
+        results = await asyncio.gather(*(self._probe(backend) for backend in self.backends))
+        recovered = False
+        for backend, healthy in zip(self.backends, results):
+            recovered = recovered or (healthy and not backend.healthy)
+            backend.healthy = healthy
+        if recovered:
+            await self._notify()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Health, load and latency of every backend."""
+        return [
+            {
+                "name": backend.name,
+                "provider": backend.provider,
+                "healthy": backend.healthy,
+                "in_flight": backend.in_flight,
+                "latency_ms": backend.latency * 1000 if backend.latency is not None else None,
+                "requests": backend.requests,
+                "failures": backend.failures,
+            }
+            for backend in self.backends
+        ]
+
+    async def aclose(self) -> None:
+        """Stop the background health checks."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def _select(self, exclude: Sequence[Backend]) -> Optional[Backend]:
+        """Least expected wait among healthy backends with a free slot, None if all are full."""
+        candidates = [backend for backend in self.backends if backend not in exclude]
+        healthy = [backend for backend in candidates if backend.healthy] or candidates
+        available = [backend for backend in healthy if backend.has_capacity()]
+        if not available:
+            return None
+        return min(available, key=lambda backend: (backend.expected_wait(), backend.in_flight))
+
+    async def _probe(self, backend: Backend) -> bool:
+        """Run a backend's health check, treating errors and timeouts as unhealthy."""
+        health_check = getattr(backend.client, "ahealth_check", None)
+        if health_check is None:
+            return True
+        try:
+            return bool(await asyncio.wait_for(health_check(), self.health_timeout))
+        except Exception:
+            return False
+
+    async def _check_health_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    def _ensure_health_checks(self) -> None:
+        """Start the health checks on the running loop; a single backend has nothing to fail over to."""
+        if len(self.backends) < 2:
+            return
+        if self._health_task is None or self._health_task.done() or self._loop is not asyncio.get_running_loop():
+            self._health_task = asyncio.create_task(self._check_health_forever())
+
+    def _condition(self) -> asyncio.Condition:
+        """Condition signalled when a slot frees up, bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._slot_freed is None or self._loop is not loop:
+            self._slot_freed = asyncio.Condition()
+            self._loop = loop
+        return self._slot_freed
+
+    async def _notify(self) -> None:
+        if self._slot_freed is not None and self._loop is asyncio.get_running_loop():
+            async with self._slot_freed:
+                self._slot_freed.notify_all()
@@ -0,0 +1,160 @@
+"""Warm process pool that runs CPU-heavy tools outside the agent's process."""
+from multiprocessing.connection import Connection
+from typing import Any, Callable, List, Optional, Tuple
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+
+# how often a waiting call checks for results, deadlines and memory use
+POLL_INTERVAL = 0.05
+
+def _worker_main(conn: Connection) -> None:
+    """Worker loop: run each (func, arg) received and send back (ok, result)."""
+    while True:
+        try:
+            func, arg = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            result = func(arg) if arg != "" else func()
+            conn.send((True, result))
+        except BaseException as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of a process, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class Worker:
+    def __init__(self, context: Any):
+        """A single worker process and the pipe used to talk to it."""
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def call(
+        self,
+        func: Callable[..., Any],
+        arg: str,
+        timeout: Optional[float],
+        memory_limit: Optional[int],
+        cancelled: threading.Event
+    ) -> Tuple[bool, Any]:
+        """
+        Send a call to the worker and block until it answers.
+
+        Raises TimeoutError past the wall-clock timeout and MemoryError once the
+        worker's resident memory exceeds `memory_limit` bytes. The caller kills
+        the worker when either happens, or when `cancelled` is set.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        self.conn.send((func, arg))
+        while not self.conn.poll(POLL_INTERVAL):
+            if cancelled.is_set():
+                raise asyncio.CancelledError()
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"timed out after {timeout} seconds")
+            if memory_limit is not None:
+                rss = _rss_bytes(self.process.pid)
+                if rss is not None and rss > memory_limit:
+                    raise MemoryError(f"exceeded memory limit of {memory_limit // (1024 * 1024)} MB")
+            if not self.process.is_alive():
+                raise RuntimeError("worker process died")
+        return self.conn.recv()
+
+    def kill(self) -> None:
+        """Terminate the worker immediately."""
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class WorkerPool:
+    def __init__(self, size: int = 2, memory_limit_mb: Optional[int] = None):
+        """
+        Pool of warm worker processes for tools that must not run in the agent's process.
+
+        Workers are started up front and reused between calls. A call that times out,
+        exceeds the memory limit or is cancelled kills its worker, which is replaced
+        by a fresh one so the pool stays at full size.
+
+        Args:
+            size (int): Number of worker processes.
+            memory_limit_mb (int, optional): Resident memory limit per call, enforced where /proc is available.
+        """
+        self._context = multiprocessing.get_context("spawn")
+        self.size = size
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self._workers: List[Worker] = [Worker(self._context) for _ in range(size)]
+        self._idle: Optional[asyncio.Queue] = None
+        self._idle_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def run(self, func: Callable[..., Any], arg: str, timeout: Optional[float] = None) -> Any:
+        """Run `func(arg)` (or `func()` for an empty arg) in a worker process and return its result."""
+        idle = self._idle_queue()
+        worker = await idle.get()
+        cancelled = threading.Event()
+        call = asyncio.ensure_future(asyncio.to_thread(worker.call, func, arg, timeout, self.memory_limit, cancelled))
+        try:
+            # shielded, so a cancelled caller leaves the thread running until it sees `cancelled`
+            ok, result = await asyncio.shield(call)
+        except BaseException:
+            # a hung, runaway or abandoned call: once its thread has stopped polling the
+            # pipe, kill the worker and hand a fresh one to the next caller
+            cancelled.set()
+            call.add_done_callback(lambda _: idle.put_nowait(self._replace(worker)))
+            raise
+        idle.put_nowait(worker)
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    def shutdown(self) -> None:
+        """Stop every worker process."""
+        for worker in self._workers:
+            worker.kill()
+        self._workers = []
+        self._idle = None
+
+    def _idle_queue(self) -> asyncio.Queue:
+        """Queue of idle workers, bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._idle is None or self._idle_loop is not loop:
+            self._idle = asyncio.Queue()
+            self._idle_loop = loop
+            for worker in self._workers:
+                self._idle.put_nowait(worker)
+        return self._idle
+
+    def _replace(self, worker: Worker) -> Worker:
+        """Kill a worker and start a fresh one in its place (unless the pool was shut down meanwhile)."""
+        if worker not in self._workers:
+            return worker
+        worker.kill()
+        replacement = Worker(self._context)
+        self._workers[self._workers.index(worker)] = replacement
+        return replacement
+
+# pool shared by every process-mode tool
+_process_pool: Optional[WorkerPool] = None
+
+def get_process_pool(size: int = 2, memory_limit_mb: Optional[int] = None) -> WorkerPool:
+    """The shared pool, started with the given settings on first use."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = WorkerPool(size, memory_limit_mb)
+    return _process_pool
+
+def shutdown_process_pool() -> None:
+    """Stop the shared pool's workers."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown()
+        _process_pool = None
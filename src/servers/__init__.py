@@ -1 +1,27 @@
 """Server integrations for various LLM providers."""
+from typing import Any, Callable, Dict, Union
+
+import importlib
+
+# MODEL_PROVIDER -> client setup function, as "module:function" until first used so
+# only the selected provider's module (and its HTTP/SDK dependencies) is imported
+PROVIDERS: Dict[str, Union[str, Callable[[Dict[str, Any]], Any]]] = {
+    "anythingllm": "src.servers.anythingllm:setup_anythingllm_client",
+    "lmstudio": "src.servers.lmstudio:setup_lm_studio_client",
+    "nexa": "src.servers.nexa:setup_nexa_client",
+    "ollama": "src.servers.ollama:setup_ollama_client",
+}
+
+def register_provider(name: str, setup: Union[str, Callable[[Dict[str, Any]], Any]]) -> None:
+    """Add a provider, given its setup function or a lazy "module:function" path."""
+    PROVIDERS[name.lower()] = setup
+
+def provider_setup(name: str) -> Callable[[Dict[str, Any]], Any]:
+    """The setup function of a provider, importing its module on first use."""
+    setup = PROVIDERS.get(name.lower())
+    if setup is None:
+        raise ValueError(f"Unsupported MODEL_PROVIDER: {name}")
+    if isinstance(setup, str):
+        module, function = setup.split(":")
+        setup = PROVIDERS[name.lower()] = getattr(importlib.import_module(module), function)
+    return setup
@@ -1,21 +1,24 @@
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any, Optional
 
-import asyncio
 import httpx
 import json
-import requests
-import sys
+
+from src.servers.common import Completion, aiter_sse_data, asend_with_retries, build_http_clients, parse_usage, request_timeout, send_with_retries
 
 class AnythingLLMClient:
     def __init__(self, config: Dict[str, Any]):
         # general configuration
+        self.config = config
         self.api_key = config.get("ANYTHINGLLM_API_KEY", None)
-        self.stream_timeout = config.get("ANYTHINGLLM_STREAM_TIMEOUT", 30)
+        self.stream_timeout = config.get("ANYTHINGLLM_STREAM_TIMEOUT", config.get("STREAM_TIMEOUT", 30))
         self.workspace = config.get("ANYTHINGLLM_WORKSPACE", "default")
+        # the workspace decides which model answers
+        self.model = self.workspace
         
         # configure the url
-        base_url = config.get("ANYTHINGLLM_URL", "http://localhost:3001/api/v1")
-        self.chat_url = f"{base_url}/workspace/{self.workspace}"
+        self.base_url = config.get("ANYTHINGLLM_URL", "http://localhost:3001/api/v1")
+        self.chat_url = self._workspace_url(self.workspace)
+        self.auth_url = f"{self.base_url}/auth"
 
         self.headers = {
             "accept": "application/json",
@@ -23,6 +26,9 @@ class AnythingLLMClient:
             "Authorization": "Bearer " + self.api_key
         }  
 
+        # keep-alive connection pools with explicit timeouts
+        self.http_client, self.async_client = build_http_clients(config, self.headers)
+
     def chat(self, messages: str) -> str:
         """
         Send a chat request to the model server and return the response
@@ -30,74 +36,128 @@ class AnythingLLMClient:
         Inputs:
         - messages: The message chain to send to the chatbot
         """
-        data = {
+        blocking_chat_url = f"{self.chat_url}/chat"
+        request = self.http_client.build_request(
+            "POST",
+            blocking_chat_url,
+            json=self._request_body(messages)
+        )
+        try:
+            chat_response = send_with_retries(self.http_client, request, self.config)
+            chat_response.raise_for_status()
+        except httpx.HTTPError as e:
+            return f"Chat request failed. Error: {e}"
+        return self._parse_response(chat_response)
+
+    async def achat(
+        self,
+        messages: str,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
+    ) -> Completion:
+        """
+        Send a non-blocking chat request to the model server and return the response
+        
+        Inputs:
+        - messages: The message chain to send to the chatbot
+        - deadline: `time.monotonic()` time the request must finish by, if any
+        - max_tokens, stop: Accepted for a uniform interface; the workspace settings decide output length
+        - model: Workspace to send the request to instead of the configured one
+        """
+        request = self.async_client.build_request(
+            "POST",
+            f"{self._workspace_url(model)}/chat",
+            json=self._request_body(messages),
+            timeout=request_timeout(self.async_client.timeout, deadline)
+        )
+        try:
+            chat_response = await asend_with_retries(self.async_client, request, self.config, deadline=deadline)
+            chat_response.raise_for_status()
+        except httpx.HTTPError as e:
+            return f"Chat request failed. Error: {e}"
+        return self._parse_response(chat_response)
+
+    def _request_body(self, messages: str) -> Dict[str, Any]:
+        """Build the request payload shared by the blocking and async paths."""
+        return {
             "message": concat_messages(messages),# message,
             "mode": "chat",
             "sessionId": "example-session-id",
             "attachments": []
         }
 
-        blocking_chat_url = f"{self.chat_url}/chat"
-        chat_response = requests.post(
-            blocking_chat_url,
-            headers=self.headers,
-            json=data
-        )
-
+    def _parse_response(self, chat_response: httpx.Response) -> Completion:
+        """Extract the reply text and token metrics from a chat response."""
         try:
-            return chat_response.json()['textResponse']
+            body = chat_response.json()
+            return Completion(body['textResponse'], parse_usage(body.get("metrics")))
         except ValueError:
             return "Response is not valid JSON"
         except Exception as e:
             return f"Chat request failed. Error: {e}"
         
-    def streaming_chat(self, message: str) -> None:
+    async def streaming_chat(
+        self,
+        messages: str,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
+    ) -> AsyncIterator[str]:
         """
-        Wrapper to run the asynchronous streaming chat.
-        """
-        asyncio.run(self._streaming_chat_async(message))
-
-    async def _streaming_chat_async(self, message: str) -> None:
-        """
-        Stream chat responses asynchronously from the model server and display them in real-time.
-        Buffers incomplete JSON chunks until a full chunk (terminated by newline) is collected.
+        Stream chat responses from the model server, yielding text as each chunk arrives.
+        
+        Inputs:
+        - messages: The message chain to send to the chatbot
+        - deadline: `time.monotonic()` time the request must finish by, if any
+        - max_tokens, stop, model: As for `achat`
         """
+        request = self.async_client.build_request(
+            "POST",
+            f"{self._workspace_url(model)}/stream-chat",
+            json=self._request_body(messages),
+            timeout=request_timeout(httpx.Timeout(self.stream_timeout, connect=self.async_client.timeout.connect), deadline)
+        )
+        response = await asend_with_retries(self.async_client, request, self.config, stream=True, deadline=deadline)
+        try:
+            # error statuses carry a JSON body rather than events
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            async for payload in aiter_sse_data(response):
+                try:
+                    parsed_chunk = json.loads(payload)
+                except json.JSONDecodeError:
+                    # not a complete JSON payload, skip it
+                    continue
+                if parsed_chunk.get("error"):
+                    raise RuntimeError(f"Streaming chat request failed. Error: {parsed_chunk['error']}")
+                text = parsed_chunk.get("textResponse")
+                if text:
+                    yield text
+                if parsed_chunk.get("close", False):
+                    break
+        finally:
+            await response.aclose()
 
-        data = {
-            "message": message,
-            "mode": "chat",
-            "sessionId": "example-session-id",
-            "attachments": []
-        }
+    def _workspace_url(self, workspace: Optional[str] = None) -> str:
+        """Chat URL of a workspace, the configured one by default."""
+        return f"{self.base_url}/workspace/{workspace or self.workspace}"
 
-        buffer = ""
+    async def ahealth_check(self) -> bool:
+        """Check that the AnythingLLM server is up and accepts the API key, without retries."""
         try:
-            async with httpx.AsyncClient(timeout=self.stream_timeout) as client:
-                async with client.stream("POST", F"{self.chat_url}/stream-chat", headers=self.headers, json=data) as response:
-                    print("Agent: ", end="")
-                    async for chunk in response.aiter_text():
-                        if chunk:
-                            buffer += chunk
-                            # Process each complete line
-                            while "\n" in buffer:
-                                line, buffer = buffer.split("\n", 1)
-                                if line.startswith("data: "):
-                                    line = line[len("data: "):]
-                                try:
-                                    parsed_chunk = json.loads(line.strip())
-                                    print(parsed_chunk.get("textResponse", ""), end="", flush=True)
+            response = await self.async_client.get(self.auth_url)
+        except httpx.HTTPError:
+            return False
+        return response.is_success
 
-                                    if parsed_chunk.get("close", False):
-                                        print("")
-                                except json.JSONDecodeError:
-                                    # The line is not a complete JSON; wait for more data.
-                                    continue
-                                except Exception as e:
-                                    # generic error handling, quit for debug
-                                    print(f"Error processing chunk: {e}")
-                                    sys.exit()
-        except httpx.RequestError as e:
-            print(f"Streaming chat request failed. Error: {e}")
+    async def aclose(self) -> None:
+        """Release the pooled connections held by the sync and async clients."""
+        self.http_client.close()
+        await self.async_client.aclose()
 
 def concat_messages(messages: List[Dict[str, str]]) -> str:
     """Concatenate a list of message dictionaries into a single string."""
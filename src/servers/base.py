@@ -0,0 +1,22 @@
+"""Response and deadline types shared by the provider clients and the model interface, free of HTTP dependencies."""
+from typing import Dict, Optional
+
+import time
+
+class Completion(str):
+    """Response text that also carries the provider's token usage, if it reported any."""
+    usage: Dict[str, int]
+
+    def __new__(cls, text: Optional[str], usage: Optional[Dict[str, int]] = None):
+        completion = super().__new__(cls, text or "")
+        completion.usage = usage or {}
+        return completion
+
+class DeadlineExceeded(TimeoutError):
+    """The turn's deadline passed before the model finished responding."""
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left until a `time.monotonic()` deadline, None when there is no deadline."""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
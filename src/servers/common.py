@@ -0,0 +1,142 @@
+"""Helpers shared by the provider clients."""
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import asyncio
+import httpx
+import random
+import time
+
+from src.servers.base import Completion, DeadlineExceeded, remaining
+
+# transport failures that mean the connection was dropped or reset, safe to retry
+RETRYABLE_ERRORS = (
+    httpx.ConnectError,
+    httpx.RemoteProtocolError,
+    httpx.ReadError,
+    httpx.WriteError,
+)
+
+def request_timeout(timeout: httpx.Timeout, deadline: Optional[float]) -> httpx.Timeout:
+    """Shorten a client's timeouts so a single request cannot outlive the deadline."""
+    left = remaining(deadline)
+    if left is None:
+        return timeout
+    def cap(value: Optional[float]) -> float:
+        return left if value is None else min(value, left)
+    return httpx.Timeout(connect=cap(timeout.connect), read=cap(timeout.read), write=cap(timeout.write), pool=cap(timeout.pool))
+
+def generation_options(max_tokens: Optional[int] = None, stop: Optional[List[str]] = None) -> Dict[str, Any]:
+    """OpenAI-style output limits for a request, leaving out the ones not set so servers keep their defaults."""
+    options: Dict[str, Any] = {}
+    if max_tokens is not None:
+        options["max_tokens"] = max_tokens
+    if stop:
+        options["stop"] = list(stop)
+    return options
+
+def parse_usage(usage: Any, timings: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """
+    Normalize OpenAI-style usage into prompt, completion and cached prompt token counts.
+
+    Cached prompt tokens come from `prompt_tokens_details.cached_tokens`, or from the
+    llama.cpp `timings.cache_n` field on servers that only report it there.
+    """
+    if hasattr(usage, "model_dump"):
+        usage = usage.model_dump()
+    usage = usage or {}
+    result = {key: usage[key] for key in ("prompt_tokens", "completion_tokens") if usage.get(key) is not None}
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if cached is None and timings:
+        cached = timings.get("cache_n")
+    if cached is not None:
+        result["cached_tokens"] = cached
+    return result
+
+def http_limits(config: Dict[str, Any]) -> httpx.Limits:
+    """Connection pool limits from the HTTP_* configuration."""
+    pool_size = config.get("HTTP_POOL_SIZE", 10)
+    return httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=config.get("HTTP_KEEPALIVE_EXPIRY", 30),
+    )
+
+def http_timeout(config: Dict[str, Any]) -> httpx.Timeout:
+    """
+    Connect/read timeouts from the HTTP_* configuration.
+
+    The read timeout bounds the wait for each chunk rather than the whole response,
+    so long generations keep working while a stalled server still fails.
+    """
+    return httpx.Timeout(
+        config.get("HTTP_READ_TIMEOUT", 120),
+        connect=config.get("HTTP_CONNECT_TIMEOUT", 5),
+    )
+
+def build_http_clients(
+    config: Dict[str, Any],
+    headers: Dict[str, str]
+) -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Create the keep-alive sync and async connection pools a client owns."""
+    limits = http_limits(config)
+    timeout = http_timeout(config)
+    return (
+        httpx.Client(headers=headers, limits=limits, timeout=timeout),
+        httpx.AsyncClient(headers=headers, limits=limits, timeout=timeout),
+    )
+
+def backoff_delay(attempt: int, base: float, cap: float = 5.0) -> float:
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def send_with_retries(
+    client: httpx.Client,
+    request: httpx.Request,
+    config: Dict[str, Any],
+    stream: bool = False
+) -> httpx.Response:
+    """Send a request, retrying dropped or reset connections with jittered backoff."""
+    retries = config.get("HTTP_MAX_RETRIES", 2)
+    backoff = config.get("HTTP_RETRY_BACKOFF", 0.25)
+    for attempt in range(retries + 1):
+        try:
+            return client.send(request, stream=stream)
+        except RETRYABLE_ERRORS:
+            if attempt == retries:
+                raise
+            time.sleep(backoff_delay(attempt, backoff))
+
+async def asend_with_retries(
+    client: httpx.AsyncClient,
+    request: httpx.Request,
+    config: Dict[str, Any],
+    stream: bool = False,
+    deadline: Optional[float] = None
+) -> httpx.Response:
+    """Async counterpart of `send_with_retries`, which also stops retrying once a retry would pass the deadline."""
+    retries = config.get("HTTP_MAX_RETRIES", 2)
+    backoff = config.get("HTTP_RETRY_BACKOFF", 0.25)
+    for attempt in range(retries + 1):
+        try:
+            return await client.send(request, stream=stream)
+        except RETRYABLE_ERRORS:
+            delay = backoff_delay(attempt, backoff)
+            left = remaining(deadline)
+            if attempt == retries or (left is not None and delay >= left):
+                raise
+            await asyncio.sleep(delay)
+
+async def aiter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """
+    Yield the payload of each event from a server-sent events response.
+
+    httpx reassembles lines split across network chunks, so every yielded value
+    is a complete payload with any leading "data:" field name removed.
+    """
+    async for line in response.aiter_lines():
+        line = line.strip()
+        if not line or line.startswith((":", "event:", "id:", "retry:")):
+            continue
+        if line.startswith("data:"):
+            line = line[len("data:"):].strip()
+        yield line
@@ -1,10 +1,19 @@
-from typing import List, Dict, Any
-import requests
+from typing import AsyncIterator, List, Dict, Any, Optional
+import httpx
+import json
+
+from src.servers.common import (
+    Completion, aiter_sse_data, asend_with_retries, build_http_clients, generation_options, parse_usage, request_timeout, send_with_retries
+)
 
 class NexaClient:
     def __init__(self, config: Dict[str, Any]):
-        self.chat_url = config.get("NEXA_URL")
+        self.config = config
+        self.chat_url = config.get("NEXA_URL", "http://127.0.0.1:18181/v1/chat/completions")
+        # the OpenAI-compatible model list next to the chat endpoint, used for health checks
+        self.models_url = self.chat_url.rsplit("/chat/completions", 1)[0] + "/models"
         self.api_key = config.get("NEXA_API_KEY")
+        self.model = config.get("NEXA_MODEL", "NexaAI/Qwen3-4B-Instruct-2507-npu")
 
         self.headers = {
             "accept": "application/json",
@@ -12,35 +21,140 @@ class NexaClient:
             "Authorization": "Bearer " + self.api_key
         }
 
+        # keep-alive connection pools with explicit timeouts
+        self.http_client, self.async_client = build_http_clients(config, self.headers)
+
     def chat(
         self,
         messages: List[Dict[str, str]],
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
     ) -> str:
         """Send a blocking chat request to the Nexa model and return the response."""
-        data = {
-            "model": "NexaAI/Qwen3-4B-Instruct-2507-npu",
+        request = self.http_client.build_request(
+            "POST",
+            self.chat_url,
+            json=self._request_body(messages, temperature, max_tokens=max_tokens, stop=stop, model=model)
+        )
+        try:
+            chat_response = send_with_retries(self.http_client, request, self.config)
+            chat_response.raise_for_status()
+        except httpx.HTTPError as e:
+            return f"Chat request failed. Error: {e}"
+        return self._parse_response(chat_response)
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
+    ) -> Completion:
+        """
+        Send a non-blocking chat request to the Nexa model, finishing by `deadline` if given, and return the response with its usage.
+
+        `max_tokens` and `stop` end generation early, and `model` overrides the configured model for this request.
+        """
+        request = self.async_client.build_request(
+            "POST",
+            self.chat_url,
+            json=self._request_body(messages, temperature, max_tokens=max_tokens, stop=stop, model=model),
+            timeout=request_timeout(self.async_client.timeout, deadline)
+        )
+        try:
+            chat_response = await asend_with_retries(self.async_client, request, self.config, deadline=deadline)
+            chat_response.raise_for_status()
+        except httpx.HTTPError as e:
+            return f"Chat request failed. Error: {e}"
+        return self._parse_response(chat_response)
+
+    async def streaming_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the Nexa model's response, yielding text as each token arrives.
+
+        The final chunk is an empty `Completion` carrying the usage, if the server reports it.
+        Generation controls are the same as `achat`'s.
+        """
+        request = self.async_client.build_request(
+            "POST",
+            self.chat_url,
+            json=self._request_body(messages, temperature, stream=True, max_tokens=max_tokens, stop=stop, model=model),
+            timeout=request_timeout(self.async_client.timeout, deadline)
+        )
+        response = await asend_with_retries(self.async_client, request, self.config, stream=True, deadline=deadline)
+        try:
+            # error statuses carry a JSON body rather than events
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            async for payload in aiter_sse_data(response):
+                if payload == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(payload)
+                except json.JSONDecodeError:
+                    continue
+                choices = chunk.get("choices") or [{}]
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+                if chunk.get("usage"):
+                    yield Completion("", parse_usage(chunk["usage"], chunk.get("timings")))
+        finally:
+            await response.aclose()
+
+    def _request_body(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        stream: bool = False,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Build the request payload shared by the blocking, async and streaming paths."""
+        return {
+            "model": model or self.model,
             "messages": messages,
-            "max_tokens": 256,
             "temperature": temperature,
-            "stream": False
+            "stream": stream,
+            **generation_options(max_tokens, stop)
         }
 
-        chat_response = requests.post(
-            self.chat_url,
-            headers=self.headers,
-            json=data
-        )
-        
+    def _parse_response(self, chat_response: httpx.Response) -> Completion:
+        """Extract the reply text and usage from a chat response."""
         try:
-            return chat_response.json()['choices'][0]['message']['content']
+            body = chat_response.json()
+            return Completion(body['choices'][0]['message']['content'], parse_usage(body.get("usage"), body.get("timings")))
         except ValueError:
             return "Response is not valid JSON"
         except Exception as e:
             return f"Chat request failed. Error: {e}"
 
-    def streaming_chat(self):
-        raise NotImplementedError("Nexa streaming chat is not implemented yet.")
+    async def ahealth_check(self) -> bool:
+        """Check that the Nexa server is up by listing its models, without retries."""
+        try:
+            response = await self.async_client.get(self.models_url)
+        except httpx.HTTPError:
+            return False
+        return response.is_success
+
+    async def aclose(self) -> None:
+        """Release the pooled connections held by the sync and async clients."""
+        self.http_client.close()
+        await self.async_client.aclose()
 
 def setup_nexa_client(
     config: Dict[str, Any]
@@ -58,4 +172,4 @@ def setup_nexa_client(
 #         # return client.streaming_chat(messages, temperature=temperature)
 #         raise NotImplementedError("Nexa streaming chat is not implemented yet.")
 #     else:
-#         return client.chat(messages, temperature=temperature)
\ No newline at end of file
+#         return client.chat(messages, temperature=temperature)
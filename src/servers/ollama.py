@@ -1,30 +1,128 @@
-from typing import List, Dict, Any
-from openai import OpenAI
+from typing import AsyncIterator, List, Dict, Any, Optional, Union
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI, OpenAIError
+
+from src.servers.common import Completion, generation_options, http_limits, http_timeout, parse_usage, request_timeout
 
 class OllamaClient:
     def __init__(self, config: Dict[str, Any]):
         self.api_key = config.get("OLLAMA_API_KEY", "ollama")
         self.base_url = config.get("OLLAMA_URL", "http://localhost:11434/v1")
         self.model = config.get("OLLAMA_MODEL", "llama3.2:3b")
+        # Ollama's native API, next to its OpenAI-compatible one, for loading models
+        self.native_url = self.base_url.rstrip("/").removesuffix("/v1") + "/api"
 
-        self.client = OpenAI(base_url=self.base_url, api_key=self.api_key)
+        # keep-alive connection pools and timeouts shared with the other clients,
+        # the openai SDK retries dropped connections with jittered backoff
+        client_options = {
+            "base_url": self.base_url,
+            "api_key": self.api_key,
+            "timeout": http_timeout(config),
+            "max_retries": config.get("HTTP_MAX_RETRIES", 2),
+        }
+        self.client = OpenAI(http_client=DefaultHttpxClient(limits=http_limits(config)), **client_options)
+        self.async_http_client = DefaultAsyncHttpxClient(limits=http_limits(config))
+        self.async_client = AsyncOpenAI(http_client=self.async_http_client, **client_options)
 
-    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7) -> str:
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
+    ) -> str:
         """Send a blocking chat request to the Ollama model and return the response."""
         resp = self.client.chat.completions.create(
-            model=self.model,
+            model=model or self.model,
             messages=messages,
-            temperature=temperature
+            temperature=temperature,
+            **generation_options(max_tokens, stop)
         )
         return resp.choices[0].message.content
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
+    ) -> Completion:
+        """
+        Send a non-blocking chat request to the Ollama model, finishing by `deadline` if given, and return the response with its usage.
+
+        `max_tokens` and `stop` end generation early, and `model` overrides the configured model for this request.
+        """
+        resp = await self.async_client.chat.completions.create(
+            model=model or self.model,
+            messages=messages,
+            temperature=temperature,
+            **generation_options(max_tokens, stop),
+            timeout=request_timeout(self.async_client.timeout, deadline)
+        )
+        usage = parse_usage(resp.usage, getattr(resp, "timings", None))
+        return Completion(resp.choices[0].message.content, usage)
     
-    def streaming_chat(self, messages: List[Dict[str, str]], temperature: float = 0.7):
-        return self.client.chat.completions.create(
-            model=self.model,
+    async def streaming_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        model: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the Ollama model's response, yielding text as each token arrives.
+
+        The final chunk is an empty `Completion` carrying the usage, if the server reports it.
+        Generation controls are the same as `achat`'s.
+        """
+        stream = await self.async_client.chat.completions.create(
+            model=model or self.model,
             messages=messages,
             temperature=temperature,
-            stream=True
+            **generation_options(max_tokens, stop),
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=request_timeout(self.async_client.timeout, deadline)
         )
+        # closing the stream drops the connection if the caller stops early
+        async with stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if chunk.usage:
+                    yield Completion("", parse_usage(chunk.usage, getattr(chunk, "timings", None)))
+
+    async def ahealth_check(self) -> bool:
+        """Check that the Ollama server is up by listing its models, without retries."""
+        try:
+            await self.async_client.with_options(max_retries=0).models.list()
+        except OpenAIError:
+            return False
+        return True
+
+    async def awarm_up(self, keep_alive: Optional[Union[str, int]] = None) -> bool:
+        """
+        Load the model into memory without generating anything.
+
+        Args:
+            keep_alive (str | int, optional): How long Ollama keeps the model loaded afterwards,
+                e.g. "30m" or -1 for forever; the server default when omitted.
+        """
+        body = {"model": self.model}
+        if keep_alive is not None:
+            body["keep_alive"] = keep_alive
+        response = await self.async_http_client.post(f"{self.native_url}/generate", json=body)
+        response.raise_for_status()
+        return True
+
+    async def aclose(self) -> None:
+        """Release the pooled connections held by the sync and async clients."""
+        self.client.close()
+        await self.async_client.close()
 
 def setup_ollama_client(
     config: Dict[str, Any]
@@ -0,0 +1,493 @@
+"""Multi-session asyncio HTTP/WebSocket server hosting many agents in one process."""
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+import uuid
+
+from src.agent import Agent, TokenCallback
+from src.config import load_config
+from src.model import ModelInterface
+from src.sandbox import shutdown_process_pool
+from src.session_store import SessionStore
+from src.telemetry import get_tracer
+from src.tools import Tool, tool_cache
+
+# magic value from RFC 6455 used to accept a WebSocket handshake
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_BODY_BYTES = 1024 * 1024
+# ids clients may pick when reopening a session, safe to use in file names
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+STATUS_TEXT = {
+    200: "OK",
+    201: "Created",
+    204: "No Content",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class Session:
+    def __init__(self, session_id: str, agent: Agent, max_concurrent_turns: int):
+        """
+        One isolated conversation: its own agent memory, transcript and turn limit.
+
+        Args:
+            session_id (str): Identifier clients use to address the session.
+            agent (Agent): The agent holding the session's memory.
+            max_concurrent_turns (int): Turns allowed in flight at once for this session.
+        """
+        self.session_id = session_id
+        self.agent = agent
+        self.turns = asyncio.Semaphore(max_concurrent_turns)
+        self.in_flight = 0
+        self.last_active = time.monotonic()
+        # set while closing, when new turns are refused
+        self.closing = False
+        # set whenever no turn is in flight
+        self.drained = asyncio.Event()
+        self.drained.set()
+
+class SessionManager:
+    def __init__(
+        self,
+        create_agent: Callable[[str], Agent],
+        max_sessions: int = 64,
+        idle_timeout: float = 900,
+        max_concurrent_turns: int = 16,
+        max_session_turns: int = 1
+    ):
+        """
+        Create, route to and evict sessions.
+
+        Args:
+            create_agent (Callable[[str], Agent]): Builds the agent for a new session id.
+            max_sessions (int): Sessions allowed at once, new sessions are refused beyond it.
+            idle_timeout (float): Seconds without activity before a session is evicted.
+            max_concurrent_turns (int): Turns allowed in flight across all sessions.
+            max_session_turns (int): Turns allowed in flight within one session.
+        """
+        self.create_agent = create_agent
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_session_turns = max_session_turns
+        self.sessions: Dict[str, Session] = {}
+        # ids of sessions whose agents are still being built
+        self._opening: Set[str] = set()
+        self._turns = asyncio.Semaphore(max_concurrent_turns)
+        self._evictor: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start evicting idle sessions in the background."""
+        if self._evictor is None:
+            self._evictor = asyncio.create_task(self._evict_idle_sessions())
+
+    async def create(self, session_id: Optional[str] = None) -> Session:
+        """
+        Open a new session, or reopen a stored one by its id.
+
+        The agent is built on a worker thread, since restoring a stored session reads
+        the session store and reindexes its turns, and other sessions keep running meanwhile.
+        """
+        if session_id in self.sessions or session_id in self._opening:
+            raise HTTPError(409, f"Session already open: {session_id}")
+        if len(self.sessions) + len(self._opening) >= self.max_sessions:
+            raise HTTPError(503, "Too many sessions")
+        session_id = session_id or uuid.uuid4().hex
+        self._opening.add(session_id)
+        try:
+            agent = await asyncio.to_thread(self.create_agent, session_id)
+        finally:
+            self._opening.discard(session_id)
+        agent.start_transcript()
+        session = Session(session_id, agent, self.max_session_turns)
+        self.sessions[session_id] = session
+        return session
+
+    def get(self, session_id: str) -> Session:
+        """Look up an open session."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, f"Unknown session: {session_id}")
+        return session
+
+    async def chat(
+        self,
+        session_id: str,
+        message: str,
+        on_token: Optional[TokenCallback] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Run one turn in a session, returning the response and its turn stats."""
+        session = self.get(session_id)
+        if session.closing:
+            raise HTTPError(409, f"Session is closing: {session_id}")
+        session.in_flight += 1
+        session.drained.clear()
+        try:
+            async with session.turns, self._turns:
+                session.last_active = time.monotonic()
+                result = await session.agent.chat_completion(message, on_token=on_token)
+                session.agent.log_interaction(message, result)
+                stats = session.agent.turn_stats[-1] if session.agent.turn_stats else {}
+        finally:
+            session.in_flight -= 1
+            session.last_active = time.monotonic()
+            if session.in_flight == 0:
+                session.drained.set()
+        return result, stats
+
+    async def close(self, session_id: str) -> None:
+        """Close a session once its turns in flight finish, then finish its summaries and transcript."""
+        session = self.get(session_id)
+        if session.closing:
+            raise HTTPError(409, f"Session is closing: {session_id}")
+        session.closing = True
+        try:
+            await session.drained.wait()
+        except BaseException:
+            # a cancelled close leaves the session open
+            session.closing = False
+            raise
+        del self.sessions[session_id]
+        await session.agent.flush_memory()
+        session.agent.end_transcript()
+
+    async def aclose(self) -> None:
+        """Stop the evictor and close every session."""
+        if self._evictor is not None:
+            self._evictor.cancel()
+            try:
+                await self._evictor
+            except asyncio.CancelledError:
+                pass
+            self._evictor = None
+        for session_id in list(self.sessions):
+            try:
+                await self.close(session_id)
+            except HTTPError:
+                # already being closed by a request
+                pass
+
+    async def _evict_idle_sessions(self) -> None:
+        """Periodically close sessions that have been idle longer than the timeout."""
+        interval = max(1.0, min(self.idle_timeout / 4, 30.0))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if session.in_flight == 0 and now - session.last_active > self.idle_timeout:
+                    await self.close(session_id)
+
+class AgentServer:
+    def __init__(self, manager: SessionManager, host: str = "127.0.0.1", port: int = 8080):
+        """
+        HTTP/1.1 and WebSocket front end for a `SessionManager`.
+
+        Routes:
+        - GET /health: server status
+        - GET /metrics: Prometheus metrics, when TELEMETRY is enabled
+        - POST /sessions: open a session, or reopen a stored one with body {"session_id": "..."}
+        - POST /sessions/{id}/chat: run a turn, body {"message": "..."}
+        - DELETE /sessions/{id}: close a session once its turns in flight finish
+        - GET /sessions/{id}/ws: WebSocket, each text frame is a turn and tokens are streamed back
+        """
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = set()
+
+    async def start(self) -> None:
+        """Start listening and evicting idle sessions."""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # resolve the real port when an ephemeral one was requested
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.manager.start()
+
+    async def aclose(self) -> None:
+        """Stop accepting connections and close every session."""
+        if self._server is not None:
+            self._server.close()
+            # idle keep-alive connections would otherwise hold wait_closed open
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+        await self.manager.aclose()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve keep-alive HTTP requests on a connection, or hand it over to a WebSocket."""
+        self._connections.add(writer)
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self._handle_websocket(path, headers, reader, writer)
+                    break
+                status, payload = await self._route(method, path, body)
+                await write_response(writer, status, payload)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except HTTPError as e:
+            await write_response(writer, e.status, {"error": e.message})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Optional[Any]]:
+        """Dispatch one HTTP request and return its status and JSON (or plain text) payload."""
+        parts = [part for part in path.split("?", 1)[0].split("/") if part]
+        try:
+            if parts == ["health"] and method == "GET":
+                return 200, {"status": "ok", "sessions": len(self.manager.sessions)}
+            if parts == ["metrics"] and method == "GET":
+                tracer = get_tracer()
+                if not tracer.enabled:
+                    return 404, {"error": "Telemetry is disabled"}
+                return 200, tracer.render_prometheus()
+            if parts == ["sessions"] and method == "POST":
+                session = await self.manager.create(parse_session_id(body))
+                return 201, {"session_id": session.session_id, "restored_turns": session.agent.restored_turns}
+            if len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+                await self.manager.close(parts[1])
+                return 204, None
+            if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "chat" and method == "POST":
+                message = parse_message(body)
+                result, stats = await self.manager.chat(parts[1], message)
+                return 200, {"response": result, "stats": stats}
+            if parts in (["health"], ["metrics"], ["sessions"]) or (parts[:1] == ["sessions"] and len(parts) in (2, 3)):
+                return 405, {"error": f"Method not allowed: {method}"}
+            return 404, {"error": f"Not found: {path}"}
+        except HTTPError as e:
+            return e.status, {"error": e.message}
+        except Exception as e:
+            return 500, {"error": f"Chat request failed. Error: {e}"}
+
+    async def _handle_websocket(
+        self,
+        path: str,
+        headers: Dict[str, str],
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter
+    ) -> None:
+        """Run turns for each text frame, streaming tokens back as JSON frames."""
+        parts = [part for part in path.split("?", 1)[0].split("/") if part]
+        if len(parts) != 3 or parts[0] != "sessions" or parts[2] != "ws":
+            raise HTTPError(404, f"Not found: {path}")
+        session_id = parts[1]
+        self.manager.get(session_id)
+        key = headers.get("sec-websocket-key")
+        if not key:
+            raise HTTPError(400, "Missing Sec-WebSocket-Key")
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        await writer.drain()
+
+        async def send_token(token: str) -> None:
+            writer.write(encode_frame(json.dumps({"type": "token", "text": token})))
+            # a slow client pauses the stream instead of growing the send buffer
+            await writer.drain()
+
+        while True:
+            opcode, payload = await read_frame(reader, writer)
+            if opcode == 0x8:
+                writer.write(encode_frame(b"", opcode=0x8))
+                await writer.drain()
+                return
+            if opcode != 0x1:
+                continue
+            try:
+                result, stats = await self.manager.chat(session_id, payload.decode("utf-8"), on_token=send_token)
+                reply = {"type": "response", "text": result, "stats": stats}
+            except HTTPError as e:
+                reply = {"type": "error", "error": e.message}
+            except Exception as e:
+                reply = {"type": "error", "error": f"Chat request failed. Error: {e}"}
+            writer.write(encode_frame(json.dumps(reply)))
+            await writer.drain()
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Read one HTTP/1.1 request, or None if the client closed the connection."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(400, "Malformed Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, headers, body
+
+async def write_response(writer: asyncio.StreamWriter, status: int, payload: Optional[Any]) -> None:
+    """Write a JSON HTTP/1.1 response, or a plain text one for string payloads."""
+    if isinstance(payload, str):
+        body = payload.encode("utf-8")
+        content_type = "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        content_type = "application/json"
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+def parse_message(body: bytes) -> str:
+    """Extract the user message from a chat request body."""
+    try:
+        message = json.loads(body or b"{}").get("message")
+    except (ValueError, AttributeError):
+        raise HTTPError(400, "Body must be a JSON object")
+    if not isinstance(message, str) or not message.strip():
+        raise HTTPError(400, "Body must contain a non-empty 'message'")
+    return message.strip()
+
+def parse_session_id(body: bytes) -> Optional[str]:
+    """Extract the id of a session to reopen from a create request body, None for a new session."""
+    try:
+        session_id = json.loads(body or b"{}").get("session_id")
+    except (ValueError, AttributeError):
+        raise HTTPError(400, "Body must be a JSON object")
+    if session_id is not None and not (isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id)):
+        raise HTTPError(400, "'session_id' must be 1-64 letters, digits, '_' or '-'")
+    return session_id
+
+def encode_frame(payload: Any, opcode: int = 0x1) -> bytes:
+    """Encode a final, unmasked server-to-client WebSocket frame."""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+async def read_frame(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Tuple[int, bytes]:
+    """
+    Read one WebSocket message, reassembling fragments and answering pings.
+
+    Returns the message opcode (0x1 text, 0x2 binary, 0x8 close) and its payload.
+    """
+    message_opcode = None
+    fragments: List[bytes] = []
+    while True:
+        first, second = await reader.readexactly(2)
+        fin, opcode = first & 0x80, first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        if length > MAX_BODY_BYTES:
+            return 0x8, b""
+        mask = await reader.readexactly(4) if second & 0x80 else b"\x00\x00\x00\x00"
+        data = bytes(byte ^ mask[i % 4] for i, byte in enumerate(await reader.readexactly(length)))
+
+        if opcode == 0x9:
+            writer.write(encode_frame(data, opcode=0xA))
+            await writer.drain()
+            continue
+        if opcode == 0xA:
+            continue
+        if opcode == 0x8:
+            return opcode, data
+        if opcode != 0x0:
+            message_opcode = opcode
+        fragments.append(data)
+        if fin:
+            return message_opcode, b"".join(fragments)
+
+async def serve(tools: List[Tool], identity: str) -> None:
+    """Host many isolated agent sessions over one shared model interface until cancelled."""
+    # read once and shared by the model and every session's agent
+    config = load_config()
+    model = ModelInterface(config)
+    # shared by every session, so sized once rather than by each session's agent
+    tool_cache.resize(config.get("TOOL_CACHE_SIZE", 512))
+    os.makedirs("transcripts", exist_ok=True)
+    # one connection persists every session's memory
+    store = SessionStore(config["SESSION_STORE"]) if config.get("SESSION_STORE") else None
+
+    def create_agent(session_id: str) -> Agent:
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        transcript_file = f"transcripts/transcript_{timestamp}_{session_id[:8]}.txt"
+        return Agent(
+            tools, identity, model=model, transcript_file=transcript_file, config=config,
+            session_id=session_id, session_store=store
+        )
+
+    manager = SessionManager(
+        create_agent,
+        max_sessions=config.get("SERVER_MAX_SESSIONS", 64),
+        idle_timeout=config.get("SESSION_IDLE_TIMEOUT", 900),
+        max_concurrent_turns=config.get("SERVER_MAX_CONCURRENT_TURNS", 16),
+        max_session_turns=config.get("SESSION_MAX_CONCURRENT_TURNS", 1),
+    )
+    server = AgentServer(manager, config.get("SERVER_HOST", "127.0.0.1"), config.get("SERVER_PORT", 8080))
+    try:
+        if config.get("WARMUP", False):
+            await model.warm_up()
+        model.keep_warm()
+        await server.start()
+        print(f"Agent server listening on http://{server.host}:{server.port}")
+        await asyncio.Event().wait()
+    finally:
+        await server.aclose()
+        await model.aclose()
+        if store is not None:
+            store.close()
+        shutdown_process_pool()
+        get_tracer().close()
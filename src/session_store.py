@@ -0,0 +1,187 @@
+"""Durable session state: an append-only SQLite log of turns with periodic snapshots."""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import json
+import queue
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    session_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    state TEXT NOT NULL
+);
+"""
+
+# a logged exchange, kept for good as the session's history
+TURN = "turn"
+# a long-term memory update, superseded by the next snapshot
+MEMORY = "memory"
+
+# sentinel asking the writer thread to finish
+_CLOSE = object()
+
+class SessionStore:
+    def __init__(self, path: str):
+        """
+        Session memory persisted to a SQLite file.
+
+        Every turn and long-term memory update is one appended row, committed in WAL
+        mode without waiting for an fsync. A snapshot holds a session's whole memory
+        state at a point in the log; restoring loads the latest snapshot and replays
+        the few events after it. Snapshots drop the memory updates they supersede,
+        while turns are kept as the session's full history.
+
+        Appends and snapshots are serialized by the caller and queued to a background
+        thread that commits them in batches, so a turn never waits on the disk from the
+        event loop. Reads wait for the queued writes first.
+
+        Args:
+            path (str): SQLite database file, created if missing.
+        """
+        self.path = path
+        # shared by reads and the writer thread, one at a time
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # a power loss may drop the last turns, but never corrupts the log
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._next_seq: Dict[str, int] = {}
+        self._writes: queue.Queue = queue.Queue()
+        # the first write that failed since the last flush, raised by `flush()`
+        self._error: Optional[Exception] = None
+        self._writer = threading.Thread(target=self._write_forever, name="session-writer", daemon=True)
+        self._writer.start()
+
+    def append(self, session_id: str, kind: str, data: Dict[str, Any]) -> int:
+        """Queue one event and return its sequence number."""
+        seq = self._seq(session_id)
+        self._writes.put((self._append_event, (session_id, seq, kind, json.dumps(data))))
+        self._next_seq[session_id] = seq + 1
+        return seq
+
+    def snapshot(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Queue the session's state as of its last event, dropping memory updates it supersedes."""
+        seq = self._seq(session_id) - 1
+        self._writes.put((self._store_snapshot, (session_id, seq, json.dumps(state))))
+
+    def flush(self) -> None:
+        """Wait until every queued write is committed, raising the first write that failed since the last flush."""
+        self._writes.join()
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def load(self, session_id: str) -> Tuple[Optional[Dict[str, Any]], List[Tuple[str, Dict[str, Any]]]]:
+        """The session's latest snapshot (None if it has none) and the events logged after it."""
+        self.flush()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT seq, state FROM snapshots WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            seq, state = (row[0], json.loads(row[1])) if row else (-1, None)
+            events = self._db.execute(
+                "SELECT kind, data FROM events WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, seq),
+            ).fetchall()
+        return state, [(kind, json.loads(data)) for kind, data in events]
+
+    def turns(self, session_id: str) -> List[Dict[str, Any]]:
+        """Every turn logged for the session, oldest first."""
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM events WHERE session_id = ? AND kind = ? ORDER BY seq",
+                (session_id, TURN),
+            ).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def sessions(self) -> List[str]:
+        """Ids of every stored session."""
+        self.flush()
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT session_id FROM events ORDER BY session_id").fetchall()
+        return [session_id for session_id, in rows]
+
+    def close(self) -> None:
+        """Commit queued writes and close the database."""
+        self._writes.put(_CLOSE)
+        self._writer.join()
+        self._db.close()
+
+    def _seq(self, session_id: str) -> int:
+        """Next sequence number of a session, read from the log the first time."""
+        if session_id not in self._next_seq:
+            # nothing of this session is queued yet, so the file is up to date
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT MAX(seq) FROM events WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                snapshot = self._db.execute(
+                    "SELECT seq FROM snapshots WHERE session_id = ?", (session_id,)
+                ).fetchone()
+            last = max(row[0] if row[0] is not None else -1, snapshot[0] if snapshot else -1)
+            self._next_seq[session_id] = last + 1
+        return self._next_seq[session_id]
+
+    def _write_forever(self) -> None:
+        """Commit queued writes, everything queued at once in one transaction, until `close()` is called."""
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            writes = [item for item in batch if item is not _CLOSE]
+            try:
+                if writes:
+                    self._write_batch(writes)
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+            if len(writes) < len(batch):
+                return
+
+    def _write_batch(self, writes: List[Tuple[Callable[..., None], tuple]]) -> None:
+        """Commit writes in one transaction, or one by one if that fails, so a bad write only loses itself."""
+        with self._lock:
+            try:
+                with self._db:
+                    for write, args in writes:
+                        write(*args)
+                return
+            except Exception:
+                pass
+            for write, args in writes:
+                try:
+                    with self._db:
+                        write(*args)
+                except Exception as e:
+                    print(f"Session store write failed. Error: {e}")
+                    self._error = self._error or e
+
+    def _append_event(self, session_id: str, seq: int, kind: str, data: str) -> None:
+        self._db.execute(
+            "INSERT INTO events (session_id, seq, kind, data) VALUES (?, ?, ?, ?)",
+            (session_id, seq, kind, data),
+        )
+
+    def _store_snapshot(self, session_id: str, seq: int, state: str) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO snapshots (session_id, seq, state) VALUES (?, ?, ?)",
+            (session_id, seq, state),
+        )
+        self._db.execute(
+            "DELETE FROM events WHERE session_id = ? AND kind = ? AND seq <= ?",
+            (session_id, MEMORY, seq),
+        )
@@ -0,0 +1,229 @@
+"""Tracing spans and metrics for the agent's turns."""
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+import contextvars
+import itertools
+import json
+import os
+import time
+import uuid
+
+# upper bounds (seconds) of the span duration histogram buckets
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "local_agent"
+
+# the innermost open span, so nested spans (including those in tasks) find their parent
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+class Span:
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        """A timed operation. Use as a context manager, or call `finish()` for spans that are never made current."""
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = next(_span_ids)
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self._token = None
+        self._finished = False
+
+    def set(self, **attributes: Any) -> None:
+        """Attach attributes to the span."""
+        self.attributes.update(attributes)
+
+    def fail(self, error: Any) -> None:
+        """Mark the span as failed, e.g. for errors reported as return values."""
+        self.error = str(error)
+
+    def finish(self) -> None:
+        """End the span and record it."""
+        if not self._finished:
+            self._finished = True
+            self.tracer._record(self, time.perf_counter() - self._start)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None and self.error is None:
+            self.error = f"{exc_type.__name__}: {exc}" if str(exc) else exc_type.__name__
+        _current_span.reset(self._token)
+        self.finish()
+        return False
+
+class NoopSpan:
+    """Span that records nothing."""
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def fail(self, error: Any) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+    def __enter__(self) -> "NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+NOOP_SPAN = NoopSpan()
+
+class NoopTracer:
+    """Tracer used when telemetry is disabled: every call returns immediately."""
+    enabled = False
+
+    def span(self, name: str, **attributes: Any) -> NoopSpan:
+        return NOOP_SPAN
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        pass
+
+    def record_usage(self, usage: Optional[Dict[str, int]]) -> None:
+        pass
+
+    def render_prometheus(self) -> str:
+        return ""
+
+    def close(self) -> None:
+        pass
+
+class Tracer:
+    enabled = True
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Record span timings and counters, exposed in the Prometheus text format.
+
+        Args:
+            path (str, optional): JSONL file every finished span is appended to.
+        """
+        self.path = path
+        self._file = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+        # span name -> [bucket counts..., count, sum]
+        self._spans: Dict[str, list] = {}
+        # (metric name, sorted labels) -> value
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+
+    def span(self, name: str, **attributes: Any) -> Span:
+        """Start a span, nested under the current one."""
+        return Span(self, name, attributes)
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        """Add to a counter."""
+        self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def record_usage(self, usage: Optional[Dict[str, int]]) -> None:
+        """Count the prompt, completion and cached prompt tokens from provider usage fields."""
+        for kind, key in (("prompt", "prompt_tokens"), ("completion", "completion_tokens"), ("cached", "cached_tokens")):
+            if usage and usage.get(key):
+                self.count("tokens_total", usage[key], kind=kind)
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {METRIC_PREFIX}_span_duration_seconds Time spent in each traced operation.",
+            f"# TYPE {METRIC_PREFIX}_span_duration_seconds histogram",
+        ]
+        for name, values in sorted(self._spans.items()):
+            cumulative = 0
+            for bound, bucket in zip(SPAN_BUCKETS, values):
+                cumulative += bucket
+                lines.append(f'{METRIC_PREFIX}_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+            count, total = values[-2], values[-1]
+            lines.append(f'{METRIC_PREFIX}_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {count}')
+            lines.append(f'{METRIC_PREFIX}_span_duration_seconds_count{{span="{name}"}} {count}')
+            lines.append(f'{METRIC_PREFIX}_span_duration_seconds_sum{{span="{name}"}} {total}')
+
+        typed = set()
+        for (name, labels), value in sorted(self._counters.items()):
+            metric = f"{METRIC_PREFIX}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+            lines.append(f"{metric}{{{label_text}}} {value:g}" if label_text else f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        """Flush and close the trace file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _record(self, span: Span, duration: float) -> None:
+        """Fold a finished span into the metrics and append it to the trace file."""
+        values = self._spans.get(span.name)
+        if values is None:
+            values = self._spans[span.name] = [0] * (len(SPAN_BUCKETS) + 2)
+        for i, bound in enumerate(SPAN_BUCKETS):
+            if duration <= bound:
+                values[i] += 1
+                break
+        values[-2] += 1
+        values[-1] += duration
+        if span.error is not None:
+            self.count("span_errors_total", span=span.name)
+
+        if self._file is not None:
+            record = {
+                "trace_id": span.trace_id,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "name": span.name,
+                "start": span.start_time,
+                "duration_ms": duration * 1000,
+                "attributes": span.attributes,
+                "error": span.error,
+            }
+            self._file.write(json.dumps(record, default=str) + "\n")
+
+def load_tracer(config: Dict[str, Any]) -> Any:
+    """
+    Build the tracer named by the TELEMETRY config value.
+
+    "none" disables telemetry, "prometheus" keeps metrics for the server's /metrics
+    endpoint, and "jsonl" also appends every span to TELEMETRY_PATH.
+    """
+    mode = config.get("TELEMETRY", "none")
+    if mode == "none":
+        return NoopTracer()
+    if mode == "prometheus":
+        return Tracer()
+    if mode == "jsonl":
+        return Tracer(config.get("TELEMETRY_PATH", "traces/trace.jsonl"))
+    raise ValueError(f"Unsupported TELEMETRY: {mode}")
+
+# tracer shared by the agent, model interface and tools
+_tracer: Any = NoopTracer()
+_configured = False
+
+def get_tracer() -> Any:
+    """The installed tracer."""
+    return _tracer
+
+def set_tracer(tracer: Any) -> None:
+    """Install a tracer, replacing the current one."""
+    global _tracer, _configured
+    _tracer = tracer
+    _configured = True
+
+def configure_tracer(config: Dict[str, Any]) -> Any:
+    """Install the tracer described by the config on first use and return the installed tracer."""
+    if not _configured:
+        set_tracer(load_tracer(config))
+    return _tracer
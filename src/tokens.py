@@ -0,0 +1,63 @@
+"""Local token counting used to keep prompts within their budgets."""
+from typing import Callable, List, Optional
+
+# rough characters-per-token ratio for English text with BPE tokenizers
+CHARS_PER_TOKEN = 4
+
+class TokenCounter:
+    def __init__(
+        self,
+        encode: Optional[Callable[[str], List[int]]] = None,
+        decode: Optional[Callable[[List[int]], str]] = None
+    ):
+        """
+        Count and truncate text by tokens.
+
+        With no tokenizer functions the counter estimates tokens from the character
+        length, which is cheap and close enough for budgeting on small local models.
+
+        Args:
+            encode (Callable[[str], List[int]], optional): Tokenizer encode function.
+            decode (Callable[[List[int]], str], optional): Tokenizer decode function, required with `encode`.
+        """
+        if (encode is None) != (decode is None):
+            raise ValueError("encode and decode must be provided together")
+        self.encode = encode
+        self.decode = decode
+
+    def count(self, text: str) -> int:
+        """Number of tokens in the text."""
+        if not text:
+            return 0
+        if self.encode:
+            return len(self.encode(text))
+        return -(-len(text) // CHARS_PER_TOKEN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keep the leading text that fits within `max_tokens`."""
+        if max_tokens <= 0:
+            return ""
+        if self.encode:
+            tokens = self.encode(text)
+            return text if len(tokens) <= max_tokens else self.decode(tokens[:max_tokens])
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+def load_token_counter(tokenizer: str = "estimate") -> TokenCounter:
+    """
+    Build the token counter named by the TOKENIZER config value.
+
+    Args:
+        tokenizer (str): "estimate" for the character based estimate, or
+            "tiktoken" / "tiktoken:<encoding>" to use the optional tiktoken package.
+    """
+    name, _, option = tokenizer.partition(":")
+    if name == "estimate":
+        return TokenCounter()
+    if name == "tiktoken":
+        try:
+            import tiktoken
+        except ImportError as e:
+            raise ImportError("TOKENIZER 'tiktoken' requires the tiktoken package: pip install tiktoken") from e
+        encoding = tiktoken.get_encoding(option or "cl100k_base")
+        return TokenCounter(encoding.encode, encoding.decode)
+    raise ValueError(f"Unsupported TOKENIZER: {tokenizer}")
@@ -1,15 +1,159 @@
+import asyncio
+import inspect
+import time
+
+from collections import OrderedDict
 from datetime import datetime
-from typing import Callable
+from typing import Callable, Dict, Optional, Tuple
+
+from src.sandbox import get_process_pool
+from src.telemetry import get_tracer
+
+# where a sync tool function runs
+TOOL_MODES = {"inline", "thread", "process"}
+# how long a tool's results may be reused: never, for cache_ttl seconds, or forever
+CACHE_POLICIES = {"none", "ttl", "pure"}
+
+def normalize_arg(arg: str) -> str:
+    """Normalize a tool argument so equivalent calls share a cache entry."""
+    arg = " ".join(arg.split())
+    if len(arg) >= 2 and arg[0] == arg[-1] and arg[0] in "'\"":
+        arg = arg[1:-1].strip()
+    return arg
+
+class ToolResultCache:
+    def __init__(self, max_entries: int = 512):
+        """
+        Bounded LRU cache of tool results keyed on tool name and normalized argument.
+
+        Args:
+            max_entries (int): Results kept before the least recently used are evicted.
+        """
+        self.max_entries = max_entries
+        # (tool name, normalized arg) -> (result, expires at or None)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, Optional[float]]]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def get(self, name: str, arg: str) -> Optional[str]:
+        """Cached result for a call, or None."""
+        key = (name, normalize_arg(arg))
+        stats = self._stats.setdefault(name, {"hits": 0, "misses": 0, "evictions": 0})
+        entry = self._entries.get(key)
+        if entry is not None:
+            result, expires_at = entry
+            if expires_at is None or time.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                stats["hits"] += 1
+                return result
+            del self._entries[key]
+        stats["misses"] += 1
+        return None
+
+    def put(self, name: str, arg: str, result: str, ttl: Optional[float] = None) -> None:
+        """Store a result, valid for `ttl` seconds or forever when None."""
+        key = (name, normalize_arg(arg))
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (result, expires_at)
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def resize(self, max_entries: int) -> None:
+        """Change the bound, evicting the least recently used results beyond it."""
+        self.max_entries = max_entries
+        self._evict()
+
+    def invalidate(self, name: Optional[str] = None, arg: Optional[str] = None) -> None:
+        """Drop cached results: everything, one tool's, or a single call's."""
+        if name is None:
+            self._entries.clear()
+        elif arg is None:
+            for key in [key for key in self._entries if key[0] == name]:
+                del self._entries[key]
+        else:
+            self._entries.pop((name, normalize_arg(arg)), None)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-tool hits, misses, evictions and hit rate."""
+        return {
+            name: {**counts, "hit_rate": counts["hits"] / max(1, counts["hits"] + counts["misses"])}
+            for name, counts in self._stats.items()
+        }
+
+    def _evict(self) -> None:
+        """Drop the least recently used results until within `max_entries`."""
+        while len(self._entries) > self.max_entries:
+            (evicted_name, _), _ = self._entries.popitem(last=False)
+            self._stats.setdefault(evicted_name, {"hits": 0, "misses": 0, "evictions": 0})["evictions"] += 1
+
+# results shared by every cacheable tool, sized once at start-up from TOOL_CACHE_SIZE
+tool_cache = ToolResultCache()
 
 class Tool:
-    def __init__(self, name: str, func: Callable[[str], str], description: str):
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[str], str],
+        description: str,
+        timeout: Optional[float] = None,
+        mode: str = "thread",
+        cache: str = "none",
+        cache_ttl: Optional[float] = None
+    ):
+        """
+        Args:
+            name (str): Tool identifier used in tool calls.
+            func (Callable[[str], str]): The function to execute, sync or async.
+            description (str): Instructions for the LLM.
+            timeout (float, optional): Seconds the agent waits for a result, None uses the agent's TOOL_TIMEOUT.
+            mode (str): Where a sync `func` runs: "inline" on the event loop (trivial tools only),
+                "thread" in a worker thread, or "process" in the sandboxed worker pool, which
+                can kill hung or runaway calls. Process tools must be picklable module-level functions.
+            cache (str): Result reuse policy: "none" for tools with side effects or changing
+                output, "ttl" to reuse results for `cache_ttl` seconds, "pure" to reuse them forever.
+            cache_ttl (float, optional): Seconds a result stays valid with the "ttl" policy.
+        """
+        if mode not in TOOL_MODES:
+            raise ValueError(f"Unsupported tool mode: {mode}")
+        if cache not in CACHE_POLICIES:
+            raise ValueError(f"Unsupported tool cache policy: {cache}")
+        if cache == "ttl" and cache_ttl is None:
+            raise ValueError("The 'ttl' cache policy requires cache_ttl")
+        if mode == "process" and inspect.iscoroutinefunction(func):
+            raise ValueError("Async tools run on the event loop and cannot use process mode")
         self.name = name
         self.func = func
         self.description = description
+        self.timeout = timeout
+        self.mode = mode
+        self.cache = cache
+        self.cache_ttl = cache_ttl
 
     def run(self, arg: str) -> str:
         return self.func(arg) if arg != "" else self.func()
 
+    async def arun(self, arg: str) -> str:
+        """Run the tool without blocking the event loop, reusing a cached result when its policy allows."""
+        with get_tracer().span("tool.run", tool=self.name, mode=self.mode) as span:
+            if self.cache == "none":
+                return await self._execute(arg)
+            cached = tool_cache.get(self.name, arg)
+            span.set(cache="miss" if cached is None else "hit")
+            if cached is not None:
+                return cached
+            result = await self._execute(arg)
+            tool_cache.put(self.name, arg, result, self.cache_ttl if self.cache == "ttl" else None)
+            return result
+
+    async def _execute(self, arg: str) -> str:
+        """Call the tool function according to its mode."""
+        if inspect.iscoroutinefunction(self.func):
+            return await (self.func(arg) if arg != "" else self.func())
+        if self.mode == "inline":
+            return self.run(arg)
+        if self.mode == "process":
+            return await get_process_pool().run(self.func, arg, self.timeout)
+        return await asyncio.to_thread(self.run, arg)
+
 # Example prompt to use the time tool: "What time is it?"
 def time_tool() -> str:
     now = datetime.now()
@@ -20,10 +164,12 @@ tools = [
     Tool(
         "Time",
         time_tool,
-        "Prints the current date and time. Usage: return 'Time()'"
+        "Prints the current date and time. Usage: return 'Time()'",
+        mode="inline",
+        cache="none"
     )
 ]
 # Build tool descriptions for the instructions
 tool_descriptions = "\n".join(
     f"- {tool.name}: {tool.description}" for tool in tools
-)
\ No newline at end of file
+)
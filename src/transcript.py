@@ -0,0 +1,157 @@
+"""Buffered, rotating transcript files written by a background thread."""
+from typing import Any, Dict, Optional
+
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+
+# sentinel asking the writer thread to finish
+_CLOSE = object()
+
+def read_transcript(path: str, header: str = "", footer: str = "") -> str:
+    """The entries of a transcript file (gzipped if it ends in .gz), without its header and footer."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        text = f.read()
+    text = text.removeprefix(header)
+    # a transcript cut short by a crash has no footer
+    return text.removesuffix(footer) if footer else text
+
+class TranscriptWriter:
+    def __init__(
+        self,
+        path: str,
+        header: str = "",
+        footer: str = "",
+        flush_interval: float = 1.0,
+        flush_bytes: int = 64 * 1024,
+        rotate_bytes: Optional[int] = None,
+        rotate_seconds: Optional[float] = None,
+        compress: bool = False
+    ):
+        """
+        Append-only transcript kept open for the whole session.
+
+        `write()` only queues the text; a background thread writes it through one
+        buffered handle and flushes it every `flush_interval` seconds or once
+        `flush_bytes` are pending. When the file grows past `rotate_bytes` or is older
+        than `rotate_seconds` it is closed with the footer, renamed to `<name>.<n><ext>`
+        (gzipped when `compress` is set) and a new file is started with the header.
+        A transcript without entries is deleted on `close()`.
+
+        Args:
+            path (str): Transcript file.
+            header (str): Text at the start of every file.
+            footer (str): Text at the end of every file with entries.
+            flush_interval (float): Longest time, in seconds, written text stays buffered.
+            flush_bytes (int): Buffered bytes that trigger a flush.
+            rotate_bytes (int, optional): File size that triggers rotation, None to never rotate by size.
+            rotate_seconds (float, optional): File age that triggers rotation, None to never rotate by age.
+            compress (bool): Gzip rotated files.
+        """
+        self.path = path
+        self.header = header
+        self.footer = footer
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+
+        # entries written to the current file, so emptiness never needs a reread
+        self.entries = 0
+        self.rotations = 0
+        self.closed = False
+        # rotating or deleting only makes sense for regular files, not e.g. os.devnull
+        self._regular = not os.path.exists(path) or os.path.isfile(path)
+
+        # opened here so a bad path fails at the caller rather than in the thread
+        self._file = self._open()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_forever, name="transcript-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, text: str) -> None:
+        """Queue one entry for the background writer."""
+        if self.closed:
+            raise ValueError("Transcript is closed")
+        self._queue.put(text)
+
+    def close(self) -> None:
+        """Write everything queued, then finish the file (deleting it if it has no entries)."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Entries in the current file and rotations so far."""
+        return {"path": self.path, "entries": self.entries, "rotations": self.rotations}
+
+    def _open(self):
+        f = open(self.path, "w", encoding="utf-8")
+        f.write(self.header)
+        self._size = len(self.header.encode("utf-8"))
+        self._pending = self._size
+        self._opened_at = time.monotonic()
+        self.entries = 0
+        return f
+
+    def _write_forever(self) -> None:
+        """Drain the queue, flushing on size or time, until `close()` is called."""
+        while True:
+            try:
+                # an idle writer with nothing buffered just blocks until the next entry
+                item = self._queue.get(timeout=self.flush_interval if self._pending else None)
+            except queue.Empty:
+                self._flush()
+                continue
+            if item is _CLOSE:
+                self._finish()
+                return
+            data = item.encode("utf-8")
+            self._file.write(item)
+            self._size += len(data)
+            self._pending += len(data)
+            self.entries += 1
+            if self._pending >= self.flush_bytes:
+                self._flush()
+            if self._should_rotate():
+                self._rotate()
+
+    def _flush(self) -> None:
+        if self._pending:
+            self._file.flush()
+            self._pending = 0
+
+    def _should_rotate(self) -> bool:
+        if not self._regular:
+            return False
+        too_big = self.rotate_bytes is not None and self._size >= self.rotate_bytes
+        too_old = self.rotate_seconds is not None and time.monotonic() - self._opened_at >= self.rotate_seconds
+        return too_big or too_old
+
+    def _rotate(self) -> None:
+        """Finish the current file, move it aside and start a new one."""
+        self._file.write(self.footer)
+        self._file.close()
+        self.rotations += 1
+        stem, ext = os.path.splitext(self.path)
+        rotated = f"{stem}.{self.rotations}{ext}"
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self._file = self._open()
+
+    def _finish(self) -> None:
+        if self.entries:
+            self._file.write(self.footer)
+        self._file.close()
+        if not self.entries and self._regular:
+            os.remove(self.path)
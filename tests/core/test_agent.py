@@ -5,13 +5,20 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
 
 import pytest
 import asyncio
+import httpx
+import time
 from src.agent import Agent
+from src.config import Config
+from src.servers.common import Completion, DeadlineExceeded
 from src.tools import Tool
 
 class DummyModel:
-    def chat_completion(self, messages):
+    async def chat_completion(self, messages, **kwargs):
         return "Hello, world!"
 
+    async def aclose(self):
+        pass
+
 def dummy_tool_func(arg=None):
     return f"Echo: {arg}" if arg else "Echo:"
 
@@ -20,19 +27,351 @@ def test_agent_run_and_memory(monkeypatch):
     inputs = ["test message", "exit"]
     monkeypatch.setattr("builtins.input", lambda _: inputs.pop(0))
     # Patch ModelInterface to DummyModel
-    monkeypatch.setattr("src.agent.ModelInterface", lambda: DummyModel())
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: DummyModel())
     tools = [Tool("Echo", dummy_tool_func, "Echoes input")]
-    agent = Agent(tools, "Test agent identity")
+    agent = Agent(tools, "Test agent identity", config=Config({}))
     # Use a platform-independent temp file
     agent.transcript_file = os.path.join(tempfile.gettempdir(), "test_transcript.txt")
     agent.run()
     assert agent.short_memory[-1]["content"] == "Hello, world!"
 
 def test_agent_tool_call(monkeypatch):
-    monkeypatch.setattr("src.agent.ModelInterface", lambda: DummyModel())
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: DummyModel())
     tools = [Tool("Echo", dummy_tool_func, "Echoes input")]
-    agent = Agent(tools, "Test agent identity")
+    agent = Agent(tools, "Test agent identity", config=Config({}))
     # Simulate a tool call response
-    agent.model.chat_completion = lambda messages: "Echo(test)"
+    async def tool_call_response(messages, **kwargs):
+        return "Echo(test)"
+    agent.model.chat_completion = tool_call_response
     result = asyncio.run(agent.chat_completion("test"))
     assert result == "Echo: test"
+
+def test_agent_turns_overlap_on_one_loop(monkeypatch):
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: DummyModel())
+    agent = Agent([], "Test agent identity", config=Config({}))
+    in_flight = []
+    peak = []
+
+    async def slow_response(messages, **kwargs):
+        in_flight.append(1)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.05)
+        in_flight.pop()
+        return "done"
+    agent.model.chat_completion = slow_response
+
+    async def two_turns():
+        return await asyncio.gather(agent.chat_completion("a"), agent.chat_completion("b"))
+    assert asyncio.run(two_turns()) == ["done", "done"]
+    assert max(peak) == 2
+
+class StreamingDummyModel(DummyModel):
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    async def stream_completion(self, messages, **kwargs):
+        for token in self.tokens:
+            yield token
+
+def test_agent_streams_tokens_and_records_stats(monkeypatch):
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: StreamingDummyModel(["Hel", "lo", " there"]))
+    agent = Agent([Tool("Echo", dummy_tool_func, "Echoes input")], "Test agent identity", config=Config({}))
+    agent._stream = True
+    rendered = []
+    result = asyncio.run(agent.chat_completion("hi", on_token=rendered.append))
+    assert result == "Hello there"
+    assert "".join(rendered) == "Hello there"
+    stats = agent.turn_stats[-1]
+    assert stats["time_to_first_token"] <= stats["total_time"]
+    assert stats["tokens_per_sec"] is not None
+
+def test_agent_streaming_holds_back_tool_calls(monkeypatch):
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: StreamingDummyModel(["Ec", "ho(", "streamed", ")"]))
+    agent = Agent([Tool("Echo", dummy_tool_func, "Echoes input")], "Test agent identity", config=Config({}))
+    agent._stream = True
+    rendered = []
+    result = asyncio.run(agent.chat_completion("hi", on_token=rendered.append))
+    assert result == "Echo: streamed"
+    assert rendered == []
+
+class RecordingStreamModel(DummyModel):
+    """Streams tokens, recording how many were generated and whether the stream was closed early."""
+    def __init__(self, tokens, log=None):
+        self.tokens = tokens
+        self.log = log if log is not None else []
+        self.generated = 0
+        self.closed_early = False
+
+    async def stream_completion(self, messages, **kwargs):
+        try:
+            for token in self.tokens:
+                await asyncio.sleep(0.01)
+                self.generated += 1
+                yield token
+            self.log.append("stream finished")
+        except GeneratorExit:
+            self.closed_early = True
+            raise
+
+def test_streaming_tool_call_stops_generation_at_closing_paren(monkeypatch):
+    model = RecordingStreamModel(["Ec", "ho(", "now", ")", " I will", " now", " explain", " at length"])
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: model)
+    agent = Agent([Tool("Echo", dummy_tool_func, "Echoes input")], "Test agent identity", config=Config({}))
+    agent._stream = True
+    assert asyncio.run(agent.chat_completion("hi")) == "Echo: now"
+    # the trailing prose is cut off after its first token
+    assert model.generated == 5
+    assert model.closed_early
+
+def test_streaming_tool_batch_starts_each_call_before_the_stream_ends(monkeypatch):
+    log = []
+    def logging_tool(arg=None):
+        log.append(f"tool {arg}")
+        return f"Echo: {arg}"
+    model = RecordingStreamModel(["Echo(a)", "\n", "Echo(b)", "\n", "\n"], log)
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: model)
+    agent = Agent([Tool("Echo", logging_tool, "Echoes input")], "Test agent identity", config=Config({}))
+    agent._stream = True
+    assert asyncio.run(agent.chat_completion("hi")) == "Echo: a\nEcho: b"
+    assert log == ["tool a", "tool b", "stream finished"]
+
+class FailingStreamModel(DummyModel):
+    async def stream_completion(self, messages, **kwargs):
+        yield "Partial "
+        request = httpx.Request("POST", "http://stub/v1/chat/completions")
+        raise httpx.RemoteProtocolError("peer closed connection", request=request)
+
+def test_stream_failing_partway_reports_the_error(monkeypatch):
+    agent = Agent([], "Test agent identity", model=FailingStreamModel(), config=Config({"STREAM": True}))
+    rendered = []
+    result = asyncio.run(agent.chat_completion("hi", on_token=rendered.append))
+    assert rendered == ["Partial "]
+    assert result == "Chat request failed. Error: peer closed connection"
+    # like a timed out turn, a failed one is kept out of memory
+    assert agent.short_memory == []
+
+def test_speculative_tools_can_be_disabled(monkeypatch):
+    model = RecordingStreamModel(["Echo(now)", " and more"])
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: model)
+    agent = Agent([Tool("Echo", dummy_tool_func, "Echoes input")], "Test agent identity", config=Config({}))
+    agent._stream = True
+    agent._speculative_tools = False
+    asyncio.run(agent.chat_completion("hi"))
+    assert model.generated == 2
+    assert not model.closed_early
+
+def test_streamed_and_complete_responses_parse_the_same_calls(monkeypatch):
+    tools = [Tool("Echo", dummy_tool_func, "Echoes input")]
+    responses = [
+        "Echo(now) trailing text",
+        "Echo(a) Echo(b)",
+        "Echo(a)\nsome prose",
+        "Echo(a)\n  Echo(b (c))\n",
+        "Unknown(x)",
+        "Plain prose (with parentheses).",
+    ]
+    for response in responses:
+        complete = Agent(tools, "Test agent identity", model=DummyModel(), config=Config({}))
+        complete.model.chat_completion = lambda messages, response=response, **kwargs: asyncio.sleep(0, response)
+        # one character per token, so every boundary is exercised
+        streamed = Agent(tools, "Test agent identity", model=RecordingStreamModel(list(response)), config=Config({}))
+        streamed._stream = True
+        assert asyncio.run(streamed.chat_completion("hi")) == asyncio.run(complete.chat_completion("hi")), response
+    assert complete._parse_tool_calls("Echo(now) trailing text") == [("Echo", "now")]
+
+class SummarizingDummyModel(DummyModel):
+    def __init__(self):
+        self.summary_calls = 0
+        self.release = None
+
+    async def chat_completion(self, messages, **kwargs):
+        if messages[0]["content"].startswith("Summarize these messages"):
+            self.summary_calls += 1
+            await self.release.wait()
+            return Completion(f"summary {self.summary_calls}")
+        return "Hello, world!"
+
+def test_long_memory_summaries_run_in_background_and_coalesce(monkeypatch):
+    model = SummarizingDummyModel()
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: model)
+    agent = Agent([], "Test agent identity", config=Config({}))
+    agent._disable_long_memory = False
+    agent._max_short_memory = 2
+
+    async def scenario():
+        model.release = asyncio.Event()
+        # every turn evicts, but no turn waits for the summary
+        for i in range(4):
+            assert await agent.chat_completion(f"turn {i}") == "Hello, world!"
+            await asyncio.sleep(0)
+        assert agent.long_memory == ""
+        model.release.set()
+        await agent.flush_memory()
+
+    asyncio.run(scenario())
+    # the first eviction starts a summary, the later three coalesce into one more
+    assert model.summary_calls == 2
+    # each summary covers only its own evictions, so both are kept
+    assert agent.long_memory == "summary 1\nsummary 2"
+    assert agent._pending_evictions == []
+
+class FailingSummaryModel(DummyModel):
+    def __init__(self):
+        self.fail = True
+
+    async def chat_completion(self, messages, **kwargs):
+        if messages[0]["content"].startswith("Summarize these messages"):
+            if self.fail:
+                return "Chat request failed. Error: connection refused"
+            return Completion("recovered summary")
+        return "Hello, world!"
+
+def test_failed_summaries_are_retried_not_stored(monkeypatch):
+    model = FailingSummaryModel()
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: model)
+    agent = Agent([], "Test agent identity", config=Config({}))
+    agent._disable_long_memory = False
+    agent._max_short_memory = 2
+
+    async def scenario():
+        await agent.chat_completion("turn 0")
+        await agent.chat_completion("turn 1")
+        await agent.flush_memory()
+        # the provider's error never becomes a summary, its chunk waits for a retry
+        assert agent.long_memory == ""
+        assert [message["content"] for message in agent._pending_evictions] == ["turn 0", "Hello, world!"]
+        model.fail = False
+        await agent.chat_completion("turn 2")
+        await agent.flush_memory()
+
+    asyncio.run(scenario())
+    assert agent.long_memory == "recovered summary"
+    assert agent._pending_evictions == []
+
+def test_prompt_history_respects_token_budget(monkeypatch):
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: DummyModel())
+    agent = Agent([], "Test agent identity", config=Config({}))
+    agent._max_short_memory_tokens = 50
+    agent._max_user_input_tokens = 10
+    agent._handle_memory("pasted log " + "x" * 4000, "ok")
+    agent._handle_memory("small question", "small answer")
+    messages = agent._build_prompt("y" * 400)
+    contents = [message["content"] for message in messages]
+    assert "User: small question" in contents
+    assert not any("pasted log" in content for content in contents)
+    # the pasted log's turn is dropped whole, its response included
+    assert "Assistant: ok" not in contents
+    assert messages[-1]["content"] == "y" * 40
+
+def test_short_memory_token_total_is_kept_in_step(monkeypatch):
+    agent = Agent([], "Test agent identity", model=DummyModel(), config=Config({}))
+    agent._prompt_layout = "prefix_cache"
+    agent._max_short_memory_tokens = 100
+    for i in range(30):
+        agent._handle_memory(f"question {i} " + "x" * (i * 7), "answer")
+        assert agent._short_memory_tokens == sum(message["tokens"] for message in agent.short_memory)
+    assert agent._short_memory_tokens <= 100
+
+def test_prefix_cache_layout_keeps_prompt_prefix_stable(monkeypatch):
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: DummyModel())
+    agent = Agent([], "Test agent identity", config=Config({}))
+    agent._prompt_layout = "prefix_cache"
+    agent._max_short_memory = 8
+    previous = None
+    evictions = 0
+    for i in range(12):
+        prompt = agent._build_prompt(f"question {i}")
+        assert [message["role"] for message in prompt[1:]] == ["user", "assistant"] * ((len(prompt) - 2) // 2) + ["user"]
+        if previous is not None and prompt[:len(previous) - 1] != previous[:-1]:
+            evictions += 1
+        previous = prompt
+        agent._handle_memory(f"question {i}", f"answer {i}")
+    # block eviction changes the prefix only every few turns, not on every turn
+    assert 0 < evictions <= 4
+
+def test_turn_stats_report_cached_prompt_tokens(monkeypatch):
+    from src.servers.common import Completion
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: DummyModel())
+    agent = Agent([], "Test agent identity", config=Config({}))
+    async def cached_response(messages, **kwargs):
+        return Completion("Hi", {"prompt_tokens": 120, "completion_tokens": 2, "cached_tokens": 100})
+    agent.model.chat_completion = cached_response
+    assert asyncio.run(agent.chat_completion("hello")) == "Hi"
+    assert agent.turn_stats[-1]["prompt_tokens"] == 120
+    assert agent.turn_stats[-1]["cached_prompt_tokens"] == 100
+
+def test_agent_runs_batched_tool_calls_concurrently(monkeypatch):
+    import time
+    def slow_upper(arg):
+        time.sleep(0.2)
+        return arg.upper()
+    async def slow_lower(arg):
+        await asyncio.sleep(0.2)
+        return arg.lower()
+    async def hang():
+        await asyncio.sleep(10)
+    tools = [
+        Tool("Upper", slow_upper, "Uppercases input"),
+        Tool("Lower", slow_lower, "Lowercases input"),
+        Tool("Hang", hang, "Never finishes", timeout=0.1),
+    ]
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: DummyModel())
+    agent = Agent(tools, "Test agent identity", config=Config({}))
+    async def batch_response(messages, **kwargs):
+        return "Upper(a)\nLower(B)\nHang()\nUpper(c)"
+    agent.model.chat_completion = batch_response
+    start = time.perf_counter()
+    result = asyncio.run(agent.chat_completion("do several things"))
+    assert time.perf_counter() - start < 0.6
+    assert result.splitlines() == ["A", "b", "Tool Hang timed out after 0.1 seconds.", "C"]
+
+def test_multiline_argument_is_still_a_single_call(monkeypatch):
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: DummyModel())
+    agent = Agent([Tool("Echo", dummy_tool_func, "Echoes input")], "Test agent identity", config=Config({}))
+    assert agent._parse_tool_calls("Echo(line one\nline two)") == [("Echo", "line one\nline two")]
+
+class DeadlineModel(DummyModel):
+    async def chat_completion(self, messages, deadline=None, **kwargs):
+        self.deadline = deadline
+        raise DeadlineExceeded("The request ran past its deadline")
+
+def test_turn_timeout_is_reported_without_updating_memory(monkeypatch):
+    model = DeadlineModel()
+    monkeypatch.setattr("src.agent.ModelInterface", lambda config: model)
+    agent = Agent([], "Test agent identity", config=Config({}))
+    agent._turn_timeout = 5
+
+    start = time.monotonic()
+    result = asyncio.run(agent.chat_completion("hello"))
+    assert result == "The model did not respond within 5 seconds."
+    assert start < model.deadline <= time.monotonic() + 5
+    assert agent.short_memory == []
+
+class RecordingDummyModel(DummyModel):
+    def __init__(self):
+        self.calls = []
+
+    async def chat_completion(self, messages, **kwargs):
+        self.calls.append(kwargs)
+        return "Hello, world!"
+
+def test_calls_use_per_type_output_budgets(monkeypatch):
+    model = RecordingDummyModel()
+    config = Config({
+        "RESPONSE_MAX_TOKENS": 300,
+        "RESPONSE_STOP": ["\nUser:"],
+        "COMPACTION_CHUNK_TOKENS": 64,
+        "SUMMARY_MODEL": "small",
+        "DISABLE_LONG_MEMORY": False,
+        "SHORT_MEMORY_SIZE": 2,
+    })
+    agent = Agent([], "Test agent identity", model=model, config=config)
+
+    async def scenario():
+        await agent.chat_completion("first")
+        await agent.chat_completion("second")
+        await agent.flush_memory()
+    asyncio.run(scenario())
+    response, _, summary = model.calls
+    assert response == {"max_tokens": 300, "stop": ["\nUser:"]}
+    assert summary == {"deterministic": True, "max_tokens": 64, "model": "small"}
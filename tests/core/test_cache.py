@@ -0,0 +1,99 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import asyncio
+import io
+from src.cache import ResponseCache, cache_key
+from src.model import ModelInterface
+from src.servers import PROVIDERS
+from src.servers.common import Completion
+
+MESSAGES = [{"role": "user", "content": "What is  the capital of France?"}]
+
+def test_cache_key_normalizes_whitespace():
+    spaced = [{"role": "user", "content": " What is the capital\nof France? "}]
+    assert cache_key("ollama", "m", 0, MESSAGES) == cache_key("ollama", "m", 0, spaced)
+    assert cache_key("ollama", "m", 0, MESSAGES) != cache_key("ollama", "other", 0, MESSAGES)
+
+def test_cache_key_separates_generation_options():
+    # keys without options are unchanged, so existing disk entries still hit
+    assert cache_key("ollama", "m", 0, MESSAGES, {}) == cache_key("ollama", "m", 0, MESSAGES)
+    assert cache_key("ollama", "m", 0, MESSAGES, {"max_tokens": 8}) != cache_key("ollama", "m", 0, MESSAGES)
+    assert cache_key("ollama", "m", 0, MESSAGES, {"max_tokens": 8, "stop": ["x"]}) == \
+        cache_key("ollama", "m", 0, MESSAGES, {"stop": ["x"], "max_tokens": 8})
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats["evictions"] == 1
+    assert cache.stats["misses"] == 1
+
+def test_expired_entries_are_dropped():
+    cache = ResponseCache(ttl=-1)
+    cache.put("a", "1")
+    assert cache.get("a") is None
+    assert cache.stats["expirations"] == 1
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(path=path)
+    cache.put("a", "Paris")
+    cache.close()
+    restarted = ResponseCache(path=path)
+    assert restarted.get("a") == "Paris"
+    assert restarted.stats["disk_hits"] == 1
+    restarted.close()
+
+def test_disk_writes_are_batched_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(max_entries=1, path=path, max_disk_entries=3)
+    for i in range(5):
+        cache.put(str(i), f"response {i}")
+    cache.close()
+
+    restarted = ResponseCache(path=path)
+    # read on a worker thread, then served from memory
+    assert asyncio.run(restarted.aget("4")) == "response 4"
+    assert asyncio.run(restarted.aget("4")) == "response 4"
+    # the two oldest rows were trimmed to the disk bound
+    assert asyncio.run(restarted.aget("0")) is None
+    assert restarted.stats == {**restarted.stats, "hits": 2, "disk_hits": 1, "misses": 1}
+    restarted.close()
+
+class CountingClient:
+    model = "dummy-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def achat(self, messages, temperature=0.7):
+        self.calls += 1
+        return Completion("Paris")
+
+    async def aclose(self):
+        pass
+
+def test_model_interface_caches_only_reproducible_requests(monkeypatch):
+    monkeypatch.setattr("builtins.open", lambda f, mode="r": io.StringIO("MODEL_PROVIDER: ollama"))
+    client = CountingClient()
+    monkeypatch.setitem(PROVIDERS, "ollama", lambda config: client)
+    model = ModelInterface()
+
+    async def scenario():
+        for _ in range(3):
+            assert await model.chat_completion(MESSAGES, temperature=0) == "Paris"
+        for _ in range(2):
+            await model.chat_completion(MESSAGES, temperature=0.7)
+        await model.chat_completion(MESSAGES, temperature=0.7, deterministic=True)
+        await model.chat_completion(MESSAGES, temperature=0.7, deterministic=True)
+
+    asyncio.run(scenario())
+    # one miss at temperature 0, two uncached calls, one deterministic miss
+    assert client.calls == 4
+    assert model.cache_stats()["hits"] == 3
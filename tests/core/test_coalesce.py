@@ -0,0 +1,112 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import asyncio
+import pytest
+from src.model import ModelInterface
+from src.servers import PROVIDERS
+from src.servers.common import Completion
+
+MESSAGES = [{"role": "user", "content": "Hello there"}]
+
+class SlowClient:
+    def __init__(self, tokens=("Hi", " there")):
+        self.model = "test-model"
+        self.tokens = tokens
+        self.calls = 0
+        self.streams = 0
+        self.closed_streams = 0
+        self.release = None
+
+    async def achat(self, messages, temperature=0.7, **kwargs):
+        self.calls += 1
+        await self.release.wait()
+        return Completion("".join(self.tokens), {"prompt_tokens": 3, "completion_tokens": 2})
+
+    async def streaming_chat(self, messages, temperature=0.7, **kwargs):
+        self.streams += 1
+        try:
+            for token in self.tokens:
+                await self.release.wait()
+                yield token
+        finally:
+            self.closed_streams += 1
+
+    async def aclose(self):
+        pass
+
+def make_model(monkeypatch, client, **settings):
+    monkeypatch.setitem(PROVIDERS, "ollama", lambda config: client)
+    return ModelInterface({"MODEL_PROVIDER": "ollama", "CACHE_ENABLED": False, **settings})
+
+def test_identical_requests_in_flight_share_one_generation(monkeypatch):
+    client = SlowClient()
+    model = make_model(monkeypatch, client)
+
+    async def scenario():
+        client.release = asyncio.Event()
+        calls = [asyncio.ensure_future(model.chat_completion(MESSAGES)) for _ in range(3)]
+        other = asyncio.ensure_future(model.chat_completion(MESSAGES, temperature=0.2))
+        await asyncio.sleep(0.01)
+        client.release.set()
+        return await asyncio.gather(*calls), await other
+
+    replies, other = asyncio.run(scenario())
+    assert replies == ["Hi there"] * 3 and other == "Hi there"
+    # a different temperature is a different request
+    assert client.calls == 2
+    assert model.coalesce_stats() == {"leaders": 2, "attached": 2}
+
+def test_cancelled_leader_does_not_cancel_attached_callers(monkeypatch):
+    client = SlowClient()
+    model = make_model(monkeypatch, client)
+
+    async def scenario():
+        client.release = asyncio.Event()
+        leader = asyncio.ensure_future(model.chat_completion(MESSAGES))
+        follower = asyncio.ensure_future(model.chat_completion(MESSAGES))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        client.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == "Hi there"
+    assert client.calls == 1
+
+def test_streams_are_broadcast_to_attached_callers(monkeypatch):
+    client = SlowClient()
+    model = make_model(monkeypatch, client)
+
+    async def collect(stream):
+        return [token async for token in stream]
+
+    async def scenario():
+        client.release = asyncio.Event()
+        first = asyncio.ensure_future(collect(model.stream_completion(MESSAGES)))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(collect(model.stream_completion(MESSAGES)))
+        client.release.set()
+        return await asyncio.gather(first, second)
+
+    first, second = asyncio.run(scenario())
+    # the late subscriber replays the tokens it missed
+    assert first == second == ["Hi", " there"]
+    assert client.streams == 1 and client.closed_streams == 1
+    assert model.coalesce_stats() == {"leaders": 1, "attached": 1}
+
+def test_coalescing_can_be_disabled(monkeypatch):
+    client = SlowClient()
+    model = make_model(monkeypatch, client, COALESCE_REQUESTS=False)
+
+    async def scenario():
+        client.release = asyncio.Event()
+        client.release.set()
+        return await asyncio.gather(*(model.chat_completion(MESSAGES) for _ in range(2)))
+
+    assert asyncio.run(scenario()) == ["Hi there"] * 2
+    assert client.calls == 2
+    assert model.coalesce_stats() == {}
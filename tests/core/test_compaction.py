@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import asyncio
+from src.compaction import MemoryCompactor
+from src.tokens import load_token_counter
+
+class Summarizer:
+    """Stands in for the model, recording each prompt it is sent."""
+    def __init__(self):
+        self.prompts = []
+
+    async def __call__(self, prompt):
+        self.prompts.append(prompt[0]["content"])
+        return f"s{len(self.prompts)}"
+
+def make_compactor(max_tokens=1000, fanout=3):
+    summarizer = Summarizer()
+    compactor = MemoryCompactor(summarizer, load_token_counter("estimate"), max_tokens, chunk_tokens=16, fanout=fanout)
+    return compactor, summarizer
+
+def add_chunks(compactor, count):
+    async def run():
+        for i in range(count):
+            await compactor.add([{"role": "user", "content": f"message {i}"}])
+            await compactor.roll_up()
+    asyncio.run(run())
+
+def test_chunks_summarize_only_their_own_messages():
+    compactor, summarizer = make_compactor()
+    add_chunks(compactor, 2)
+    assert "message 0" in summarizer.prompts[0]
+    assert "message 0" not in summarizer.prompts[1] and "s1" not in summarizer.prompts[1]
+    assert compactor.render() == "s1\ns2"
+
+def test_full_levels_roll_up_like_a_tree():
+    compactor, summarizer = make_compactor(fanout=3)
+    add_chunks(compactor, 9)
+    # 9 chunks -> 3 level 1 summaries -> 1 level 2 summary
+    assert compactor.summary_stats() == {"levels": [0, 0, 1], "chunks": 9, "rollups": 4}
+    # a roll-up reads only the summaries it combines
+    assert summarizer.prompts[-1].count("Part ") == 3
+
+def test_budget_rolls_oldest_summaries_together():
+    compactor, _ = make_compactor(max_tokens=1, fanout=10)
+    add_chunks(compactor, 4)
+    assert sum(compactor.summary_stats()["levels"]) == 1
+    assert compactor.token_counter.count(compactor.render()) <= 1
+
+def test_load_starts_from_a_flat_summary():
+    compactor, _ = make_compactor()
+    compactor.load(None, "old summary")
+    assert compactor.render() == "old summary"
+    compactor.load([["a"], ["b"]])
+    assert compactor.render() == "b\na"
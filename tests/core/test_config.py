@@ -0,0 +1,33 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import io
+import pytest
+from src.config import Config, load_config
+from src.servers import PROVIDERS, provider_setup, register_provider
+
+def test_config_is_type_checked(monkeypatch):
+    monkeypatch.setattr("builtins.open", lambda f, mode="r": io.StringIO("MODEL_PROVIDER: ollama\nSTREAM: True\nCACHE_TTL: null"))
+    config = load_config()
+    assert config.get("STREAM") is True and config.get("CACHE_TTL", 60) is None
+    assert Config({"TURN_TIMEOUT": 2.5, "UNKNOWN_SETTING": "anything"})
+
+    with pytest.raises(ValueError, match="STREAM must be bool"):
+        Config({"STREAM": "yes"})
+    with pytest.raises(ValueError, match="TOOL_TIMEOUT must be int or float"):
+        Config({"TOOL_TIMEOUT": True})
+    with pytest.raises(ValueError, match="HTTP_POOL_SIZE"):
+        Config({"BACKENDS": [{"NAME": "a", "HTTP_POOL_SIZE": "ten"}]})
+
+def test_provider_modules_are_imported_on_first_use(monkeypatch):
+    monkeypatch.setattr("src.servers.PROVIDERS", dict(PROVIDERS))
+    monkeypatch.delitem(sys.modules, "src.servers.nexa", raising=False)
+    setup = provider_setup("Nexa")
+    assert "src.servers.nexa" in sys.modules
+    assert setup.__name__ == "setup_nexa_client"
+
+    register_provider("custom", lambda config: "client")
+    assert provider_setup("custom")({}) == "client"
+    with pytest.raises(ValueError, match="Unsupported MODEL_PROVIDER"):
+        provider_setup("unknown")
@@ -4,7 +4,11 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
 
 import pytest
 import io
+import asyncio
+import time
 from src.model import ModelInterface
+from src.servers import PROVIDERS
+from src.servers.common import Completion, DeadlineExceeded
 
 class DummyClient:
     pass
@@ -13,7 +17,7 @@ def test_model_provider_config(monkeypatch):
     config_yaml = "MODEL_PROVIDER: anythingllm"
     mock_file = io.StringIO(config_yaml)
     monkeypatch.setattr("builtins.open", lambda f, mode="r": mock_file)
-    monkeypatch.setattr("src.model.setup_anythingllm_client", lambda config: DummyClient())
+    monkeypatch.setitem(PROVIDERS, "anythingllm", lambda config: DummyClient())
     model = ModelInterface()
     assert model.model_provider == "anythingllm"
     assert isinstance(model.client, DummyClient)
@@ -22,8 +26,244 @@ def test_model_provider_config(monkeypatch):
 #     config_yaml = "MODEL_PROVIDER: anythingllm"
 #     mock_file = io.StringIO(config_yaml)
 #     monkeypatch.setattr("builtins.open", lambda f, mode="r": mock_file)
-#     monkeypatch.setattr("src.model.setup_anythingllm_client", lambda config: DummyClient())
+#     monkeypatch.setitem(PROVIDERS, "anythingllm", lambda config: DummyClient())
 #     # monkeypatch.setattr("src.model.anythingllm_chat_completion", lambda client, messages, temperature, stream: "response")
 #     model = ModelInterface()
 #     result = model.chat_completion([{"role": "user", "content": "hi"}])
 #     assert result == "response"
+
+class AsyncDummyClient:
+    async def achat(self, messages, temperature=0.7):
+        return f"async reply at {temperature}"
+
+def test_model_chat_completion_is_awaitable(monkeypatch):
+    config_yaml = "MODEL_PROVIDER: ollama"
+    mock_file = io.StringIO(config_yaml)
+    monkeypatch.setattr("builtins.open", lambda f, mode="r": mock_file)
+    monkeypatch.setitem(PROVIDERS, "ollama", lambda config: AsyncDummyClient())
+    model = ModelInterface()
+    result = asyncio.run(model.chat_completion([{"role": "user", "content": "hi"}], temperature=0.2))
+    assert result == "async reply at 0.2"
+
+class BackendClient:
+    def __init__(self, name, delay=0.0, fail=False):
+        self.name = name
+        self.model = "shared-model"
+        self.delay = delay
+        self.fail = fail
+        self.healthy = True
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def achat(self, messages, temperature=0.7, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise ConnectionError(f"{self.name} is down")
+            return Completion(self.name)
+        finally:
+            self.in_flight -= 1
+
+    async def ahealth_check(self):
+        return self.healthy
+
+    async def aclose(self):
+        pass
+
+def make_routed_model(monkeypatch, clients, **settings):
+    monkeypatch.setitem(PROVIDERS, "ollama", lambda config: clients[config["NAME"]])
+    config = {
+        "MODEL_PROVIDER": "ollama",
+        "CACHE_ENABLED": False,
+        "COALESCE_REQUESTS": False,
+        "BACKENDS": [{"NAME": name} for name in clients],
+        **settings,
+    }
+    return ModelInterface(config)
+
+def test_requests_route_to_the_fastest_healthy_backend_and_fail_over(monkeypatch):
+    clients = {"slow": BackendClient("slow", delay=0.05), "fast": BackendClient("fast", delay=0.0)}
+    model = make_routed_model(monkeypatch, clients)
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def scenario():
+        # both backends get a first request, then the fast one wins the rest
+        first = await asyncio.gather(model.chat_completion(messages), model.chat_completion(messages))
+        assert sorted(first) == ["fast", "slow"]
+        assert [await model.chat_completion(messages) for _ in range(3)] == ["fast"] * 3
+
+        clients["fast"].fail = True
+        assert await model.chat_completion(messages) == "slow"
+        assert not model.backends[1].healthy
+
+        clients["slow"].fail = True
+        with pytest.raises(ConnectionError):
+            await model.chat_completion(messages)
+
+        # a passing health check brings the backends back
+        clients["fast"].fail = clients["slow"].fail = False
+        await model.router.check_health()
+        assert all(backend.healthy for backend in model.backends)
+        await model.aclose()
+
+    asyncio.run(scenario())
+    stats = {backend["name"]: backend for backend in model.backend_stats()}
+    assert stats["fast"]["failures"] == 2 and stats["slow"]["failures"] == 1
+
+def test_backends_limit_requests_in_flight(monkeypatch):
+    clients = {"a": BackendClient("a", delay=0.02), "b": BackendClient("b", delay=0.02)}
+    model = make_routed_model(monkeypatch, clients, BACKEND_MAX_IN_FLIGHT=2)
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def scenario():
+        replies = await asyncio.gather(*(model.chat_completion(messages) for _ in range(10)))
+        await model.aclose()
+        return replies
+
+    replies = asyncio.run(scenario())
+    assert len(replies) == 10
+    assert clients["a"].max_in_flight == 2 and clients["b"].max_in_flight == 2
+
+def test_deadline_cancels_a_slow_request(monkeypatch):
+    clients = {"slow": BackendClient("slow", delay=1.0)}
+    model = make_routed_model(monkeypatch, clients)
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def scenario():
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await model.chat_completion(messages, deadline=start + 0.05)
+        elapsed = time.monotonic() - start
+        await model.aclose()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 0.5
+    assert clients["slow"].in_flight == 0
+    assert model.backends[0].in_flight == 0
+
+def test_stalled_request_is_hedged_to_another_backend(monkeypatch):
+    clients = {"a": BackendClient("a", delay=0.005), "b": BackendClient("b", delay=0.005)}
+    model = make_routed_model(monkeypatch, clients, HEDGE_PERCENTILE=95)
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def scenario():
+        # collect enough latencies to calibrate the hedge delay
+        for _ in range(20):
+            await model.chat_completion(messages)
+        primary = model.router._select(())
+        clients[primary.name].delay = 1.0
+        start = time.monotonic()
+        reply = await model.chat_completion(messages)
+        elapsed = time.monotonic() - start
+        await model.aclose()
+        return primary.name, reply, elapsed
+
+    primary, reply, elapsed = asyncio.run(scenario())
+    assert reply != primary
+    assert elapsed < 0.5
+    assert clients[primary].in_flight == 0
+
+def test_warm_up_loads_every_backend_and_keeps_it_warm():
+    from benchmarks.stub_server import StubModelServer
+
+    async def scenario():
+        server = StubModelServer(ttft=0.02)
+        await server.start()
+        model = ModelInterface({
+            "CACHE_ENABLED": False,
+            "KEEP_ALIVE": "30m",
+            "KEEP_WARM_INTERVAL": 0.05,
+            "BACKENDS": [
+                # Ollama loads through its native API, Nexa through a minimal chat
+                {"NAME": "ollama", "MODEL_PROVIDER": "ollama", "OLLAMA_URL": f"{server.url}/v1"},
+                {"NAME": "nexa", "MODEL_PROVIDER": "nexa", "NEXA_API_KEY": "nexa", "NEXA_URL": f"{server.url}/v1/chat/completions"},
+            ],
+        })
+        try:
+            warmup = await model.warm_up()
+            loaded = server.stats["requests"]
+            await asyncio.sleep(0.2)
+            touched = server.stats["requests"] - loaded
+        finally:
+            await model.aclose()
+            await server.aclose()
+        return warmup, loaded, touched
+
+    warmup, loaded, touched = asyncio.run(scenario())
+    assert set(warmup) == {"ollama", "nexa"}
+    assert all(seconds >= 0.02 for seconds in warmup.values())
+    assert loaded == 2
+    # idle backends are re-touched every keep-warm interval
+    assert touched >= 2
+
+def test_keep_warm_runs_without_warm_up():
+    from benchmarks.stub_server import StubModelServer
+
+    async def scenario():
+        server = StubModelServer()
+        await server.start()
+        model = ModelInterface({
+            "CACHE_ENABLED": False,
+            "KEEP_WARM_INTERVAL": 0.05,
+            "BACKENDS": [{"NAME": "ollama", "MODEL_PROVIDER": "ollama", "OLLAMA_URL": f"{server.url}/v1"}],
+        })
+        try:
+            model.keep_warm()
+            model.keep_warm()
+            await asyncio.sleep(0.2)
+            touched = server.stats["requests"]
+        finally:
+            await model.aclose()
+            await server.aclose()
+        return touched
+
+    # the backend was never warmed up, yet it is touched once idle
+    assert asyncio.run(scenario()) >= 2
+
+def test_warm_up_failures_are_reported_not_raised(monkeypatch):
+    clients = {"down": BackendClient("down", fail=True)}
+    model = make_routed_model(monkeypatch, clients)
+    assert asyncio.run(model.warm_up()) == {"down": None}
+
+class RecordingClient(BackendClient):
+    def __init__(self, name):
+        super().__init__(name)
+        self.calls = []
+
+    async def achat(self, messages, temperature=0.7, **kwargs):
+        self.calls.append(kwargs)
+        return await super().achat(messages, temperature)
+
+def test_generation_controls_reach_the_backend(monkeypatch):
+    clients = {"a": RecordingClient("a")}
+    model = make_routed_model(monkeypatch, clients, MAX_TOKENS=64)
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def scenario():
+        await model.chat_completion(messages)
+        await model.chat_completion(messages, max_tokens=8, stop=["\n"], model="small")
+        await model.warm_up()
+        await model.aclose()
+
+    asyncio.run(scenario())
+    assert clients["a"].calls == [
+        {"max_tokens": 64},
+        {"max_tokens": 8, "stop": ["\n"], "model": "small"},
+        # warm-up only needs the model loaded
+        {"max_tokens": 1},
+    ]
+
+def test_request_keys_cover_every_backend_model(monkeypatch):
+    messages = [{"role": "user", "content": "hi"}]
+    same = make_routed_model(monkeypatch, {"a": BackendClient("a"), "b": BackendClient("b")})
+    mixed_clients = {"a": BackendClient("a"), "b": BackendClient("b")}
+    mixed_clients["b"].model = "small-model"
+    mixed = make_routed_model(monkeypatch, mixed_clients)
+    single = make_routed_model(monkeypatch, {"a": BackendClient("a")})
+    # backends serving one model keep the single-model key
+    assert same._request_key(messages, 0, {}) == single._request_key(messages, 0, {})
+    # a pool mixing models never shares responses with a single-model pool
+    assert mixed._request_key(messages, 0, {}) != single._request_key(messages, 0, {})
+    assert mixed._request_key(messages, 0, {"model": "x"}) == single._request_key(messages, 0, {"model": "x"})
@@ -0,0 +1,84 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.agent import Agent
+from src.config import Config
+from src.retrieval import RetrievalMemory, tokenize
+
+class DummyModel:
+    async def chat_completion(self, messages, **kwargs):
+        return "Hello, world!"
+
+    async def aclose(self):
+        pass
+
+def make_agent(**settings):
+    config = Config({"RETRIEVAL_MEMORY": True, "SHORT_MEMORY_SIZE": 4, **settings})
+    return Agent([], "Test agent identity", model=DummyModel(), config=config)
+
+def test_tokenize_drops_case_punctuation_and_stopwords():
+    assert tokenize("What is the Deploy-Key for db2?") == ["deploy", "key", "db2"]
+
+def test_search_ranks_matching_turns_first():
+    memory = RetrievalMemory()
+    memory.add("How do I rotate the deploy key?", "Run the rotate script.", 10)
+    memory.add("What's for lunch?", "Pizza.", 10)
+    memory.add("Where is the deploy log?", "In /var/log/deploy.", 10)
+    results = memory.search("rotate deploy key", k=2)
+    assert [turn.id for _, turn in results] == [0, 2]
+    assert results[0][0] > results[1][0]
+
+def test_search_skips_excluded_and_unrelated_turns():
+    memory = RetrievalMemory()
+    memory.add("billing export", "done", 10)
+    memory.add("billing report", "pending", 10)
+    memory.add("weather", "sunny", 10)
+    assert [turn.id for _, turn in memory.search("billing", k=5, exclude={0})] == [1]
+    assert memory.search("nothing matches", k=5) == []
+
+def test_max_turns_drops_oldest_from_index():
+    memory = RetrievalMemory(max_turns=2)
+    memory.add("alpha", "one", 10)
+    memory.add("beta", "two", 10)
+    memory.add("gamma", "three", 10)
+    assert len(memory) == 2
+    assert memory.search("alpha", k=1) == []
+    assert "alpha" not in memory._postings
+
+def test_prompt_includes_relevant_evicted_turn():
+    agent = make_agent()
+    agent._handle_memory("My locker code is 4821.", "Noted, locker code 4821.")
+    for i in range(4):
+        agent._handle_memory(f"Filler question {i}", f"Filler answer {i}")
+    # the locker turn has left short-term memory but is still retrievable
+    assert all("locker" not in message["content"] for message in agent.short_memory)
+    messages = agent._build_prompt("What was my locker code?")
+    contents = [message["content"] for message in messages]
+    relevant = [content for content in contents if content.startswith("Relevant Earlier Interactions:")]
+    assert relevant and "4821" in relevant[0]
+    # goes before the recent history in the legacy layout
+    assert contents.index(relevant[0]) < contents.index("Recent Interactions:")
+
+def test_prompt_skips_turns_already_in_history():
+    agent = make_agent()
+    agent._handle_memory("My locker code is 4821.", "Noted.")
+    messages = agent._build_prompt("What was my locker code?")
+    assert not any(message["content"].startswith("Relevant Earlier") for message in messages)
+
+def test_prefix_cache_layout_puts_relevant_turns_after_history():
+    agent = make_agent(PROMPT_LAYOUT="prefix_cache", SHORT_MEMORY_SIZE=2)
+    agent._handle_memory("My locker code is 4821.", "Noted.")
+    agent._handle_memory("Filler question", "Filler answer")
+    agent._handle_memory("Another filler", "Another answer")
+    messages = agent._build_prompt("locker code?")
+    assert messages[-2]["content"].startswith("Relevant Earlier Interactions:")
+    assert messages[-1] == {"role": "user", "content": "locker code?"}
+
+def test_retrieval_budget_limits_turns():
+    agent = make_agent(RETRIEVAL_TOKENS=1)
+    agent._handle_memory("locker code 4821", "noted")
+    for i in range(4):
+        agent._handle_memory(f"filler {i}", f"answer {i}")
+    messages = agent._build_prompt("locker code?")
+    assert not any(message["content"].startswith("Relevant Earlier") for message in messages)
@@ -0,0 +1,118 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import asyncio
+import httpx
+import json
+import pytest
+from src.servers.nexa import NexaClient
+from src.servers.anythingllm import AnythingLLMClient
+
+def sse_transport(lines):
+    body = "".join(f"{line}\n\n" for line in lines).encode()
+    return httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+
+async def collect(stream):
+    return [token async for token in stream]
+
+def test_nexa_streaming_chat_yields_deltas():
+    client = NexaClient({"NEXA_URL": "http://nexa.test/v1/chat/completions", "NEXA_API_KEY": "nexa"})
+    client.async_client = httpx.AsyncClient(transport=sse_transport([
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+        'data: {"choices": [{"delta": {"content": "Hi"}}]}',
+        'data: {"choices": [{"delta": {"content": " there"}}]}',
+        'data: [DONE]',
+    ]))
+    tokens = asyncio.run(collect(client.streaming_chat([{"role": "user", "content": "hello"}])))
+    assert tokens == ["Hi", " there"]
+
+def test_anythingllm_streaming_chat_stops_on_close():
+    client = AnythingLLMClient({"ANYTHINGLLM_API_KEY": "key", "ANYTHINGLLM_URL": "http://allm.test/api/v1"})
+    client.async_client = httpx.AsyncClient(transport=sse_transport([
+        'data: {"textResponse": "Hello", "close": false}',
+        'data: {"textResponse": "!", "close": true}',
+        'data: {"textResponse": "ignored", "close": false}',
+    ]))
+    tokens = asyncio.run(collect(client.streaming_chat([{"role": "user", "content": "hello"}])))
+    assert tokens == ["Hello", "!"]
+
+def test_nexa_aclose_releases_both_pools():
+    client = NexaClient({"NEXA_URL": "http://nexa.test/v1/chat/completions", "NEXA_API_KEY": "nexa"})
+    asyncio.run(client.aclose())
+    assert client.http_client.is_closed and client.async_client.is_closed
+
+def test_achat_retries_reset_connections():
+    attempts = []
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("connection reset", request=request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "pong"}}]})
+    config = {"NEXA_URL": "http://nexa.test/v1/chat/completions", "NEXA_API_KEY": "nexa",
+              "HTTP_MAX_RETRIES": 2, "HTTP_RETRY_BACKOFF": 0}
+    client = NexaClient(config)
+    client.async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    reply = asyncio.run(client.achat([{"role": "user", "content": "ping"}]))
+    assert reply == "pong"
+    assert len(attempts) == 3
+
+def test_chat_gives_up_after_max_retries():
+    def handler(request):
+        raise httpx.ConnectError("connection reset", request=request)
+    config = {"NEXA_URL": "http://nexa.test/v1/chat/completions", "NEXA_API_KEY": "nexa",
+              "HTTP_MAX_RETRIES": 1, "HTTP_RETRY_BACKOFF": 0}
+    client = NexaClient(config)
+    client.http_client = httpx.Client(transport=httpx.MockTransport(handler))
+    assert client.chat([{"role": "user", "content": "ping"}]).startswith("Chat request failed")
+
+def test_streaming_error_status_raises_and_health_check_reports_it():
+    def handler(request):
+        if request.url.path.endswith("/models"):
+            return httpx.Response(503)
+        return httpx.Response(500, json={"error": {"message": "model crashed"}})
+    client = NexaClient({"NEXA_URL": "http://nexa.test/v1/chat/completions", "NEXA_API_KEY": "nexa"})
+    client.async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(collect(client.streaming_chat([{"role": "user", "content": "hello"}])))
+    assert asyncio.run(client.ahealth_check()) is False
+
+def test_error_status_is_a_failed_reply_not_a_parse_error():
+    def handler(request):
+        return httpx.Response(500, json={"error": {"message": "model crashed"}})
+    clients = [
+        NexaClient({"NEXA_URL": "http://nexa.test/v1/chat/completions", "NEXA_API_KEY": "nexa"}),
+        AnythingLLMClient({"ANYTHINGLLM_API_KEY": "key", "ANYTHINGLLM_URL": "http://allm.test/api/v1"}),
+    ]
+    for client in clients:
+        client.http_client = httpx.Client(transport=httpx.MockTransport(handler))
+        client.async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        for reply in (client.chat([{"role": "user", "content": "ping"}]),
+                      asyncio.run(client.achat([{"role": "user", "content": "ping"}]))):
+            assert reply.startswith("Chat request failed") and "500" in reply
+
+def test_nexa_sends_generation_controls_only_when_set():
+    bodies = []
+    def handler(request):
+        bodies.append(json.loads(request.content))
+        return httpx.Response(200, json={"choices": [{"message": {"content": "pong"}}]})
+    client = NexaClient({"NEXA_URL": "http://nexa.test/v1/chat/completions", "NEXA_API_KEY": "nexa", "NEXA_MODEL": "base"})
+    client.async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    messages = [{"role": "user", "content": "ping"}]
+    asyncio.run(client.achat(messages))
+    asyncio.run(client.achat(messages, max_tokens=20, stop=["\n"], model="small"))
+    assert "max_tokens" not in bodies[0] and "stop" not in bodies[0]
+    assert bodies[0]["model"] == "base"
+    assert (bodies[1]["max_tokens"], bodies[1]["stop"], bodies[1]["model"]) == (20, ["\n"], "small")
+
+def test_anythingllm_model_override_selects_workspace():
+    urls = []
+    def handler(request):
+        urls.append(str(request.url))
+        return httpx.Response(200, json={"textResponse": "pong"})
+    client = AnythingLLMClient({"ANYTHINGLLM_API_KEY": "key", "ANYTHINGLLM_URL": "http://allm.test/api/v1",
+                                "ANYTHINGLLM_WORKSPACE": "main"})
+    client.async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    asyncio.run(client.achat([{"role": "user", "content": "ping"}], max_tokens=20))
+    asyncio.run(client.achat([{"role": "user", "content": "ping"}], model="fast"))
+    assert urls == ["http://allm.test/api/v1/workspace/main/chat", "http://allm.test/api/v1/workspace/fast/chat"]
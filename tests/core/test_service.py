@@ -0,0 +1,195 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import asyncio
+import base64
+import json
+import threading
+import httpx
+import pytest
+from src.agent import Agent
+from src.config import Config
+from src.service import AgentServer, HTTPError, SessionManager, encode_frame, read_frame
+from src.session_store import SessionStore
+
+class EchoModel:
+    def __init__(self):
+        self.calls = 0
+
+    async def chat_completion(self, messages, **kwargs):
+        self.calls += 1
+        return f"echo {messages[-1]['content']}"
+
+    async def stream_completion(self, messages, **kwargs):
+        for token in ["echo ", messages[-1]["content"]]:
+            yield token
+
+def make_manager(model, directory, **kwargs):
+    def create_agent(session_id):
+        transcript = os.path.join(directory, f"test_transcript_{session_id}.txt")
+        return Agent([], "Test agent identity", model=model, transcript_file=transcript, config=Config({}))
+    return SessionManager(create_agent, **kwargs)
+
+def test_sessions_share_one_model_but_keep_separate_memory(tmp_path):
+    model = EchoModel()
+
+    async def scenario():
+        server = AgentServer(make_manager(model, tmp_path), port=0)
+        await server.start()
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.port}") as client:
+                first = (await client.post("/sessions")).json()["session_id"]
+                second = (await client.post("/sessions")).json()["session_id"]
+                replies = await asyncio.gather(
+                    client.post(f"/sessions/{first}/chat", json={"message": "one"}),
+                    client.post(f"/sessions/{second}/chat", json={"message": "two"}),
+                )
+                assert [reply.json()["response"] for reply in replies] == ["echo one", "echo two"]
+                assert (await client.post("/sessions/missing/chat", json={"message": "x"})).status_code == 404
+                assert (await client.post(f"/sessions/{first}/chat", json={})).status_code == 400
+                assert (await client.get("/health")).json()["sessions"] == 2
+                memories = [server.manager.get(sid).agent.short_memory for sid in (first, second)]
+                assert memories[0][0]["content"] == "one"
+                assert memories[1][0]["content"] == "two"
+                assert (await client.delete(f"/sessions/{first}")).status_code == 204
+                assert (await client.get("/health")).json()["sessions"] == 1
+        finally:
+            await server.aclose()
+
+    asyncio.run(scenario())
+    assert model.calls == 2
+
+def test_stored_sessions_can_be_reopened(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    threads = []
+
+    def create_agent(session_id):
+        threads.append(threading.current_thread())
+        transcript = os.path.join(tmp_path, f"test_transcript_{session_id}.txt")
+        return Agent([], "Test agent identity", model=EchoModel(), transcript_file=transcript,
+                     config=Config({}), session_id=session_id, session_store=store)
+
+    async def scenario():
+        server = AgentServer(SessionManager(create_agent), port=0)
+        await server.start()
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.port}") as client:
+                session_id = (await client.post("/sessions")).json()["session_id"]
+                await client.post(f"/sessions/{session_id}/chat", json={"message": "remember me"})
+                assert (await client.post("/sessions", json={"session_id": session_id})).status_code == 409
+                await client.delete(f"/sessions/{session_id}")
+
+                reopened = await client.post("/sessions", json={"session_id": session_id})
+                assert reopened.status_code == 201
+                assert reopened.json() == {"session_id": session_id, "restored_turns": 1}
+                memory = server.manager.get(session_id).agent.short_memory
+                assert [message["content"] for message in memory] == ["remember me", "echo remember me"]
+                assert (await client.post("/sessions", json={"session_id": "../escape"})).status_code == 400
+        finally:
+            await server.aclose()
+
+    asyncio.run(scenario())
+    store.close()
+    # agents are built, and sessions restored, off the event loop's thread
+    assert threading.main_thread() not in threads
+
+class SlowModel(EchoModel):
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+
+    async def chat_completion(self, messages, **kwargs):
+        await self.release.wait()
+        return await super().chat_completion(messages, **kwargs)
+
+def test_close_waits_for_turns_in_flight(tmp_path):
+    async def scenario():
+        model = SlowModel()
+        manager = make_manager(model, tmp_path)
+        session_id = (await manager.create()).session_id
+        turn = asyncio.create_task(manager.chat(session_id, "still running"))
+        await asyncio.sleep(0.01)
+        close = asyncio.create_task(manager.close(session_id))
+        await asyncio.sleep(0.01)
+        # the session stays open for its running turn, but takes no new ones
+        assert not close.done()
+        with pytest.raises(HTTPError) as refused:
+            await manager.chat(session_id, "too late")
+        assert refused.value.status == 409
+        model.release.set()
+        result, _ = await turn
+        await close
+        return result, manager.sessions
+
+    result, sessions = asyncio.run(scenario())
+    assert result == "echo still running"
+    assert sessions == {}
+
+def test_malformed_content_length_is_a_bad_request(tmp_path):
+    async def scenario():
+        server = AgentServer(make_manager(EchoModel(), tmp_path), port=0)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(b"POST /sessions HTTP/1.1\r\nHost: test\r\nContent-Length: ten\r\n\r\n")
+            status = await reader.readline()
+            writer.close()
+            return status
+        finally:
+            await server.aclose()
+
+    assert asyncio.run(scenario()).startswith(b"HTTP/1.1 400")
+
+def test_idle_sessions_are_evicted(tmp_path):
+    async def evict():
+        manager = make_manager(EchoModel(), tmp_path, idle_timeout=0)
+        session = await manager.create()
+        await manager.chat(session.session_id, "hi")
+        manager.start()
+        await asyncio.sleep(1.1)
+        remaining = dict(manager.sessions)
+        await manager.aclose()
+        return remaining
+
+    assert asyncio.run(evict()) == {}
+
+def test_websocket_streams_tokens(tmp_path):
+    async def scenario():
+        model = EchoModel()
+        manager = make_manager(model, tmp_path)
+        server = AgentServer(manager, port=0)
+        await server.start()
+        try:
+            session_id = (await manager.create()).session_id
+            manager.get(session_id).agent._stream = True
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            key = base64.b64encode(os.urandom(16)).decode()
+            writer.write((
+                f"GET /sessions/{session_id}/ws HTTP/1.1\r\nHost: test\r\n"
+                f"Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n\r\n"
+            ).encode())
+            assert b"101" in await reader.readline()
+            await reader.readuntil(b"\r\n\r\n")
+            # clients must mask their frames
+            payload = b"hello"
+            mask = b"\x01\x02\x03\x04"
+            masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+            writer.write(bytes([0x81, 0x80 | len(payload)]) + mask + masked)
+            frames = []
+            while not frames or frames[-1]["type"] != "response":
+                _, data = await read_frame(reader, writer)
+                frames.append(json.loads(data))
+            writer.write(bytes([0x88, 0x80]) + mask)
+            writer.close()
+            return frames
+        finally:
+            await server.aclose()
+
+    frames = asyncio.run(scenario())
+    assert "".join(frame["text"] for frame in frames if frame["type"] == "token") == "echo hello"
+    assert frames[-1]["text"] == "echo hello"
+
+def test_encode_frame_uses_extended_lengths():
+    assert encode_frame("x" * 10)[:2] == bytes([0x81, 10])
+    assert encode_frame("x" * 300)[1] == 126
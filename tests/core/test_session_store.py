@@ -0,0 +1,123 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import asyncio
+import sqlite3
+import pytest
+from src.agent import Agent
+from src.config import Config
+from src.servers.common import Completion
+from src.session_store import MEMORY, TURN, SessionStore
+
+class DummyModel:
+    def __init__(self):
+        self.calls = 0
+
+    async def chat_completion(self, messages, **kwargs):
+        self.calls += 1
+        return Completion("Summary of earlier turns.")
+
+    async def aclose(self):
+        pass
+
+def make_agent(store, model=None, **settings):
+    config = Config({"SHORT_MEMORY_SIZE": 4, "SESSION_SNAPSHOT_INTERVAL": 3, **settings})
+    return Agent([], "Test agent identity", model=model or DummyModel(), config=config,
+                 session_id="s1", session_store=store)
+
+def test_store_snapshot_replaces_superseded_memory_events(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    store.append("s1", TURN, {"user": "a", "assistant": "b"})
+    store.append("s1", MEMORY, {"long_memory": "old"})
+    store.snapshot("s1", {"state": 1})
+    store.append("s1", TURN, {"user": "c", "assistant": "d"})
+    state, events = store.load("s1")
+    assert state == {"state": 1}
+    assert events == [(TURN, {"user": "c", "assistant": "d"})]
+    # turns stay in the log, memory updates before the snapshot are gone
+    assert [turn["user"] for turn in store.turns("s1")] == ["a", "c"]
+    assert store.load("other") == (None, [])
+    store.close()
+
+def test_failed_writes_are_raised_on_flush_without_stopping_the_writer(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    store.append("s1", TURN, {"user": "a", "assistant": "b"})
+    # a sequence number already in the log fails its insert
+    store._next_seq["s1"] = 0
+    store.append("s1", TURN, {"user": "duplicate", "assistant": "row"})
+    store.append("s1", TURN, {"user": "c", "assistant": "d"})
+    with pytest.raises(sqlite3.IntegrityError):
+        store.flush()
+    # only the bad row is lost, and the writer keeps committing
+    store.append("s1", TURN, {"user": "e", "assistant": "f"})
+    assert [turn["user"] for turn in store.turns("s1")] == ["a", "c", "e"]
+    store.close()
+
+def test_session_restores_memory_without_model_calls(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path)
+    agent = make_agent(store)
+    for i in range(5):
+        agent._handle_memory(f"question {i}", f"answer {i}")
+    agent.long_memory = "Summary so far."
+    store.close()
+
+    # a new process: a fresh store on the same file
+    model = DummyModel()
+    restored = make_agent(SessionStore(path), model=model)
+    assert restored.restored_turns == 5
+    assert restored.short_memory == agent.short_memory
+    assert restored._short_memory_tokens == agent._short_memory_tokens
+    # one snapshot after 3 turns, then 2 turns replayed from the log
+    assert restored._turns_since_snapshot == 2
+    assert model.calls == 0
+
+def test_long_memory_updates_and_flush_snapshot_are_restored(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path)
+    agent = make_agent(store, DISABLE_LONG_MEMORY=False)
+
+    async def run_turns():
+        for i in range(4):
+            agent._handle_memory(f"question {i}", f"answer {i}")
+        await agent.flush_memory()
+    asyncio.run(run_turns())
+    assert agent.long_memory == "Summary of earlier turns."
+    store.close()
+
+    restored = make_agent(SessionStore(path), DISABLE_LONG_MEMORY=False)
+    assert restored.long_memory == "Summary of earlier turns."
+    assert restored.short_memory == agent.short_memory
+    assert restored._turns_since_snapshot == 0
+
+def test_restore_reindexes_retrieval_memory(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path)
+    agent = make_agent(store, RETRIEVAL_MEMORY=True)
+    agent._handle_memory("My locker code is 4821.", "Noted.")
+    for i in range(4):
+        agent._handle_memory(f"filler {i}", f"answer {i}")
+    store.close()
+
+    restored = make_agent(SessionStore(path), RETRIEVAL_MEMORY=True)
+    assert len(restored.retrieval_memory) == 5
+    assert restored._build_prompt("locker code?") == agent._build_prompt("locker code?")
+
+def test_load_transcript_replays_interactions(tmp_path):
+    transcript = str(tmp_path / "transcript.txt")
+    writer_agent = Agent([], "Test agent identity", model=DummyModel(), transcript_file=transcript,
+                         config=Config({}))
+    writer_agent.start_transcript()
+    writer_agent.log_interaction("first question", "first answer\n\nwith a blank line")
+    writer_agent.log_interaction("second question", "second answer")
+    writer_agent.end_transcript()
+
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    agent = make_agent(store)
+    assert agent.load_transcript(transcript) == 2
+    assert [message["content"] for message in agent.short_memory] == [
+        "first question", "first answer\n\nwith a blank line", "second question", "second answer"
+    ]
+    assert len(store.turns("s1")) == 2
+    store.close()
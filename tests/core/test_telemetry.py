@@ -0,0 +1,103 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import asyncio
+import json
+import httpx
+import pytest
+from src.agent import Agent
+from src.config import Config
+from src.service import AgentServer, SessionManager
+from src.telemetry import NOOP_SPAN, NoopTracer, Tracer, load_tracer, set_tracer
+from src.tools import Tool
+
+class ToolCallingModel:
+    async def chat_completion(self, messages, **kwargs):
+        return "Echo(hi)\nFail()"
+
+    async def aclose(self):
+        pass
+
+def echo(arg=""):
+    return f"Echo: {arg}"
+
+def fail():
+    raise RuntimeError("broken")
+
+@pytest.fixture
+def tracer(tmp_path):
+    tracer = Tracer(os.path.join(tmp_path, "trace.jsonl"))
+    set_tracer(tracer)
+    yield tracer
+    tracer.close()
+    set_tracer(NoopTracer())
+
+def test_turn_spans_are_nested_and_exported(tracer, tmp_path):
+    tools = [Tool("Echo", echo, "Echoes input", mode="inline"), Tool("Fail", fail, "Always fails")]
+    agent = Agent(tools, "Test agent identity", model=ToolCallingModel(), config=Config({}))
+
+    result = asyncio.run(agent.chat_completion("hello"))
+    assert result == "Echo: hi\nTool Fail failed. Error: broken"
+    tracer.close()
+
+    with open(os.path.join(tmp_path, "trace.jsonl")) as f:
+        spans = {span["span_id"]: span for span in map(json.loads, f)}
+    by_name = {}
+    for span in spans.values():
+        by_name.setdefault(span["name"], []).append(span)
+    turn = by_name["agent.turn"][0]
+    assert turn["parent_id"] is None and turn["attributes"]["tool_calls"] == 2
+    for name in ("agent.build_prompt", "agent.tools", "agent.memory"):
+        assert by_name[name][0]["parent_id"] == turn["span_id"]
+    tool_spans = by_name["tool.run"]
+    assert {span["attributes"]["tool"] for span in tool_spans} == {"Echo", "Fail"}
+    assert all(spans[span["parent_id"]]["name"] == "agent.tools" for span in tool_spans)
+    assert [span["error"] for span in tool_spans if span["attributes"]["tool"] == "Fail"] == ["RuntimeError: broken"]
+
+    metrics = tracer.render_prometheus()
+    assert 'local_agent_span_duration_seconds_count{span="agent.turn"} 1' in metrics
+    assert 'local_agent_span_duration_seconds_count{span="tool.run"} 2' in metrics
+    assert 'local_agent_span_errors_total{span="tool.run"} 1' in metrics
+
+def test_usage_and_counters_render_as_prometheus():
+    tracer = Tracer()
+    tracer.record_usage({"prompt_tokens": 12, "completion_tokens": 5, "cached_tokens": 8})
+    tracer.record_usage({"prompt_tokens": 3})
+    tracer.count("response_cache_requests_total", result="hit")
+    metrics = tracer.render_prometheus()
+    assert 'local_agent_tokens_total{kind="prompt"} 15' in metrics
+    assert 'local_agent_tokens_total{kind="completion"} 5' in metrics
+    assert 'local_agent_tokens_total{kind="cached"} 8' in metrics
+    assert 'local_agent_response_cache_requests_total{result="hit"} 1' in metrics
+
+def test_noop_tracer_records_nothing():
+    tracer = load_tracer({"TELEMETRY": "none"})
+    assert tracer.span("agent.turn", stream=False) is NOOP_SPAN
+    with tracer.span("agent.turn") as span:
+        span.set(tool_calls=1)
+    assert tracer.render_prometheus() == ""
+    with pytest.raises(ValueError):
+        load_tracer({"TELEMETRY": "statsd"})
+
+def test_metrics_endpoint(tracer, tmp_path):
+    def create_agent(session_id):
+        transcript = os.path.join(tmp_path, f"test_transcript_{session_id}.txt")
+        return Agent([Tool("Echo", echo, "Echoes input")], "Test agent identity", model=ToolCallingModel(), transcript_file=transcript, config=Config({}))
+
+    async def scenario():
+        server = AgentServer(SessionManager(create_agent), port=0)
+        await server.start()
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.port}") as client:
+                session_id = (await client.post("/sessions")).json()["session_id"]
+                await client.post(f"/sessions/{session_id}/chat", json={"message": "hello"})
+                response = await client.get("/metrics")
+                assert response.headers["content-type"].startswith("text/plain")
+                return response.text
+        finally:
+            await server.aclose()
+
+    metrics = asyncio.run(scenario())
+    assert 'local_agent_span_duration_seconds_count{span="agent.turn"} 1' in metrics
+    assert 'local_agent_span_duration_seconds_count{span="agent.transcript"} 1' in metrics
@@ -0,0 +1,22 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import pytest
+from src.tokens import TokenCounter, load_token_counter
+
+def test_estimate_counts_and_truncates():
+    counter = load_token_counter("estimate")
+    assert counter.count("") == 0
+    assert counter.count("abcd") == 1
+    assert counter.count("abcde") == 2
+    assert counter.truncate("a" * 100, 5) == "a" * 20
+
+def test_custom_tokenizer_is_pluggable():
+    counter = TokenCounter(encode=lambda text: text.split(), decode=lambda tokens: " ".join(tokens))
+    assert counter.count("one two three") == 3
+    assert counter.truncate("one two three", 2) == "one two"
+
+def test_unknown_tokenizer_is_rejected():
+    with pytest.raises(ValueError):
+        load_token_counter("nonsense")
@@ -19,3 +19,121 @@ def test_tool_run_without_arg():
         return "Echo:"
     tool = Tool("Echo", echo, "Echoes input")
     assert tool.run("") == "Echo:"
+
+def test_tool_arun_awaits_async_and_threads_sync():
+    import asyncio
+    import threading
+    async def async_echo(arg):
+        return f"Async: {arg}"
+    def thread_name():
+        return threading.current_thread().name
+    assert asyncio.run(Tool("Echo", async_echo, "Echoes input").arun("x")) == "Async: x"
+    assert asyncio.run(Tool("Where", thread_name, "Thread name").arun("")) != threading.current_thread().name
+
+def worker_pid():
+    return os.getpid()
+
+def hang():
+    import time
+    time.sleep(30)
+
+def hog_memory():
+    import time
+    hog = bytearray(256 * 1024 * 1024)
+    time.sleep(30)
+    return len(hog)
+
+def test_process_tools_run_in_a_reusable_sandbox():
+    import asyncio
+    from src.sandbox import WorkerPool
+    pool = WorkerPool(size=1, memory_limit_mb=128)
+
+    async def scenario():
+        first = await pool.run(worker_pid, "")
+        assert first != os.getpid()
+        # a hung call is killed at its timeout and the worker replaced
+        try:
+            await pool.run(hang, "", timeout=0.5)
+            assert False, "expected a timeout"
+        except TimeoutError:
+            pass
+        second = await pool.run(worker_pid, "")
+        assert second != first
+        assert await pool.run(worker_pid, "") == second
+        # a runaway call is killed once it crosses the memory limit
+        try:
+            await pool.run(hog_memory, "", timeout=10)
+            assert False, "expected a memory error"
+        except MemoryError:
+            pass
+        assert await pool.run(worker_pid, "") not in (first, second)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+def test_process_mode_rejects_async_tools():
+    import pytest
+    async def async_echo(arg):
+        return arg
+    with pytest.raises(ValueError):
+        Tool("Echo", async_echo, "Echoes input", mode="process")
+
+def test_cancelled_process_call_replaces_worker():
+    import asyncio
+    from src.sandbox import WorkerPool
+    pool = WorkerPool(size=1)
+
+    async def scenario():
+        first = await pool.run(worker_pid, "")
+        try:
+            await asyncio.wait_for(pool.run(hang, ""), 0.3)
+            assert False, "expected a timeout"
+        except asyncio.TimeoutError:
+            pass
+        assert await pool.run(worker_pid, "") != first
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+def test_tool_results_are_memoized_by_policy():
+    import asyncio
+    import pytest
+    from src.tools import tool_cache
+    calls = []
+    def lookup(arg):
+        calls.append(arg)
+        return f"Result: {arg}"
+    pure = Tool("Lookup", lookup, "Looks things up", cache="pure")
+    expiring = Tool("Expiring", lookup, "Looks things up", cache="ttl", cache_ttl=-1)
+    uncached = Tool("Uncached", lookup, "Looks things up")
+
+    async def scenario():
+        assert await pure.arun("paris") == "Result: paris"
+        assert await pure.arun('  "paris" ') == "Result: paris"
+        await expiring.arun("rome")
+        await expiring.arun("rome")
+        await uncached.arun("oslo")
+        await uncached.arun("oslo")
+        tool_cache.invalidate("Lookup")
+        await pure.arun("paris")
+
+    tool_cache.invalidate()
+    asyncio.run(scenario())
+    assert calls == ["paris", "rome", "rome", "oslo", "oslo", "paris"]
+    assert tool_cache.stats()["Lookup"]["hits"] == 1
+    assert tool_cache.stats()["Lookup"]["hit_rate"] == pytest.approx(1 / 3)
+    with pytest.raises(ValueError):
+        Tool("Bad", lookup, "Bad policy", cache="ttl")
+
+def test_resizing_the_tool_cache_evicts_down_to_the_new_bound():
+    from src.tools import ToolResultCache
+    cache = ToolResultCache(max_entries=4)
+    for arg in "abcd":
+        cache.put("Lookup", arg, arg.upper())
+    cache.resize(2)
+    assert [cache.get("Lookup", arg) for arg in "abcd"] == [None, None, "C", "D"]
+    assert cache.stats()["Lookup"]["evictions"] == 2
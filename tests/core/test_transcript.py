@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import gzip
+from src.agent import TRANSCRIPT_FOOTER, TRANSCRIPT_HEADER, Agent
+from src.config import Config
+from src.transcript import TranscriptWriter
+
+class DummyModel:
+    async def chat_completion(self, messages, **kwargs):
+        return "Hello, world!"
+
+    async def aclose(self):
+        pass
+
+def test_transcript_is_written_in_the_background_and_finished_on_close(tmp_path):
+    path = os.path.join(tmp_path, "transcript.txt")
+    agent = Agent([], "Test agent identity", model=DummyModel(), transcript_file=path, config=Config({}))
+    agent.start_transcript()
+    agent.log_interaction("hi", "hello")
+    agent.log_interaction("bye", "goodbye")
+    agent.end_transcript()
+    with open(path) as f:
+        assert f.read() == (
+            TRANSCRIPT_HEADER + "You: hi\n\nAgent: hello\n\nYou: bye\n\nAgent: goodbye\n\n" + TRANSCRIPT_FOOTER
+        )
+
+def test_empty_transcript_is_deleted_without_rereading(tmp_path):
+    path = os.path.join(tmp_path, "transcript.txt")
+    writer = TranscriptWriter(path, "header\n", "footer\n")
+    assert os.path.exists(path)
+    writer.close()
+    assert not os.path.exists(path)
+
+    # a device is written to but never deleted or rotated
+    writer = TranscriptWriter(os.devnull, "header\n", "footer\n", rotate_bytes=1)
+    writer.write("entry\n")
+    writer.close()
+    assert os.path.exists(os.devnull)
+
+def test_transcript_rotates_by_size_and_compresses(tmp_path):
+    path = os.path.join(tmp_path, "transcript.txt")
+    writer = TranscriptWriter(path, "header\n", "footer\n", rotate_bytes=24, compress=True)
+    for i in range(4):
+        writer.write(f"entry number {i} is long\n")
+    writer.close()
+
+    assert writer.rotations == 4
+    with gzip.open(os.path.join(tmp_path, "transcript.1.txt.gz"), "rt") as f:
+        assert f.read() == "header\nentry number 0 is long\nfooter\n"
+    assert not os.path.exists(os.path.join(tmp_path, "transcript.1.txt"))
+    # the last rotation left a new file without entries, which is removed on close
+    assert not os.path.exists(path)